@@ -5,12 +5,25 @@ Main Flask application file including routes and functions.
 import json
 import os
 import threading
-from flask import Flask, render_template, request, jsonify
+import multiprocessing
+from itertools import chain
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from waitress import create_server
 from backend.indexer import index_path
-from backend.search import search_index, make_full_text
-from backend.watchdog import run_watchdog
+from backend.search import (
+    search_page,
+    iter_search,
+    search_snippet,
+    spellcheck,
+    decode_cursor,
+    make_full_text
+)
+from backend.watchdog import start_watchdog, get_watchdog_status
 from backend.settings import load_settings, save_settings
+from backend.connection import init_db
+from backend.token_cache import TOKEN_CACHE
+from backend.query_cache import RESULT_CACHE, POSTING_CACHE
+from backend.engine import MEMORY_INDEX
 
 APP_FOLDER = os.path.join(os.getenv("APPDATA"), "Hirmes")
 os.makedirs(APP_FOLDER, exist_ok=True)
@@ -26,10 +39,6 @@ def index_html():
     """
 
     settings = load_settings()
-    
-    num_files_reindexed, num_files_deleted, num_files_indexed = (
-        run_watchdog(settings["watchdog_number"])
-    )
 
     return render_template('index.html', settings=settings)
 
@@ -60,9 +69,17 @@ def api_indexing():
 def api_search():
     """Route for searching database.
 
+    The optional "limit" of the request sets the page size. A page ends
+    with "next_cursor", which is sent back as "cursor" for the next page
+    ("offset" selects a window directly). With "stream": true the response
+    is NDJSON: one line with the page as soon as it is ranked, one line
+    per snippet, then one line with the spellcheck (see iter_search).
+
     Returns:
         JSON object:
-            "results": Results from search_index(query)
+            "results": Results from search_page(query, limit, offset)
+            "spellchecked": Spellchecked query
+            "next_cursor": Cursor of the next page or null
             "error": "Invalid query format.", 400
     """
 
@@ -72,11 +89,86 @@ def api_search():
     if full_text:
         query = make_full_text(query)
     try:
-        results, spellchecked = search_index(query)
-        return jsonify({"results": results, "spellchecked": spellchecked})
+        limit = data.get('limit')
+        limit = None if limit is None else max(0, int(limit))
+        offset = (decode_cursor(data['cursor']) if data.get('cursor')
+                  else max(0, int(data.get('offset', 0))))
+        if data.get('stream'):
+            events = iter_search(query, limit, offset)
+            first = next(events)
+            lines = (json.dumps(event) + "\n" for event in chain([first], events))
+            return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+        results, spellchecked, next_cursor = search_page(query, limit, offset)
+        return jsonify({"results": results, "spellchecked": spellchecked,
+                        "next_cursor": next_cursor})
     except Exception: # pylint: disable=broad-exception-caught
         return jsonify({"error": "Invalid query format."}), 400
 
+@app.route('/snippet', methods=['POST'])
+def api_snippet():
+    """Route computing the snippets of a result that came without them.
+
+    Returns:
+        JSON object:
+            "snippet": List of snippets for "path", "page_numbers" and "match_terms"
+            "error": "Not indexed.", 404
+    """
+
+    data = request.get_json(force=True)
+    snippet = search_snippet(data.get('path', ''), data.get('page_numbers', []),
+                             data.get('match_terms', []))
+    if snippet is None:
+        return jsonify({"error": "Not indexed."}), 404
+
+    return jsonify({"snippet": snippet})
+
+@app.route('/suggest', methods=['POST'])
+def api_suggest():
+    """Route for the "Did you mean" hint of a query without searching.
+
+    Runs the spellcheck regardless of the "spellcheck_mode" setting.
+
+    Returns:
+        JSON object:
+            "spellchecked": Spellchecked query
+    """
+
+    data = request.get_json(force=True)
+    query = data.get('query') or ''
+
+    return jsonify({"spellchecked": spellcheck(query).term})
+
+@app.route('/watchdog/status', methods=['GET'])
+def api_watchdog_status():
+    """Route reporting the progress of the background watchdog.
+
+    Returns:
+        JSON object:
+            "state": "idle", "running" or "stopped"
+            "job": Name of the running job or null
+            "files_done", "files_total": Progress of the running job
+            "reindexed", "deleted", "indexed": Files handled by the last jobs
+            "last_run", "next_run": ISO timestamps
+            "queued": Number of queued jobs
+            "error": Message of the last failed job or null
+    """
+
+    return jsonify(get_watchdog_status())
+
+@app.route('/stats', methods=['GET'])
+def api_stats():
+    """Route reporting cache counters.
+
+    Returns:
+        JSON object:
+            "token_cache": "size", "max_size", "hits", "misses", "evictions"
+            "result_cache", "posting_cache", "memory_index": "size", "bytes", "max_entries",
+                    "max_bytes", "hits", "misses", "hit_rate", "evictions", "expirations"
+    """
+
+    return jsonify({"token_cache": TOKEN_CACHE.stats(), "result_cache": RESULT_CACHE.stats(),
+                    "posting_cache": POSTING_CACHE.stats(), "memory_index": MEMORY_INDEX.stats()})
+
 @app.route('/shutdown', methods=["GET"])
 def shutdown():
     """Route for shutting down server.
@@ -108,4 +200,7 @@ def _run_server():
     return serv
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support() # Indexing workers in the bundled app.exe
+    init_db()
+    start_watchdog()
     server = _run_server()
@@ -0,0 +1,137 @@
+"""
+Long-lived SQLite3 connections for the index database.
+
+Every thread gets its own read connection, configured once when it is
+opened. All writes go through one shared writer connection that is guarded
+by a lock. The schema is created once, when the first connection is made
+or when init_db is called at startup. Opening a read connection only
+waits for the write lock while the schema doesn't exist yet, so searches
+on new threads aren't held up by a running indexing job.
+
+Typical usage:
+    from backend.connection import init_db, read_connection, write_connection
+
+    init_db()
+    rows = read_connection().execute(...)
+    with write_connection() as conn:
+        repeat_indexing(conn, to_index)
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from backend.database import initialise_db, bump_index_generation # pylint: disable=import-error
+from backend.token_cache import TOKEN_CACHE # pylint: disable=import-error
+from backend.terms import TERM_DICTIONARY # pylint: disable=import-error
+
+APP_FOLDER = os.path.join(os.getenv("APPDATA"), "Hirmes")
+os.makedirs(APP_FOLDER, exist_ok=True)
+
+DB_PATH = os.path.join(APP_FOLDER, "index.db")
+
+READ_PRAGMAS = """
+    PRAGMA query_only = ON;
+    PRAGMA mmap_size = 268435456; -- 256 MB
+    PRAGMA cache_size = -65536;   -- 64 MB
+    PRAGMA temp_store = MEMORY;
+"""
+
+WRITE_PRAGMAS = """
+    PRAGMA journal_mode = WAL;
+    PRAGMA synchronous = NORMAL;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA cache_size = -200000;  -- ~200 MB
+"""
+
+_local = threading.local()
+_lock = threading.RLock()
+_readers_lock = threading.Lock() # Guards _readers
+_writer = None
+_readers = []
+_epoch = 0
+
+def init_db():
+    """Opens the writer connection and creates the schema if needed.
+
+    Safe to call more than once; only the first call does any work.
+    """
+
+    with _lock:
+        _get_writer()
+
+def read_connection() -> sqlite3.Connection:
+    """Returns the read-only connection of the calling thread.
+
+    Returns:
+        sqlite3.Connection: Connection with query_only set.
+    """
+
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.epoch != _epoch:
+        epoch = _epoch
+        if _writer is None: # Once the writer exists, the schema does too
+            init_db()
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.executescript(READ_PRAGMAS)
+        with _readers_lock:
+            _readers.append(conn)
+        _local.conn = conn
+        _local.epoch = epoch
+
+    return conn
+
+@contextmanager
+def write_connection():
+    """Lends out the writer connection while holding the write lock.
+
+    Re-entrant, so code holding the writer may call functions that
+    ask for it again.
+
+    Yields:
+        sqlite3.Connection: The shared writer connection.
+    """
+
+    with _lock:
+        yield _get_writer()
+
+def close_connections():
+    """Closes every connection, e.g. at shutdown or to switch DB_PATH.
+
+    Threads open a fresh read connection the next time they need one,
+    cached token ids and the term dictionary are dropped and anything else cached from the old
+    database is marked stale.
+    """
+
+    global _writer, _epoch # pylint: disable=global-statement
+    with _lock:
+        with _readers_lock:
+            for conn in _readers:
+                conn.close()
+            _readers.clear()
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+        _epoch += 1
+        TOKEN_CACHE.clear()
+        TERM_DICTIONARY.clear()
+    bump_index_generation()
+
+def _get_writer() -> sqlite3.Connection:
+    """Returns the writer connection, opening it on first use.
+
+    Must be called while holding _lock.
+
+    Returns:
+        sqlite3.Connection: The shared writer connection.
+    """
+
+    global _writer # pylint: disable=global-statement
+    if _writer is None:
+        writer = sqlite3.connect(DB_PATH, check_same_thread=False)
+        writer.executescript(WRITE_PRAGMAS)
+        initialise_db(writer)
+        writer.commit()
+        _writer = writer # Only published once the schema exists, see read_connection
+
+    return _writer
@@ -12,17 +12,90 @@ Typical usage:
     fetch_postings_for_token(conn, token_text)
 """
 
+import os
 import json
+import threading
+from backend.packing import ( # pylint: disable=import-error
+    pack_pages,
+    unpack_pages,
+    unpack_positions,
+    unpack_text,
+    register_functions
+)
+
+SQLITE_MAX_VARIABLES = 900 # Stay below SQLite's limit of bound parameters per statement
+SCHEMA_VERSION = 3 # PRAGMA user_version of the current schema
+
+UPSERT_POSTING_SQL = """
+    INSERT INTO Posting(token_id, doc_id, pages, tf)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(token_id, doc_id)
+    DO UPDATE SET pages = merge_page_blobs(Posting.pages, excluded.pages),
+                  tf = Posting.tf + excluded.tf
+"""
+
+UPSERT_POSITION_SQL = """
+    INSERT INTO Position(token_id, doc_id, positions)
+    VALUES (?, ?, ?)
+    ON CONFLICT(token_id, doc_id)
+    DO UPDATE SET positions = merge_position_blobs(Position.positions, excluded.positions)
+"""
+
+REBUILD_STATS_SQL = """
+    DELETE FROM TokenStats;
+    INSERT INTO TokenStats(token_id, df, max_tf)
+    SELECT token_id, COUNT(*), MAX(tf) FROM Posting GROUP BY token_id;
+    DELETE FROM DocStats;
+    INSERT INTO DocStats(doc_id, length)
+    SELECT doc_id, SUM(tf) FROM Posting GROUP BY doc_id;
+    UPDATE CorpusStats SET
+        doc_count = (SELECT COUNT(*) FROM DocStats),
+        total_length = (SELECT COALESCE(SUM(length), 0) FROM DocStats);
+"""
+
+_generation_lock = threading.Lock()
+_index_generation = 0
+
+def get_index_generation() -> int:
+    """Returns the index generation of this process.
+
+    The generation changes whenever indexed documents or postings get
+    committed, so in-memory copies of the index can tell they are stale.
+
+    Returns:
+        int: Current generation.
+    """
+
+    return _index_generation
+
+def bump_index_generation() -> int:
+    """Marks everything derived from the index as stale.
+
+    Call after committing changes to Document or Posting.
+
+    Returns:
+        int: New generation.
+    """
+
+    global _index_generation # pylint: disable=global-statement
+    with _generation_lock:
+        _index_generation += 1
+        return _index_generation
 
 def initialise_db(conn):
     """Creates all necessary tables and indeces in the database.
 
+    Also registers the page list functions of backend.packing on conn,
+    migrates a Posting table of an older schema version and merges the
+    postings of an interrupted bulk build.
+
     Args:
         conn: SQLite3 Connection object
     """
 
+    register_functions(conn)
     cur = conn.cursor()
-    cur.executescript("""
+    cur.executescript(f"""
     CREATE TABLE IF NOT EXISTS Document (
     doc_id   INTEGER PRIMARY KEY AUTOINCREMENT,
     path     TEXT UNIQUE NOT NULL,
@@ -34,21 +107,251 @@ def initialise_db(conn):
     token_text TEXT UNIQUE NOT NULL
     );
 
-    CREATE TABLE IF NOT EXISTS Posting (
+    {_posting_table_sql("IF NOT EXISTS Posting")}
+
+    CREATE INDEX IF NOT EXISTS idx_posting_doc     ON Posting(doc_id);
+
+    -- Covered by the primary key of Posting and the UNIQUE constraint of Token
+    DROP INDEX IF EXISTS idx_posting_token;
+    DROP INDEX IF EXISTS idx_token_text;
+
+    -- Ranking statistics, kept in step with Posting (see update_posting_stats)
+    CREATE TABLE IF NOT EXISTS DocStats (
+    doc_id INTEGER PRIMARY KEY,
+    length INTEGER NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS TokenStats (
+    token_id INTEGER PRIMARY KEY,
+    df       INTEGER NOT NULL,
+    max_tf   INTEGER NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS CorpusStats (
+    id           INTEGER PRIMARY KEY CHECK (id = 1),
+    doc_count    INTEGER NOT NULL,
+    total_length INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO CorpusStats(id, doc_count, total_length) VALUES (1, 0, 0);
+
+    -- Token positions for phrase and NEAR queries (see packing.pack_positions)
+    CREATE TABLE IF NOT EXISTS Position (
+    token_id  INTEGER NOT NULL,
+    doc_id    INTEGER NOT NULL,
+    positions BLOB NOT NULL,
+    PRIMARY KEY (token_id, doc_id)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_position_doc    ON Position(doc_id);
+
+    -- Extracted page text for snippets (see packing.pack_text)
+    CREATE TABLE IF NOT EXISTS PageText (
+    doc_id INTEGER NOT NULL,
+    page   INTEGER NOT NULL,
+    text   BLOB NOT NULL,
+    PRIMARY KEY (doc_id, page)
+    ) WITHOUT ROWID;
+    """)
+    if get_schema_version(conn) < SCHEMA_VERSION:
+        migrate_schema(conn)
+    else:
+        cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    if has_posting_stage(conn):
+        merge_posting_stage(conn)
+
+def _posting_table_sql(name: str) -> str:
+    """Returns the CREATE TABLE statement of the current Posting schema.
+
+    One row per token and document, the pages packed by backend.packing.
+
+    Args:
+        name: String table name, optionally prefixed with IF NOT EXISTS.
+
+    Returns:
+        str: SQL statement
+    """
+
+    return f"""
+    CREATE TABLE {name} (
     token_id INTEGER NOT NULL,
     doc_id   INTEGER NOT NULL,
-    page     INTEGER NOT NULL,
+    pages    BLOB NOT NULL,
     tf       INTEGER NOT NULL,
-    PRIMARY KEY (token_id, doc_id, page),
+    PRIMARY KEY (token_id, doc_id),
     FOREIGN KEY (token_id) REFERENCES Token(token_id),
     FOREIGN KEY (doc_id)   REFERENCES Document(doc_id)
-    );
+    ) WITHOUT ROWID;
+    """
 
-    CREATE INDEX IF NOT EXISTS idx_posting_token   ON Posting(token_id);
-    CREATE INDEX IF NOT EXISTS idx_posting_doc     ON Posting(doc_id);
-    CREATE INDEX IF NOT EXISTS idx_token_text      ON Token(token_text);
+def get_schema_version(conn) -> int:
+    """Returns the schema version of the database.
+
+    Databases of version 1 (one Posting row per page) were never stamped,
+    they are recognised by their page column. Version 2 packed the pages,
+    version 3 added the ranking statistics.
+
+    Args:
+        conn: SQLite3 connection object
+
+    Returns:
+        int: Schema version.
+    """
+
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version:
+        return version
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(Posting)")}
+
+    return 1 if "page" in columns else SCHEMA_VERSION
+
+def migrate_schema(conn) -> int:
+    """Brings a database of an older schema version up to date.
+
+    Version 1 Posting tables are rewritten with the rows of every
+    (token_id, doc_id) packed into one row, inserted in primary key order.
+    The ranking statistics are then computed from Posting. Runs in one
+    transaction, so an interrupted migration leaves the old tables untouched.
+
+    Args:
+        conn: SQLite3 connection object, the writer, after initialise_db.
+
+    Returns:
+        int: Number of rows in the new Posting table.
+    """
+
+    conn.commit()
+    version = get_schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        return conn.execute("SELECT COUNT(*) FROM Posting").fetchone()[0]
+
+    register_functions(conn)
+    pack_sql = f"""
+        DROP TABLE IF EXISTS PostingBuild;
+        {_posting_table_sql("PostingBuild")}
+        INSERT INTO PostingBuild(token_id, doc_id, pages, tf)
+        SELECT token_id, doc_id, pack_pages(page, tf), SUM(tf)
+        FROM Posting
+        GROUP BY token_id, doc_id
+        ORDER BY token_id, doc_id;
+        DROP TABLE Posting;
+        ALTER TABLE PostingBuild RENAME TO Posting;
+        CREATE INDEX idx_posting_doc ON Posting(doc_id);
+    """
+    try:
+        conn.executescript(f"""
+            BEGIN;
+            {pack_sql if version < 2 else ""}
+            {REBUILD_STATS_SQL}
+            PRAGMA user_version = {SCHEMA_VERSION};
+            COMMIT;
+        """)
+    except Exception:
+        conn.rollback()
+        raise
+    bump_index_generation()
+
+    return conn.execute("SELECT COUNT(*) FROM Posting").fetchone()[0]
+
+def create_posting_stage(conn):
+    """Creates the unindexed staging tables for a bulk build.
+
+    The tables live in the database file, so staged postings are committed
+    together with their Document rows. If a bulk build stops before
+    merge_posting_stage, rows left over from it are kept and merged with
+    the next bulk build or by initialise_db on the next start.
+
+    Args:
+        conn: SQLite3 connection object, the writer.
+    """
+
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS PostingStage (
+        token_id INTEGER NOT NULL,
+        doc_id   INTEGER NOT NULL,
+        page     INTEGER NOT NULL,
+        tf       INTEGER NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS PositionStage (
+        token_id  INTEGER NOT NULL,
+        doc_id    INTEGER NOT NULL,
+        positions BLOB NOT NULL
+        );
     """)
 
+def has_posting_stage(conn) -> bool:
+    """Returns whether a bulk build left staged postings behind.
+
+    Args:
+        conn: SQLite3 connection object
+
+    Returns:
+        bool: True if the PostingStage table exists.
+    """
+
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'PostingStage'"
+    ).fetchone() is not None
+
+def merge_posting_stage(conn) -> int:
+    """Swaps in a Posting table rebuilt from Posting and PostingStage.
+
+    Staged rows are packed per (token_id, doc_id), merged with the page
+    lists already stored and inserted sorted by primary key, so the table
+    is built in one ordered pass. idx_posting_doc and the ranking
+    statistics are built once at the end. Staged positions are merged
+    into Position in primary key order. Everything happens in one
+    transaction: readers keep seeing the old Posting table until the
+    commit.
+
+    Args:
+        conn: SQLite3 connection object, the writer.
+
+    Returns:
+        int: Number of rows in the new Posting table.
+    """
+
+    conn.commit()
+    register_functions(conn)
+    try:
+        conn.executescript(f"""
+            BEGIN;
+            DROP TABLE IF EXISTS PostingBuild;
+            {_posting_table_sql("PostingBuild")}
+            INSERT INTO PostingBuild(token_id, doc_id, pages, tf)
+            SELECT token_id, doc_id, merge_pages(pages), SUM(tf)
+            FROM (
+                SELECT token_id, doc_id, pages, tf FROM main.Posting
+                UNION ALL
+                SELECT token_id, doc_id, pack_pages(page, tf), SUM(tf)
+                FROM main.PostingStage
+                GROUP BY token_id, doc_id
+            )
+            GROUP BY token_id, doc_id
+            ORDER BY token_id, doc_id;
+            DROP TABLE main.Posting;
+            ALTER TABLE PostingBuild RENAME TO Posting;
+            CREATE INDEX idx_posting_doc ON Posting(doc_id);
+            DROP TABLE main.PostingStage;
+            INSERT INTO Position(token_id, doc_id, positions)
+            SELECT token_id, doc_id, merge_positions(positions)
+            FROM main.PositionStage
+            WHERE true
+            GROUP BY token_id, doc_id
+            ORDER BY token_id, doc_id
+            ON CONFLICT(token_id, doc_id)
+            DO UPDATE SET positions = merge_position_blobs(Position.positions, excluded.positions);
+            DROP TABLE main.PositionStage;
+            {REBUILD_STATS_SQL}
+            COMMIT;
+        """)
+    except Exception:
+        conn.rollback()
+        raise
+    bump_index_generation()
+
+    return conn.execute("SELECT COUNT(*) FROM Posting").fetchone()[0]
+
 def get_or_create_doc_id(conn, path: str, metadata=None) -> int:
     """Creates and/or retrieves doc_id for path from Document table.
 
@@ -73,6 +376,22 @@ def get_or_create_doc_id(conn, path: str, metadata=None) -> int:
 
     return doc_id
 
+def fetch_doc_id(conn, path: str) -> int | None:
+    """Retrieves the doc_id of path without creating it.
+
+    Args:
+        conn: SQLite3 connection object
+        path: String denoting the full path of a file
+
+    Returns:
+        doc_id: As integer
+        None: If path isn't indexed
+    """
+
+    row = conn.execute("SELECT doc_id FROM Document WHERE path = ?", (path,)).fetchone()
+
+    return row[0] if row else None
+
 def get_metadata_from_doc_id(conn, doc_id: int) -> dict | None:
     """Returns the metadata associated with the doc_id.
 
@@ -88,7 +407,7 @@ def get_metadata_from_doc_id(conn, doc_id: int) -> dict | None:
     cur = conn.cursor()
     cur.execute("SELECT metadata FROM Document WHERE doc_id = ?", (doc_id,))
     row = cur.fetchone()
-    if row:
+    if row and row[0]:
         data = json.loads(row[0])
         return data
     else:
@@ -110,7 +429,7 @@ def update_metadata_from_doc_id(conn, doc_id: int, updates: dict):
     if not row:
         return
 
-    metadata = json.loads(row[0])
+    metadata = json.loads(row[0]) if row[0] else {}
     metadata.update(updates)
 
     cur.execute(
@@ -137,6 +456,105 @@ def get_path_from_doc_id(conn, doc_id: int) -> str | None:
 
     return path
 
+def fetch_token_ids(conn, tokens: list[str]) -> dict:
+    """Looks up the token_ids of tokens, chunked below SQLITE_MAX_VARIABLES.
+
+    Args:
+        conn: SQLite3 connection object
+        tokens: List of tokens in string format
+
+    Returns:
+        dict: token_text: token_id for every token that exists
+    """
+
+    token_ids = {}
+    cur = conn.cursor()
+    for start in range(0, len(tokens), SQLITE_MAX_VARIABLES):
+        chunk = tokens[start:start + SQLITE_MAX_VARIABLES]
+        placeholders = ",".join("?" * len(chunk))
+        cur.execute(f"SELECT token_text, token_id FROM Token WHERE token_text IN ({placeholders})",
+                    chunk)
+        token_ids.update(cur.fetchall())
+
+    return token_ids
+
+def fetch_tokens_after(conn, token_id: int) -> list[tuple]:
+    """Returns all tokens with a higher token_id.
+
+    Args:
+        conn: SQLite3 connection object
+        token_id: Integer token identifier, 0 for all tokens
+
+    Returns:
+        list: (token_text, token_id) tuples
+    """
+
+    cur = conn.cursor()
+    cur.execute("SELECT token_text, token_id FROM Token WHERE token_id > ?", (token_id,))
+
+    return cur.fetchall()
+
+def fetch_token_dfs_after(conn, token_id: int) -> list[tuple]:
+    """Returns all tokens with a higher token_id and their document frequency.
+
+    Args:
+        conn: SQLite3 connection object
+        token_id: Integer token identifier, 0 for all tokens
+
+    Returns:
+        list: (token_id, token_text, df) tuples, df 0 for tokens without
+                postings
+    """
+
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT t.token_id, t.token_text, COALESCE(s.df, 0)
+        FROM Token t
+        LEFT JOIN TokenStats s ON s.token_id = t.token_id
+        WHERE t.token_id > ?
+    """, (token_id,))
+
+    return cur.fetchall()
+
+def fetch_token_dfs(conn, token_ids: list[int]) -> list[tuple]:
+    """Returns some tokens and their document frequency.
+
+    Args:
+        conn: SQLite3 connection object
+        token_ids: List of integer token identifiers
+
+    Returns:
+        list: (token_id, token_text, df) tuples, df 0 for tokens without
+                postings
+    """
+
+    rows = []
+    cur = conn.cursor()
+    for start in range(0, len(token_ids), SQLITE_MAX_VARIABLES):
+        chunk = token_ids[start:start + SQLITE_MAX_VARIABLES]
+        placeholders = ",".join("?" * len(chunk))
+        cur.execute(f"""
+            SELECT t.token_id, t.token_text, COALESCE(s.df, 0)
+            FROM Token t
+            LEFT JOIN TokenStats s ON s.token_id = t.token_id
+            WHERE t.token_id IN ({placeholders})
+        """, chunk)
+        rows += cur.fetchall()
+
+    return rows
+
+def insert_tokens(conn, tokens: list[str]):
+    """Adds tokens to the Token table, skipping existing ones.
+
+    Args:
+        conn: SQLite3 connection object
+        tokens: List of tokens in string format
+    """
+
+    cur = conn.cursor()
+    cur.executemany("INSERT OR IGNORE INTO Token(token_text) VALUES(?)",
+                    ((t,) for t in tokens))
+
 def _ensure_token_ids(conn, tokens: list[str], cache: dict) -> dict:
     """
     Ensure token_text's exist in Token and return a dict token_text -> token_id.
@@ -152,14 +570,8 @@ def _ensure_token_ids(conn, tokens: list[str], cache: dict) -> dict:
 
     to_insert = [t for t in tokens if t not in cache]
     if to_insert:
-        cur = conn.cursor()
-        cur.executemany("INSERT OR IGNORE INTO Token(token_text) VALUES(?)",
-                        ((t,) for t in to_insert))
-        placeholders = ",".join("?" for _ in to_insert)
-        cur.execute(f"SELECT token_id, token_text FROM Token WHERE token_text IN ({placeholders})",
-                    to_insert)
-        for tid, ttext in cur.fetchall():
-            cache[ttext] = tid
+        insert_tokens(conn, to_insert)
+        cache.update(fetch_token_ids(conn, to_insert))
 
     return cache
 
@@ -187,15 +599,100 @@ def bulk_upsert_postings(
     rows = []
     for token_text, tf in token_tf_pairs:
         token_id = _token_cache[token_text]
-        rows.append((token_id, doc_id, page, int(tf)))
+        rows.append((token_id, doc_id, pack_pages(((page, int(tf)),)), int(tf)))
+
+    update_posting_stats(conn, [(token_id, doc_id, tf) for token_id, doc_id, _pages, tf in rows],
+                         is_new=False)
+    cur = conn.cursor()
+    cur.executemany(UPSERT_POSTING_SQL, rows)
+
+def update_posting_stats(conn, rows: list[tuple], is_new: bool):
+    """Adds postings that are about to be written to the ranking statistics.
+
+    Must be called before the rows reach Posting. DocStats.length and
+    CorpusStats.total_length count tokens, TokenStats.df counts documents.
+
+    Args:
+        conn: SQLite3 connection object
+        rows: List of (token_id, doc_id, tf) tuples, unique per (token_id, doc_id).
+        is_new: Boolean whether none of the (token_id, doc_id) has a Posting
+                row yet. Otherwise every row is looked up first.
+    """
 
+    if not rows:
+        return
     cur = conn.cursor()
+
+    doc_lengths = {}
+    token_stats = {}
+    for token_id, doc_id, tf in rows:
+        stored_tf = 0
+        if not is_new:
+            row = cur.execute("SELECT tf FROM Posting WHERE token_id = ? AND doc_id = ?",
+                              (token_id, doc_id)).fetchone()
+            stored_tf = row[0] if row else 0
+        doc_lengths[doc_id] = doc_lengths.get(doc_id, 0) + tf
+        df, max_tf = token_stats.get(token_id, (0, 0))
+        token_stats[token_id] = (df + (not stored_tf), max(max_tf, stored_tf + tf))
+
+    doc_ids = list(doc_lengths)
+    new_docs = len(doc_ids)
+    for start in range(0, len(doc_ids), SQLITE_MAX_VARIABLES):
+        chunk = doc_ids[start:start + SQLITE_MAX_VARIABLES]
+        placeholders = ",".join("?" * len(chunk))
+        new_docs -= cur.execute(f"SELECT COUNT(*) FROM DocStats WHERE doc_id IN ({placeholders})",
+                                chunk).fetchone()[0]
+
     cur.executemany("""
-        INSERT INTO Posting(token_id, doc_id, page, tf)
-        VALUES (?, ?, ?, ?)
-        ON CONFLICT(token_id, doc_id, page)
-        DO UPDATE SET tf = Posting.tf + excluded.tf
-    """, rows)
+        INSERT INTO DocStats(doc_id, length) VALUES (?, ?)
+        ON CONFLICT(doc_id) DO UPDATE SET length = length + excluded.length
+    """, doc_lengths.items())
+    cur.executemany("""
+        INSERT INTO TokenStats(token_id, df, max_tf) VALUES (?, ?, ?)
+        ON CONFLICT(token_id) DO UPDATE SET df = df + excluded.df,
+                                            max_tf = MAX(max_tf, excluded.max_tf)
+    """, ((token_id, df, max_tf) for token_id, (df, max_tf) in token_stats.items()))
+    cur.execute("""
+        UPDATE CorpusStats SET doc_count = doc_count + ?, total_length = total_length + ?
+    """, (new_docs, sum(doc_lengths.values())))
+
+def fetch_corpus_stats(conn) -> tuple:
+    """Returns the number of documents and their average length.
+
+    Args:
+        conn: SQLite3 connection object
+
+    Returns:
+        (int, float): Documents with postings and average tokens per document.
+    """
+
+    doc_count, total_length = conn.execute(
+        "SELECT doc_count, total_length FROM CorpusStats"
+    ).fetchone()
+
+    return doc_count, total_length / doc_count if doc_count else 0.0
+
+def fetch_doc_lengths(conn, doc_ids: list[int]) -> dict:
+    """Retrieves the lengths of many doc_ids at once.
+
+    Args:
+        conn: SQLite3 connection object
+        doc_ids: List of integer document identifiers
+
+    Returns:
+        dict: doc_id: number of tokens for every doc_id with postings
+    """
+
+    lengths = {}
+    cur = conn.cursor()
+    for start in range(0, len(doc_ids), SQLITE_MAX_VARIABLES):
+        chunk = doc_ids[start:start + SQLITE_MAX_VARIABLES]
+        placeholders = ",".join("?" * len(chunk))
+        cur.execute(f"SELECT doc_id, length FROM DocStats WHERE doc_id IN ({placeholders})",
+                    chunk)
+        lengths.update(cur.fetchall())
+
+    return lengths
 
 def fetch_postings_for_token(conn, token_text: str) -> list[tuple]:
     """Returns list of (path, page, tf) for a given token_text.
@@ -210,16 +707,246 @@ def fetch_postings_for_token(conn, token_text: str) -> list[tuple]:
 
     cur = conn.cursor()
     cur.execute("""
-        SELECT d.path, p.page, p.tf
+        SELECT d.path, p.pages
         FROM Posting p
         JOIN Token t ON t.token_id = p.token_id
         JOIN Document d ON d.doc_id = p.doc_id
         WHERE t.token_text = ?
     """, (token_text,))
-    rows = cur.fetchall()
+    rows = [
+        (path, page, tf)
+        for path, pages in cur.fetchall()
+        for page, tf in unpack_pages(pages)
+    ]
 
     return rows
 
+def fetch_doc_postings_for_token(conn, token_text: str) -> list[tuple]:
+    """Returns list of (doc_id, page, tf) for a given token_text.
+
+    Unlike fetch_postings_for_token this avoids joining Document and
+    returns the rows sorted by doc_id, then page.
+
+    Args:
+        conn: SQLite3 connection object
+        token_text: String token
+
+    Returns:
+        rows: List of (doc_id, page, tf) for a given token_text.
+    """
+
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT p.doc_id, p.pages
+        FROM Posting p
+        JOIN Token t ON t.token_id = p.token_id
+        WHERE t.token_text = ?
+        ORDER BY p.doc_id
+    """, (token_text,))
+
+    return _unpack_rows(cur.fetchall())
+
+def fetch_doc_postings_for_token_id(conn, token_id: int) -> list[tuple]:
+    """Returns list of (doc_id, page, tf) for a given token_id.
+
+    Like fetch_doc_postings_for_token, for callers that already resolved
+    the token, e.g. through the token cache.
+
+    Args:
+        conn: SQLite3 connection object
+        token_id: Integer token identifier
+
+    Returns:
+        rows: List of (doc_id, page, tf) sorted by doc_id, then page.
+    """
+
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT doc_id, pages
+        FROM Posting
+        WHERE token_id = ?
+        ORDER BY doc_id
+    """, (token_id,))
+
+    return _unpack_rows(cur.fetchall())
+
+def fetch_doc_postings_for_token_ids(conn, token_ids: list[int]) -> list[tuple]:
+    """Returns the union of the postings of several tokens.
+
+    The posting lists are read with one query per SQLITE_MAX_VARIABLES
+    tokens. Pages of a document found for several tokens get the sum of
+    their term frequencies.
+
+    Args:
+        conn: SQLite3 connection object
+        token_ids: List of integer token identifiers
+
+    Returns:
+        rows: List of (doc_id, page, tf) sorted by doc_id, then page.
+    """
+
+    doc_pages = {}
+    cur = conn.cursor()
+    for start in range(0, len(token_ids), SQLITE_MAX_VARIABLES):
+        chunk = token_ids[start:start + SQLITE_MAX_VARIABLES]
+        placeholders = ",".join("?" * len(chunk))
+        cur.execute(f"SELECT doc_id, pages FROM Posting WHERE token_id IN ({placeholders})",
+                    chunk)
+        for doc_id, pages in cur.fetchall():
+            page_tfs = doc_pages.get(doc_id)
+            if page_tfs is None:
+                doc_pages[doc_id] = dict(unpack_pages(pages))
+                continue
+            for page, tf in unpack_pages(pages):
+                page_tfs[page] = page_tfs.get(page, 0) + tf
+
+    return [
+        (doc_id, page, tf)
+        for doc_id in sorted(doc_pages)
+        for page, tf in sorted(doc_pages[doc_id].items())
+    ]
+
+def _unpack_rows(rows: list[tuple]) -> list[tuple]:
+    """Expands (doc_id, pages) rows into (doc_id, page, tf) rows.
+
+    Args:
+        rows: List of (doc_id, pages) sorted by doc_id.
+
+    Returns:
+        list: (doc_id, page, tf) tuples sorted by doc_id, then page.
+    """
+
+    return [
+        (doc_id, page, tf)
+        for doc_id, pages in rows
+        for page, tf in unpack_pages(pages)
+    ]
+
+def fetch_positions(conn, token_id: int, doc_ids: list[int]) -> dict:
+    """Returns the positions of a token in some documents.
+
+    Args:
+        conn: SQLite3 connection object
+        token_id: Integer token identifier
+        doc_ids: List of integer document identifiers
+
+    Returns:
+        dict: doc_id: {page: array('I') of positions} for every document
+                with stored positions
+    """
+
+    positions = {}
+    cur = conn.cursor()
+    for start in range(0, len(doc_ids), SQLITE_MAX_VARIABLES):
+        chunk = doc_ids[start:start + SQLITE_MAX_VARIABLES]
+        placeholders = ",".join("?" * len(chunk))
+        cur.execute(f"SELECT doc_id, positions FROM Position "
+                    f"WHERE token_id = ? AND doc_id IN ({placeholders})", (token_id, *chunk))
+        positions.update((doc_id, unpack_positions(blob)) for doc_id, blob in cur.fetchall())
+
+    return positions
+
+def fetch_all_doc_ids(conn) -> list[int]:
+    """Returns all doc_ids in ascending order.
+
+    Args:
+        conn: SQLite3 connection object
+
+    Returns:
+        list: Integer doc_ids
+    """
+
+    cur = conn.cursor()
+    cur.execute("SELECT doc_id FROM Document ORDER BY doc_id")
+
+    return [row[0] for row in cur.fetchall()]
+
+def fetch_max_doc_id(conn) -> int:
+    """Returns the highest doc_id with postings, 0 for an empty index.
+
+    Args:
+        conn: SQLite3 connection object
+
+    Returns:
+        int: doc_id
+    """
+
+    return conn.execute("SELECT COALESCE(MAX(doc_id), 0) FROM DocStats").fetchone()[0]
+
+def fetch_all_doc_lengths(conn) -> list[tuple]:
+    """Returns the length of every document with postings.
+
+    Args:
+        conn: SQLite3 connection object
+
+    Returns:
+        list: (doc_id, length) tuples.
+    """
+
+    return conn.execute("SELECT doc_id, length FROM DocStats").fetchall()
+
+def fetch_max_tfs(conn, token_ids: list[int]) -> dict:
+    """Returns the highest document tf of each token from TokenStats.
+
+    Args:
+        conn: SQLite3 connection object
+        token_ids: List of integer token identifiers
+
+    Returns:
+        dict: token_id: max_tf for every token with statistics
+    """
+
+    max_tfs = {}
+    cur = conn.cursor()
+    for start in range(0, len(token_ids), SQLITE_MAX_VARIABLES):
+        chunk = token_ids[start:start + SQLITE_MAX_VARIABLES]
+        placeholders = ",".join("?" * len(chunk))
+        cur.execute(f"SELECT token_id, max_tf FROM TokenStats WHERE token_id IN ({placeholders})",
+                    chunk)
+        max_tfs.update(cur.fetchall())
+
+    return max_tfs
+
+def fetch_paths_under(conn, folder: str) -> list[str]:
+    """Returns the paths of all documents inside folder and its subfolders.
+
+    Args:
+        conn: SQLite3 connection object
+        folder: String path of folder
+
+    Returns:
+        list: Paths in string format
+    """
+
+    prefix = os.path.join(folder, "")
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    cur = conn.cursor()
+    cur.execute("SELECT path FROM Document WHERE path >= ? AND path < ?", (prefix, upper))
+
+    return [row[0] for row in cur.fetchall()]
+
+def get_paths_for_doc_ids(conn, doc_ids: list[int]) -> dict:
+    """Retrieves the paths of many doc_ids at once.
+
+    Args:
+        conn: SQLite3 connection object
+        doc_ids: List of integer document identifiers
+
+    Returns:
+        dict: doc_id: path for every doc_id that exists
+    """
+
+    paths = {}
+    cur = conn.cursor()
+    for start in range(0, len(doc_ids), SQLITE_MAX_VARIABLES):
+        chunk = doc_ids[start:start + SQLITE_MAX_VARIABLES]
+        placeholders = ",".join("?" * len(chunk))
+        cur.execute(f"SELECT doc_id, path FROM Document WHERE doc_id IN ({placeholders})",
+                    chunk)
+        paths.update(cur.fetchall())
+
+    return paths
+
 def enable_bulk_mode(conn):
     """Turns on optional SQLite3 settings to enable for fast bulk insert.
 
@@ -247,53 +974,92 @@ def disable_bulk_mode(conn):
         PRAGMA synchronous = NORMAL;
     """)
 
-def _term_doc_map(conn, token: str) -> dict:
-    """Returns a dictionary mapping of path, page to important information.
+def delete_postings_for_doc_id(conn, doc_id: int):
+    """Deletes all postings and positions for doc_id and removes them from the statistics.
+
+    TokenStats.max_tf is not lowered, it stays an upper bound.
+
+    Args:
+        conn: SQLite3 connection object
+        doc_id: Integer document indentifier
+    """
+
+    cur = conn.cursor()
+    cur.execute("SELECT length FROM DocStats WHERE doc_id = ?", (doc_id,))
+    row = cur.fetchone()
+    if row:
+        cur.execute("""
+            UPDATE TokenStats SET df = df - 1
+            WHERE token_id IN (SELECT token_id FROM Posting WHERE doc_id = ?)
+        """, (doc_id,))
+        cur.execute("DELETE FROM DocStats WHERE doc_id = ?", (doc_id,))
+        cur.execute("""
+            UPDATE CorpusStats SET doc_count = doc_count - 1, total_length = total_length - ?
+        """, (row[0],))
+    cur.execute("""
+        DELETE FROM Posting
+        WHERE doc_id = ?
+    """, (doc_id,))
+    cur.execute("DELETE FROM Position WHERE doc_id = ?", (doc_id,))
+
+def delete_staged_postings_for_doc_id(conn, doc_id: int):
+    """Deletes the staged postings and positions of doc_id.
 
-    The returned dictionary is a mapping of (path, page) to a dictionary of 
-    {"match_count": 1, "total_tf": term frequency, "terms" {token}}.
+    The staging tables have no index, so this scans them.
 
     Args:
         conn: SQLite3 connection object
-        token: String token
+        doc_id: Integer document identifier
     """
-    rows = fetch_postings_for_token(conn, token)
-    m = {}
-    for path, page, tf in rows:
-        key = (path, page)
-        m[key] = {"match_count": 1, "total_tf": tf, "terms": {token}}
 
-    return m
+    conn.execute("DELETE FROM PostingStage WHERE doc_id = ?", (doc_id,))
+    conn.execute("DELETE FROM PositionStage WHERE doc_id = ?", (doc_id,))
+
+def store_page_text(conn, doc_id: int, page: int, blob: bytes):
+    """Stores the compressed text of one page, replacing an older one.
 
-def fetch_all_documents(conn) -> set:
+    Args:
+        conn: SQLite3 connection object
+        doc_id: Integer document identifier
+        page: Integer page number
+        blob: Bytes from packing.pack_text
     """
-    Fetch all document IDs in the collection.
+
+    conn.execute("INSERT OR REPLACE INTO PageText(doc_id, page, text) VALUES (?, ?, ?)",
+                 (doc_id, page, blob))
+
+def fetch_page_texts(conn, doc_id: int, pages: list[int]) -> dict:
+    """Returns the stored text of some pages of a document.
 
     Args:
-        conn: SQLite3 connection object.
+        conn: SQLite3 connection object
+        doc_id: Integer document identifier
+        pages: List of integer page numbers
 
     Returns:
-        set of doc_ids
+        dict: page: text for every page that has stored text
     """
-    cursor = conn.cursor()
-    cursor.execute("SELECT path FROM Document")
-    result = {row[0] for row in cursor.fetchall()}
 
-    return result
+    texts = {}
+    cur = conn.cursor()
+    for start in range(0, len(pages), SQLITE_MAX_VARIABLES):
+        chunk = pages[start:start + SQLITE_MAX_VARIABLES]
+        placeholders = ",".join("?" * len(chunk))
+        cur.execute(f"SELECT page, text FROM PageText WHERE doc_id = ? AND page IN ({placeholders})",
+                    (doc_id, *chunk))
+        texts.update((page, unpack_text(blob)) for page, blob in cur.fetchall())
 
-def delete_postings_for_doc_id(conn, doc_id: int):
-    """Deletes all postings for doc_id.
+    return texts
+
+def delete_page_texts(conn, doc_id: int):
+    """Deletes the stored page texts of doc_id.
 
     Args:
         conn: SQLite3 connection object
-        doc_id: Integer document indentifier
+        doc_id: Integer document identifier
     """
 
-    cur = conn.cursor()
-    cur.execute("""
-        DELETE FROM Posting
-        WHERE doc_id = ?
-    """, (doc_id,))
+    conn.execute("DELETE FROM PageText WHERE doc_id = ?", (doc_id,))
 
 def delete_documents(conn, to_delete: list):
     """Deletes all Documents from to_delete.
@@ -311,3 +1077,4 @@ def delete_documents(conn, to_delete: list):
     query = f"DELETE FROM Document WHERE path IN ({placeholders})"
     cur.execute(query, tuple(to_delete))
     conn.commit()
+    bump_index_generation()
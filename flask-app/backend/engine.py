@@ -0,0 +1,409 @@
+"""
+In-memory inverted index over integer arrays.
+
+Posting lists are loaded from the Posting table the first time a token is
+queried and kept as sorted array('I') columns. The set algebra used by the
+boolean evaluator (galloping intersection, merge union, difference) works on
+the sorted doc_id arrays, so paths are only looked up for the final results.
+Phrases and NEAR are matched by merging the sorted token positions of a page.
+A prefix or wildcard pattern gets one posting list for all terms it expands
+to (see backend.terms).
+The cache is dropped whenever the index generation changes, so it stays in
+sync with every commit from the indexer and watchdog, and holds at most
+"memory_index_mb" of posting lists.
+
+Typical usage:
+    from backend.engine import MEMORY_INDEX
+
+    postings = MEMORY_INDEX.postings(conn, token_text)
+    all_doc_ids = MEMORY_INDEX.all_doc_ids(conn)
+    lengths = MEMORY_INDEX.doc_lengths(conn)
+"""
+
+import threading
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterator
+from backend.database import ( # pylint: disable=import-error
+    fetch_doc_postings_for_token_id,
+    fetch_doc_postings_for_token_ids,
+    fetch_all_doc_ids,
+    fetch_all_doc_lengths,
+    fetch_max_doc_id,
+    get_index_generation
+)
+from backend.settings import load_settings # pylint: disable=import-error
+from backend.query_cache import QueryCache, MB # pylint: disable=import-error
+from backend.token_cache import TOKEN_CACHE # pylint: disable=import-error
+from backend.terms import TERM_DICTIONARY, is_wildcard # pylint: disable=import-error
+
+GALLOP_RATIO = 8 # Size ratio from which intersections gallop instead of hashing
+
+class PostingList:
+    """Postings of one token, sorted by doc_id and page.
+
+    Postings of doc_ids[i] are found at pages[offsets[i]:offsets[i+1]] and
+    tfs[offsets[i]:offsets[i+1]], their sum is doc_tfs[i].
+
+    Attributes:
+        doc_ids: array('I') of unique doc_ids in ascending order
+        offsets: array('I') of len(doc_ids) + 1 start positions
+        pages: array('I') of page numbers
+        tfs: array('I') of term frequencies
+        doc_tfs: array('I') of term frequencies per document
+    """
+
+    __slots__ = ("doc_ids", "offsets", "pages", "tfs", "doc_tfs")
+
+    def __init__(self, rows: list[tuple]):
+        """Builds the arrays from rows.
+
+        Args:
+            rows: List of (doc_id, page, tf) sorted by doc_id, then page.
+        """
+
+        self.doc_ids = array('I')
+        self.offsets = array('I')
+        self.pages = array('I', (page for _doc_id, page, _tf in rows))
+        self.tfs = array('I', (tf for _doc_id, _page, tf in rows))
+        self.doc_tfs = array('I')
+
+        previous = None
+        for position, (doc_id, _page, tf) in enumerate(rows):
+            if doc_id != previous:
+                self.doc_ids.append(doc_id)
+                self.offsets.append(position)
+                self.doc_tfs.append(tf)
+                previous = doc_id
+            else:
+                self.doc_tfs[-1] += tf
+        self.offsets.append(len(rows))
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def doc_postings(self, index: int) -> tuple:
+        """Returns the postings of the doc_id at position index.
+
+        Args:
+            index: Integer position in doc_ids.
+
+        Returns:
+            (array, array): Pages and term frequencies.
+        """
+
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.pages[start:end], self.tfs[start:end]
+
+    def nbytes(self) -> int:
+        """Returns the memory used by the arrays in bytes."""
+
+        return sum(values.itemsize * len(values) for values in (
+            self.doc_ids, self.offsets, self.pages, self.tfs, self.doc_tfs))
+
+class MemoryIndex:
+    """Process wide cache of posting lists and the set of all documents.
+
+    Posting lists are only cached for the "memory" search engine, the
+    doc_ids of all documents are used by NOT and the document lengths by
+    ranking in both engines. Posting lists are kept in a QueryCache, so
+    the least recently used ones are dropped beyond max_bytes. Data is
+    read from the database outside the lock, so a cold load doesn't hold
+    up other searches; two threads may load the same data at once.
+
+    Attributes:
+        generation: Index generation the cached data belongs to.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        """Creates an empty index.
+
+        Args:
+            max_bytes: Integer memory budget of the posting lists, 0 to
+                    cache none.
+        """
+
+        self.generation = None
+        self._postings = QueryCache(max_bytes=max_bytes)
+        self._all_doc_ids = None
+        self._doc_lengths = None
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        """Drops cached data if the index changed since it was loaded.
+
+        Must be called while holding _lock.
+        """
+
+        current = get_index_generation()
+        if self.generation != current:
+            self._all_doc_ids = None
+            self._doc_lengths = None
+            self.generation = current
+
+    def postings(self, conn, token_text: str) -> PostingList:
+        """Returns the posting list of token_text, loading it if necessary.
+
+        Args:
+            conn: SQLite3 connection object
+            token_text: String token
+
+        Returns:
+            PostingList: Possibly empty posting list.
+        """
+
+        generation = get_index_generation()
+        posting_list = self._postings.get(token_text)
+        if posting_list is None:
+            posting_list = load_posting_list(conn, token_text)
+            self._postings.put(token_text, posting_list, posting_list.nbytes(), generation)
+
+        return posting_list
+
+    def all_doc_ids(self, conn) -> array:
+        """Returns the sorted doc_ids of every indexed document.
+
+        Args:
+            conn: SQLite3 connection object
+
+        Returns:
+            array: array('I') of doc_ids.
+        """
+
+        return self._cached("_all_doc_ids", lambda: array('I', fetch_all_doc_ids(conn)))
+
+    def doc_lengths(self, conn) -> array:
+        """Returns the length in tokens of every document, indexed by doc_id.
+
+        Args:
+            conn: SQLite3 connection object
+
+        Returns:
+            array: array('I') with 0 for doc_ids without postings.
+        """
+
+        return self._cached("_doc_lengths", lambda: load_doc_lengths(conn))
+
+    def stats(self) -> dict:
+        """Returns the counters of the posting list cache, see QueryCache.stats."""
+
+        return self._postings.stats()
+
+    def _cached(self, name: str, load) -> array:
+        """Returns attribute name, loading it outside the lock if it is None.
+
+        The loaded value is only kept if the index didn't change meanwhile.
+
+        Args:
+            name: String attribute name.
+            load: Function without arguments reading the value.
+
+        Returns:
+            array: The cached or loaded value.
+        """
+
+        with self._lock:
+            self._sync()
+            generation = self.generation
+            value = getattr(self, name)
+        if value is None:
+            value = load()
+            with self._lock:
+                self._sync()
+                if self.generation == generation:
+                    setattr(self, name, value)
+
+        return value
+
+def load_doc_lengths(conn) -> array:
+    """Reads all document lengths into an array indexed by doc_id.
+
+    Args:
+        conn: SQLite3 connection object
+
+    Returns:
+        array: array('I') with 0 for doc_ids without postings.
+    """
+
+    lengths = array('I', bytes(4 * (fetch_max_doc_id(conn) + 1)))
+    for doc_id, length in fetch_all_doc_lengths(conn):
+        lengths[doc_id] = length
+
+    return lengths
+
+def load_posting_list(conn, token_text: str) -> PostingList:
+    """Reads the posting list of token_text from the database.
+
+    The token_id comes from the shared token cache, so the query only
+    touches the Posting table. A wildcard pattern is expanded through the
+    term dictionary and the postings of all its terms are united.
+
+    Args:
+        conn: SQLite3 connection object
+        token_text: String token or wildcard pattern
+
+    Returns:
+        PostingList: Possibly empty posting list.
+    """
+
+    if is_wildcard(token_text):
+        token_ids = [token_id for _term, token_id in TERM_DICTIONARY.expand(conn, token_text)]
+        return PostingList(fetch_doc_postings_for_token_ids(conn, token_ids))
+
+    token_id = TOKEN_CACHE.lookup(conn, token_text)
+    if token_id is None:
+        return PostingList([])
+
+    return PostingList(fetch_doc_postings_for_token_id(conn, token_id))
+
+def _gallop(small: array, large: array) -> Iterator[tuple]:
+    """Looks up every doc_id of small in large by exponential search.
+
+    Each lookup starts where the previous one ended, so the cost is
+    O(len(small) * log(len(large) / len(small))) instead of a full merge.
+
+    Args:
+        small: Sorted array('I') of doc_ids to look up.
+        large: Sorted array('I') to search in.
+
+    Yields:
+        (int, bool): doc_id of small and whether large contains it.
+    """
+
+    size = len(large)
+    low = 0
+    for doc_id in small:
+        step = 1
+        bound = low
+        while bound < size and large[bound] < doc_id:
+            low = bound + 1
+            bound += step
+            step <<= 1
+        low = bisect_left(large, doc_id, low, min(bound, size))
+        is_found = low < size and large[low] == doc_id
+        if is_found:
+            low += 1
+        yield doc_id, is_found
+
+def intersect(left: array, right: array) -> array:
+    """Returns the doc_ids contained in both sorted arrays.
+
+    Gallops through the larger array when the sizes are skewed, which is
+    the common case for a rare term ANDed with a frequent one. Arrays of
+    similar size are intersected through a hash set.
+
+    Args:
+        left: Sorted array('I').
+        right: Sorted array('I').
+
+    Returns:
+        array: Sorted array('I').
+    """
+
+    if len(left) > len(right):
+        left, right = right, left
+    if not left:
+        return array('I')
+    if len(right) >= GALLOP_RATIO * len(left):
+        return array('I', (doc_id for doc_id, is_found in _gallop(left, right) if is_found))
+    right_set = set(right)
+
+    return array('I', (doc_id for doc_id in left if doc_id in right_set))
+
+def union(left: array, right: array) -> array:
+    """Returns the doc_ids contained in either sorted array.
+
+    Both arrays are sorted runs, so sorting their concatenation is a single
+    linear merge. Duplicates are then dropped in order.
+
+    Args:
+        left: Sorted array('I').
+        right: Sorted array('I').
+
+    Returns:
+        array: Sorted array('I').
+    """
+
+    if not left:
+        return right
+    if not right:
+        return left
+
+    return array('I', dict.fromkeys(sorted(left + right)))
+
+def difference(left: array, right: array) -> array:
+    """Returns the doc_ids of left that are not in right.
+
+    Args:
+        left: Sorted array('I').
+        right: Sorted array('I').
+
+    Returns:
+        array: Sorted array('I').
+    """
+
+    if not left or not right:
+        return left
+    if len(right) >= GALLOP_RATIO * len(left):
+        return array('I', (doc_id for doc_id, is_found in _gallop(left, right) if not is_found))
+    right_set = set(right)
+
+    return array('I', (doc_id for doc_id in left if doc_id not in right_set))
+
+def phrase_starts(page_positions: list[tuple]) -> array:
+    """Returns where terms occur as a phrase on one page.
+
+    Args:
+        page_positions: List of (offset, positions) per phrase term, offset
+                being the term's position in the phrase and positions a
+                sorted array of its positions on the page.
+
+    Returns:
+        array: Sorted array('I') of positions where the phrase starts.
+    """
+
+    offset, positions = page_positions[0]
+    if len(page_positions) == 1 and not offset:
+        return positions
+    starts = {position - offset for position in positions}
+    for offset, positions in page_positions[1:]:
+        starts.intersection_update(position - offset for position in positions)
+        if not starts:
+            break
+
+    return array('I', sorted(start for start in starts if start >= 0))
+
+def near_count(left: array, left_width: int, right: array, right_width: int,
+               distance: int) -> int:
+    """Counts the left spans with a right span at most distance positions away.
+
+    Spans are given by their sorted start positions and a width (1 for a
+    term, the number of terms for a phrase). Overlapping spans don't count,
+    adjacent ones are 1 apart.
+
+    Args:
+        left: Sorted array('I') of start positions.
+        left_width: Integer number of positions of a left span.
+        right: Sorted array('I') of start positions.
+        right_width: Integer number of positions of a right span.
+        distance: Integer maximum distance.
+
+    Returns:
+        int: Number of matching left spans.
+    """
+
+    count = 0
+    size = len(right)
+    for start in left:
+        after = start + left_width
+        index = bisect_left(right, after)
+        if index < size and right[index] < after + distance:
+            count += 1
+            continue
+        index = bisect_left(right, max(start - right_width - distance + 1, 0))
+        if index < size and right[index] <= start - right_width:
+            count += 1
+
+    return count
+
+MEMORY_INDEX = MemoryIndex(load_settings()["memory_index_mb"] * MB)
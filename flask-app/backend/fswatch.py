@@ -0,0 +1,316 @@
+"""
+File system event watching for the watchdog folders.
+
+A backend reports raw create, modify, move and delete events. The
+FolderWatcher thread debounces them per path and hands the settled changes
+to a callback, which the watchdog turns into incremental index and delete
+jobs. Backends are looked up in BACKENDS by name; if none works on this
+system, create_backend returns None and the watchdog keeps polling.
+
+Typical usage:
+    backend = create_backend(folders, is_recursive=True)
+    watcher = FolderWatcher(backend, on_changes, debounce=2.0)
+    watcher.start()
+"""
+
+import os
+import sys
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import threading
+
+CREATED = "created"
+MODIFIED = "modified"
+DELETED = "deleted"
+MOVED_FROM = "moved_from"
+MOVED_TO = "moved_to"
+
+class InotifyBackend:
+    """Linux inotify backend using libc through ctypes.
+
+    Every folder (and with is_recursive every subfolder) gets its own watch.
+    Folders created or moved in later are watched as soon as they show up.
+
+    Attributes:
+        is_recursive: Boolean whether subfolders are watched.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0x00000800
+    IN_CLOEXEC = 0x00080000
+    WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                  IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, folders: list[str], is_recursive: bool):
+        """Starts watching folders.
+
+        Args:
+            folders: List of folder paths.
+            is_recursive: Boolean whether subfolders are watched.
+
+        Raises:
+            OSError: If inotify is unavailable or out of watches.
+        """
+
+        self.is_recursive = is_recursive
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._roots = list(folders)
+        self._watches = {}
+        try:
+            for folder in folders:
+                self._watch_tree(folder)
+        except OSError:
+            self.close()
+            raise
+
+    def read_events(self, timeout: float) -> list[tuple]:
+        """Waits up to timeout seconds for events.
+
+        Args:
+            timeout: Float seconds to wait.
+
+        Returns:
+            list: (kind, path, is_dir) tuples. A queue overflow is reported
+                    as (MODIFIED, folder, True) for every watched root.
+        """
+
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 1 << 16)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="surrogateescape")
+            offset += length
+
+            if mask & self.IN_Q_OVERFLOW:
+                events.extend((MODIFIED, folder, True) for folder in self._roots)
+                continue
+            folder = self._watches.get(wd)
+            if folder is None:
+                continue
+            if mask & self.IN_IGNORED:
+                del self._watches[wd]
+                continue
+            if mask & self.IN_DELETE_SELF:
+                continue
+
+            path = os.path.join(folder, name)
+            is_dir = bool(mask & self.IN_ISDIR)
+            if mask & (self.IN_CREATE | self.IN_MOVED_TO) and is_dir and self.is_recursive:
+                self._watch_tree(path, is_missing_ok=True)
+            if mask & self.IN_MOVED_FROM and is_dir:
+                self._unwatch_tree(path)
+            if mask & self.IN_CREATE:
+                events.append((CREATED, path, is_dir))
+            elif mask & self.IN_CLOSE_WRITE:
+                events.append((MODIFIED, path, is_dir))
+            elif mask & self.IN_MOVED_TO:
+                events.append((MOVED_TO, path, is_dir))
+            elif mask & self.IN_MOVED_FROM:
+                events.append((MOVED_FROM, path, is_dir))
+            elif mask & self.IN_DELETE:
+                events.append((DELETED, path, is_dir))
+
+        return events
+
+    def close(self):
+        """Stops watching and releases the inotify descriptor."""
+
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _unwatch_tree(self, folder: str):
+        """Removes the watches of a folder that was moved away.
+
+        Args:
+            folder: String path the folder had before the move.
+        """
+
+        prefix = os.path.join(folder, "")
+        for wd, path in list(self._watches.items()):
+            if path == folder or path.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+
+    def _watch_tree(self, folder: str, is_missing_ok: bool = False):
+        """Adds watches for folder and, if recursive, its subfolders.
+
+        Args:
+            folder: String path of folder.
+            is_missing_ok: Boolean whether vanished folders are ignored.
+
+        Raises:
+            OSError: If a watch can't be added.
+        """
+
+        pending = [folder]
+        while pending:
+            current = pending.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(current), self.WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if is_missing_ok and error in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(error, os.strerror(error), current)
+            self._watches[wd] = current
+            if not self.is_recursive:
+                continue
+            try:
+                with os.scandir(current) as entries:
+                    pending.extend(entry.path for entry in entries
+                                   if entry.is_dir(follow_symlinks=False))
+            except OSError:
+                if not is_missing_ok:
+                    raise
+
+BACKENDS = {
+    "inotify": InotifyBackend,
+}
+
+def create_backend(folders: list[str], is_recursive: bool, name: str | None = None):
+    """Creates the first event backend that works on this system.
+
+    Args:
+        folders: List of folder paths to watch.
+        is_recursive: Boolean whether subfolders are watched.
+        name: Optional backend name from BACKENDS to force.
+
+    Returns:
+        Backend object with read_events(timeout) and close().
+        None: If no backend is available, so callers fall back to polling.
+    """
+
+    names = [name] if name else _default_backends()
+    for backend_name in names:
+        try:
+            return BACKENDS[backend_name](folders, is_recursive)
+        except (OSError, AttributeError, KeyError):
+            continue
+
+    return None
+
+def _default_backends() -> list[str]:
+    """Returns the backend names to try on this platform.
+
+    Returns:
+        list: Backend names in order of preference.
+    """
+
+    if sys.platform.startswith("linux"):
+        return ["inotify"]
+    return []
+
+class FolderWatcher(threading.Thread):
+    """Thread debouncing backend events into batches of settled changes.
+
+    A path is handed on once no new event arrived for it for debounce
+    seconds, so a file that is written in several steps is indexed once.
+
+    Attributes:
+        backend: Event backend from create_backend.
+        debounce: Float seconds a path must stay quiet.
+        events_seen: Integer number of raw events received.
+    """
+
+    def __init__(self, backend, on_changes, debounce: float):
+        """Prepares the watcher thread.
+
+        Args:
+            backend: Event backend from create_backend.
+            on_changes: Callable receiving a dict of path: (kind, is_dir).
+            debounce: Float seconds a path must stay quiet.
+        """
+
+        super().__init__(name="folder-watcher", daemon=True)
+        self.backend = backend
+        self.debounce = debounce
+        self.events_seen = 0
+        self._on_changes = on_changes
+        self._pending = {}
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """Stops the thread and closes the backend."""
+
+        self._stop_event.set()
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                now = time.monotonic()
+                if self._pending:
+                    oldest = min(deadline for _kind, _is_dir, deadline in self._pending.values())
+                    timeout = min(max(0.0, oldest - now), 1.0)
+                else:
+                    timeout = 1.0
+                for kind, path, is_dir in self.backend.read_events(timeout):
+                    self.events_seen += 1
+                    self._pending[path] = (
+                        _merge_kinds(self._pending.get(path, (None,))[0], kind),
+                        is_dir,
+                        time.monotonic() + self.debounce
+                    )
+                self._flush(time.monotonic())
+        finally:
+            self.backend.close()
+
+    def _flush(self, now: float):
+        """Hands paths that stayed quiet for debounce seconds to on_changes.
+
+        Args:
+            now: Float time.monotonic() value.
+        """
+
+        settled = {
+            path: (kind, is_dir)
+            for path, (kind, is_dir, deadline) in self._pending.items()
+            if deadline <= now
+        }
+        if not settled:
+            return
+        for path in settled:
+            del self._pending[path]
+        self._on_changes(settled)
+
+def _merge_kinds(previous: str | None, kind: str) -> str:
+    """Combines two events on the same path into one.
+
+    A path that existed and was written again stays "created", everything
+    else takes the latest event.
+
+    Args:
+        previous: Kind of the pending event or None.
+        kind: Kind of the new event.
+
+    Returns:
+        str: Resulting kind.
+    """
+
+    if previous in (CREATED, MOVED_TO) and kind == MODIFIED:
+        return previous
+    return kind
@@ -2,36 +2,56 @@
 Indexing utilities for different file types.
 
 Provides functions for indexing all files in a folder with or without subfolders.
+Extraction and tokenization can be spread over a pool of worker processes while
+the calling process stays the single writer to the database.
 
 Typical usage:
     from backend.indexer import index_path
 
-    files_indexed = index_files(path, is_recursive=True, is_replace_full=False)
+    files_indexed = index_path(path, is_recursive=True, is_replace_full=False)
 """
 
 import os
+import stat
+import queue
+import hashlib
 import datetime
-import sqlite3
-from collections import Counter
-from backend.read import match_extractor # pylint: disable=import-error
+import multiprocessing
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from backend.read import match_extractor, extractor_version # pylint: disable=import-error
+from backend.walker import walk_files # pylint: disable=import-error
+from backend.connection import write_connection # pylint: disable=import-error
 from backend.database import ( # pylint: disable=import-error
-    initialise_db,
     enable_bulk_mode,
-    bulk_upsert_postings,
     disable_bulk_mode,
     get_or_create_doc_id,
-    delete_postings_for_doc_id,
+    fetch_doc_id,
     delete_documents,
-    update_metadata_from_doc_id
+    get_metadata_from_doc_id,
+    update_metadata_from_doc_id,
+    bump_index_generation,
+    create_posting_stage,
+    merge_posting_stage,
+    store_page_text,
+    delete_page_texts
 )
-from backend.tokenizer import tokenize # pylint: disable=import-error
+from backend.tokenizer import count_terms # pylint: disable=import-error
+from backend.packing import pack_text # pylint: disable=import-error
+from backend.writer import PostingWriter # pylint: disable=import-error
+from backend.settings import load_settings # pylint: disable=import-error
 
-APP_FOLDER = os.path.join(os.getenv("APPDATA"), "Hirmes")
-os.makedirs(APP_FOLDER, exist_ok=True)
+COMMIT_BATCH_SIZE = 256 # Documents written per transaction
+HASH_BLOCK_SIZE = 1 << 16 # Bytes hashed at the start and end of a file
+TASKS_PER_WORKER = 4 # Files queued per worker process
+PAGES_PER_CHUNK = 16 # Extracted pages a worker sends at once, a file holds at most two chunks
+QUEUE_POLL_SECONDS = 1 # How often a wait for pages checks for dead workers
 
-DB_PATH = os.path.join(APP_FOLDER, "index.db")
+_page_queues = None # Set in pool workers by _init_worker
 
-def index_path(path: str, is_recursive: bool, is_replace_full: bool) -> int:
+def index_path(path: str, is_recursive: bool, is_replace_full: bool,
+               is_bulk: bool = False, workers: int | None = None) -> int:
     """Indexes all files in a folder. Can be recursive.
 
     While indexing files get both renamed with a unique timestamp based ID
@@ -43,17 +63,42 @@ def index_path(path: str, is_recursive: bool, is_replace_full: bool) -> int:
         is_recursive: Boolean indicating if indexing is done recursively.
         is_replace_full: Boolean indicating if full filename will be 
                 replaced with ID.
+        is_bulk: Boolean for a bulk build: postings are loaded into an
+                unindexed staging table and the Posting table is rebuilt
+                and swapped in at the end. Much faster for the first index
+                of a large tree, but new postings only become searchable
+                at the end and the rebuild copies all existing postings.
+        workers: Optional integer number of extraction processes for this
+                run, the "index_workers" setting if None.
 
     Returns:
         number_files_found: Integer of how many files got indexed.
     """
 
-    result = _get_files_without_id(path, is_recursive)
-    number_files_found = result["number_files_found"]
-    files_without_id = result["file_paths"]
-    _index_files(files_without_id, is_replace_full)
+    return _index_files(_get_files_without_id(path, is_recursive), is_replace_full, is_bulk,
+                        workers)
 
-    return number_files_found
+def index_files(file_paths: list, is_replace_full: bool) -> int:
+    """Renames and indexes single files that don't have an ID yet.
+
+    Paths that no longer exist, aren't regular files or already contain
+    an ID are skipped.
+
+    Args:
+        file_paths: List of full paths to files.
+        is_replace_full: Boolean indicating if full filename will be
+                replaced with ID.
+
+    Returns:
+        int: Number of files indexed.
+    """
+
+    without_id = [
+        path for path in file_paths
+        if "★" not in os.path.basename(path) and os.path.isfile(path)
+    ]
+
+    return _index_files(without_id, is_replace_full)
 
 def _get_timestamp():
     """Returns current timestamp.
@@ -85,96 +130,306 @@ def _generate_new_path(file_path: str, is_replace_full: bool) -> str:
 
     return new_path
 
-def _index_files(to_index: list, is_replace_full: bool):
+def _index_files(to_index: Iterable[str], is_replace_full: bool, is_bulk: bool = False,
+                 workers: int | None = None) -> int:
     """Renames and indexes all files in to_index.
 
-    Exempt are files with a tuple value like this (path, False).
-    These are only renamed and not indexed.
+    to_index is consumed lazily, so files found by a running walk are
+    renamed and indexed while the walk goes on.
+
+    Extraction and tokenization run in a process pool when the
+    "index_workers" setting allows more than one worker. Results are
+    consumed in input order, so the database ends up identical to a
+    serial run. Postings are committed every COMMIT_BATCH_SIZE documents.
+    A path that is already indexed replaces its old postings and page texts.
+    The index generation is only bumped once a document was written.
 
     Args:
-        to_index: List of tuples (full_path, is_index)
+        to_index: Iterable of full paths
         is_replace_full: Boolean indicating whether full filename
                 is going to be replaced.
+        is_bulk: Boolean whether postings are staged and merged at the end
+                (see index_path).
+        workers: Optional integer number of extraction processes, the
+                "index_workers" setting if None.
+
+    Returns:
+        int: Number of files renamed.
     """
 
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        initialise_db(conn)
-        enable_bulk_mode(conn)
-        with conn:
-            token_cache = {}
-            for file_path in to_index:
-                new_path = _generate_new_path(file_path, is_replace_full)
-                os.rename(file_path, new_path)
-
-                extractor = match_extractor(new_path)
-                if not extractor:
-                    continue
-                content = extractor(new_path)
-                if not content:
+    settings = load_settings()
+    workers = _resolve_worker_count(settings["index_workers"] if workers is None else workers)
+    is_hash = settings["change_detection_hash"]
+    is_text = settings["store_page_text"]
+    is_positions = settings["store_positions"]
+    number_renamed = 0
+
+    def rename_all() -> Iterator[str]:
+        nonlocal number_renamed
+        for file_path in to_index:
+            number_renamed += 1
+            yield _rename_file(file_path, is_replace_full)
+
+    new_paths = rename_all()
+
+    with write_connection() as conn:
+        writer = PostingWriter(conn, settings["posting_batch_size"], is_staging=is_bulk)
+        is_changed = False
+        try:
+            enable_bulk_mode(conn)
+            if is_bulk:
+                create_posting_stage(conn)
+            pending_commit = 0
+            for new_path, pages in _extract_all(new_paths, workers, is_text, is_positions):
+                doc_id = None
+                for page_idx, (token_tf_pairs, text) in enumerate(pages, start=1):
+                    if doc_id is None:
+                        is_changed = True
+                        metadata = {
+                            "last_indexed": str(datetime.datetime.today()),
+                            **_file_signature(new_path, os.stat(new_path), {}, is_hash)
+                        }
+                        doc_id = fetch_doc_id(conn, new_path)
+                        if doc_id is None:
+                            doc_id = get_or_create_doc_id(conn, new_path, metadata=metadata)
+                        else:
+                            update_metadata_from_doc_id(conn, doc_id, metadata)
+                            writer.delete_doc(doc_id)
+                            delete_page_texts(conn, doc_id)
+                    writer.add(doc_id, page_idx, token_tf_pairs)
+                    if text is not None:
+                        store_page_text(conn, doc_id, page_idx, text)
+                if doc_id is None:
                     continue
-                pages = [tokenize(page) for page in content]
-                metadata = {"last_indexed": str(datetime.datetime.today())}
-                doc_id = get_or_create_doc_id(conn, new_path, metadata=metadata)
-
-                for page_idx, tokens in enumerate(pages, start=1):
-                    counts = Counter(tokens)                     # token -> tf (on that page)
-                    token_tf_pairs = list(counts.items())
-                    bulk_upsert_postings(
-                        conn,
-                        token_tf_pairs,
-                        doc_id, page_idx,
-                        _token_cache=token_cache
-                    )
+
+                pending_commit += 1
+                if pending_commit >= COMMIT_BATCH_SIZE:
+                    writer.flush()
+                    conn.commit()
+                    bump_index_generation()
+                    pending_commit = 0
+        finally:
+            writer.flush()
+            conn.commit()
+            if is_bulk:
+                merge_posting_stage(conn)
+            if is_changed:
+                bump_index_generation()
+            disable_bulk_mode(conn)
+
+    return number_renamed
+
+def _rename_file(file_path: str, is_replace_full: bool) -> str:
+    """Renames file_path to a new path with timestamp ID.
+
+    Args:
+        file_path: String of original file path.
+        is_replace_full: Boolean if full name should be replaced.
+
+    Returns:
+        new_path: String of new path with timestamp ID.
+    """
+
+    new_path = _generate_new_path(file_path, is_replace_full)
+    os.rename(file_path, new_path)
+
+    return new_path
+
+def _iter_page_counts(path: str, is_text: bool, is_positions: bool) -> Iterator[tuple]:
+    """Extracts and tokenizes a file page by page.
+
+    Only the text of the current page is held in memory.
+
+    Args:
+        path: String of full path to file.
+        is_text: Boolean whether to also return the compressed page text.
+        is_positions: Boolean whether to also return token positions.
+
+    Yields:
+        (list, bytes | None): (token_text, tf) or (token_text, tf, positions)
+                tuples of one page and its text from packing.pack_text
+                (None if not is_text). Nothing if the file type is
+                unsupported or extraction fails.
+    """
+
+    extractor = match_extractor(path)
+    if not extractor:
+        return
+    for page in extractor(path):
+        yield count_terms(page, is_positions), pack_text(page) if is_text else None
+
+def _init_worker(page_queues: list):
+    """Hands the page queues to a pool worker process.
+
+    Args:
+        page_queues: List of multiprocessing queues, one per task slot.
+    """
+
+    global _page_queues # pylint: disable=global-statement
+    _page_queues = page_queues
+
+def _extract_to_queue(slot: int, path: str, is_text: bool, is_positions: bool,
+                      chunk_size: int):
+    """Puts the pages of a file into the page queue of slot in chunks.
+
+    Runs inside pool worker processes, so it must stay a module level
+    function that only touches the file system. The queue holds a single
+    chunk and put blocks while it is full, so a file never has more than
+    two chunks of pages extracted ahead of the writer.
+
+    Args:
+        slot: Integer index into the page queues of _init_worker.
+        path: String of full path to file.
+        is_text: Boolean whether to also compress the page texts.
+        is_positions: Boolean whether to also collect token positions.
+        chunk_size: Integer number of pages per chunk.
+    """
+
+    page_queue = _page_queues[slot]
+    chunk = []
+    try:
+        for page in _iter_page_counts(path, is_text, is_positions):
+            if len(chunk) == chunk_size:
+                page_queue.put((chunk, False))
+                chunk = []
+            chunk.append(page)
     finally:
-        conn.commit()
-        disable_bulk_mode(conn)
-        conn.close()
+        page_queue.put((chunk, True))
+
+def _next_chunk(page_queue, future) -> tuple[list, bool]:
+    """Returns the next chunk of pages a worker put into page_queue.
+
+    Args:
+        page_queue: Multiprocessing queue of the task.
+        future: Future of the _extract_to_queue task.
+
+    Returns:
+        (list, bool): Pages from _iter_page_counts and whether they
+                are the last of the file.
+
+    Raises:
+        Exception: What the task raised if it died without finishing
+                the queue, e.g. BrokenProcessPool.
+    """
+
+    while True:
+        try:
+            return page_queue.get(timeout=QUEUE_POLL_SECONDS)
+        except queue.Empty:
+            if future.done() and future.exception() is not None:
+                future.result()
+
+def _resolve_worker_count(setting: int) -> int:
+    """Turns the "index_workers" setting into a worker count.
+
+    Args:
+        setting: Integer from config. 0 or less means one per CPU.
+
+    Returns:
+        int: Number of worker processes to use (at least 1).
+    """
+
+    if setting is None or setting <= 0:
+        return os.cpu_count() or 1
+    return setting
+
+def _extract_all(paths, workers: int, is_text: bool, is_positions: bool):
+    """Yields (path, pages) for every path, in input order.
+
+    With a single worker extraction runs in-process and pages are
+    streamed straight from the extractor. Otherwise at most
+    TASKS_PER_WORKER files per worker are in flight at once and each
+    streams its pages through its own queue in chunks of PAGES_PER_CHUNK,
+    so neither large folders nor documents with many pages pile up in
+    memory while the writer catches up.
 
-def _get_files_without_id(path: str, is_recursive: bool) -> dict:
+    Args:
+        paths: Iterable of full paths.
+        workers: Integer number of worker processes.
+        is_text: Boolean whether pages include their compressed text.
+        is_positions: Boolean whether pages include token positions.
+
+    Yields:
+        (str, Iterable): Path and its pages from _iter_page_counts.
+    """
+
+    if workers <= 1:
+        for path in paths:
+            yield path, _iter_page_counts(path, is_text, is_positions)
+        return
+
+    max_in_flight = workers * TASKS_PER_WORKER
+    context = multiprocessing.get_context()
+    page_queues = [context.Queue(1) for _ in range(max_in_flight)]
+    free_slots = deque(range(max_in_flight))
+    in_flight = deque()
+
+    def pages(slot, future) -> Iterator[tuple]:
+        is_last = False
+        while not is_last:
+            chunk, is_last = _next_chunk(page_queues[slot], future)
+            yield from chunk
+        in_flight.popleft()
+        free_slots.append(slot)
+        future.result()
+
+    def take_first() -> Iterator[tuple]:
+        slot, path, future = in_flight[0]
+        document = pages(slot, future)
+        yield path, document
+        for _page in document: # Pages the caller didn't read
+            pass
+
+    with ProcessPoolExecutor(workers, context, _init_worker, (page_queues,)) as executor:
+        try:
+            for path in paths:
+                if not free_slots:
+                    yield from take_first()
+                slot = free_slots.popleft()
+                future = executor.submit(_extract_to_queue, slot, path, is_text,
+                                         is_positions, PAGES_PER_CHUNK)
+                in_flight.append((slot, path, future))
+            while in_flight:
+                yield from take_first()
+        finally:
+            # Started tasks block on their full queues until emptied
+            for _slot, _path, future in in_flight:
+                future.cancel()
+            for slot, _path, future in in_flight:
+                if not future.cancelled():
+                    while not _next_chunk(page_queues[slot], future)[1]:
+                        pass
+
+def _get_files_without_id(path: str, is_recursive: bool) -> Iterator[str]:
     """Finds all files in path that don't have an ID.
 
-    Can be set to be recursive.
+    Can be set to be recursive. Uses the "walk_workers" and
+    "ignore_patterns" settings.
 
     Args:
         path: String indicating the relative or full path of a folder
         is_recursive: Boolean if files should be found recursively
 
-    Returns:
-        dict:
-            number_files_found: Integer
-            files_paths: Tuple (full path, is_index)
-                    is_index denotes whether file should be indexed
-                    or just renamed.
+    Yields:
+        str: Full path of every file without "★" in its name.
     """
 
-    files_found = 0
-    without_id = []
-
-    try:
-        objects = os.listdir(path)
-    except FileNotFoundError:
-        return {"number_files_found": files_found, "file_paths": without_id}
-
-    for file_name in objects:
-        full_path = os.path.join(path, file_name)
-        if os.path.isdir(full_path) and is_recursive:
-            recursive_result = _get_files_without_id(full_path, is_recursive)
-            files_found += recursive_result["number_files_found"]
-            without_id += recursive_result["file_paths"]
-        elif os.path.isfile(full_path):
-            if "★" not in file_name:
-                if os.stat(full_path).st_size != 0 and match_extractor(full_path) is not None:
-                    without_id.append(full_path)
-                else:
-                    without_id.append(full_path)
-                files_found += 1
-
-    return {"number_files_found": files_found, "file_paths": without_id}
+    settings = load_settings()
+    for entry in walk_files(path, is_recursive, settings["ignore_patterns"],
+                            settings["walk_workers"]):
+        if "★" not in entry.name:
+            yield entry.path
 
 def repeat_indexing(conn, to_index: list) -> tuple[int]:
     """Given a list of file paths, reindexes documents
 
+    Files whose modification time and size still match the metadata stored
+    at the last indexing are skipped after a single os.stat. If only those
+    changed, the optional content hash decides. Skipped files just get a new
+    "last_indexed" timestamp. The index generation is only bumped if a
+    document was reextracted or deleted, so caches survive runs that find
+    nothing new.
+
     Args:
         conn: SQLite3 connection object
         to_index: List of file paths in str format
@@ -184,39 +439,126 @@ def repeat_indexing(conn, to_index: list) -> tuple[int]:
     """
     files_reindexed = 0 
     to_delete = []
-    initialise_db(conn)
+    is_changed = False
+    settings = load_settings()
+    is_hash = settings["change_detection_hash"]
+    is_text = settings["store_page_text"]
+    is_positions = settings["store_positions"]
+    writer = PostingWriter(conn, settings["posting_batch_size"])
     enable_bulk_mode(conn)
     with conn:
-        token_cache = {}
         for file_path in to_index:
             doc_id = get_or_create_doc_id(conn, file_path)
-            delete_postings_for_doc_id(conn, doc_id)
-            if not os.path.isfile(file_path):
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                file_stat = None
+            if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
+                is_changed = True
+                writer.delete_doc(doc_id)
+                delete_page_texts(conn, doc_id)
                 to_delete.append(file_path)
                 continue
-            extractor = match_extractor(file_path)
-            if not extractor:
-                continue
-            content = extractor(file_path)
-            if not content:
+
+            now = str(datetime.datetime.today())
+            metadata = get_metadata_from_doc_id(conn, doc_id) or {}
+            signature = _file_signature(file_path, file_stat, metadata, is_hash)
+            if _is_unchanged(metadata, signature):
+                update_metadata_from_doc_id(conn, doc_id, {"last_indexed": now, **signature})
                 continue
-            pages = [tokenize(page) for page in content]
-            doc_id = get_or_create_doc_id(conn, file_path)
-            update_metadata_from_doc_id(conn, doc_id, {"last_indexed": str(datetime.datetime.today())})
-
-            for page_idx, tokens in enumerate(pages, start=1):
-                counts = Counter(tokens)                     # token -> tf (on that page)
-                token_tf_pairs = list(counts.items())
-                bulk_upsert_postings(
-                    conn,
-                    token_tf_pairs,
-                    doc_id, page_idx,
-                    _token_cache=token_cache
-                )
-            files_reindexed += 1
+
+            is_changed = True
+            writer.delete_doc(doc_id)
+            delete_page_texts(conn, doc_id)
+            is_extracted = False
+            pages = _iter_page_counts(file_path, is_text, is_positions)
+            for page_idx, (token_tf_pairs, text) in enumerate(pages, start=1):
+                if not is_extracted:
+                    update_metadata_from_doc_id(conn, doc_id, {"last_indexed": now, **signature})
+                    is_extracted = True
+                writer.add(doc_id, page_idx, token_tf_pairs)
+                if text is not None:
+                    store_page_text(conn, doc_id, page_idx, text)
+            if is_extracted:
+                files_reindexed += 1
+        writer.flush()
 
     delete_documents(conn, to_delete)
     conn.commit()
+    if is_changed:
+        bump_index_generation()
     disable_bulk_mode(conn)
     
-    return files_reindexed, len(to_delete)
\ No newline at end of file
+    return files_reindexed, len(to_delete)
+
+def _file_signature(path: str, file_stat, metadata: dict, is_hash: bool) -> dict:
+    """Returns the change detection metadata of a file.
+
+    The content hash is only computed when the file has none stored yet
+    or its modification time or size changed, so unchanged files cost
+    nothing beyond the os.stat.
+
+    Args:
+        path: String of full path to file.
+        file_stat: os.stat_result of the file.
+        metadata: Dictionary of metadata stored at the last indexing.
+        is_hash: Boolean whether to compute a content hash.
+
+    Returns:
+        dict: "mtime", "size", "hash" (None if disabled) and "extractor"
+                (see read.extractor_version).
+    """
+
+    signature = {"mtime": file_stat.st_mtime, "size": file_stat.st_size, "hash": None,
+                 "extractor": extractor_version(path)}
+    if is_hash:
+        if (metadata.get("hash") and metadata.get("mtime") == signature["mtime"]
+                and metadata.get("size") == signature["size"]):
+            signature["hash"] = metadata["hash"]
+        else:
+            signature["hash"] = _content_hash(path, file_stat.st_size)
+
+    return signature
+
+def _is_unchanged(metadata: dict, signature: dict) -> bool:
+    """Returns whether a file still matches its stored metadata.
+
+    Args:
+        metadata: Dictionary of metadata stored at the last indexing.
+        signature: Dictionary from _file_signature.
+
+    Returns:
+        bool: True if the file doesn't need to be extracted again.
+    """
+
+    if (metadata.get("size") != signature["size"]
+            or metadata.get("extractor", 1) != signature["extractor"]):
+        return False
+    if metadata.get("mtime") == signature["mtime"]:
+        return True
+
+    return signature["hash"] is not None and metadata.get("hash") == signature["hash"]
+
+def _content_hash(path: str, size: int) -> str | None:
+    """Hashes the first and last HASH_BLOCK_SIZE bytes of a file.
+
+    Args:
+        path: String of full path to file.
+        size: Integer file size in bytes.
+
+    Returns:
+        str: Hex digest.
+        None: If the file can't be read.
+    """
+
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, 'rb') as file:
+            digest.update(file.read(HASH_BLOCK_SIZE))
+            if size > HASH_BLOCK_SIZE:
+                file.seek(max(HASH_BLOCK_SIZE, size - HASH_BLOCK_SIZE))
+                digest.update(file.read(HASH_BLOCK_SIZE))
+    except OSError:
+        return None
+
+    return digest.hexdigest()
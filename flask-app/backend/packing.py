@@ -0,0 +1,275 @@
+"""
+Packed page lists for the Posting table.
+
+Schema version 2 stores one Posting row per (token, document). Its pages
+column holds the (page, tf) pairs of all pages as unsigned LEB128 varints:
+the page as delta to the previous page, then the tf. Single page documents
+(TXT, MD, DOCX) with tf < 128 take two bytes.
+
+The Position table stores where a token occurs in the same way: per page
+the page delta, the number of positions and the positions as deltas.
+
+The aggregates and the scalar functions are registered on every connection
+by database.initialise_db, so SQL can pack and merge page lists directly.
+
+The PageText table keeps the extracted text of every page for snippets,
+compressed with pack_text.
+
+Typical usage:
+    blob = pack_pages([(1, 3), (4, 1)])
+    pairs = unpack_pages(blob)
+    positions = unpack_positions(pack_positions([(1, [0, 7])]))
+    text = unpack_text(pack_text(text))
+"""
+
+import zlib
+from array import array
+from collections.abc import Iterable
+
+TEXT_COMPRESSION_LEVEL = 3 # zlib level of PageText, higher slows down indexing for little gain
+
+def pack_pages(page_tfs: Iterable[tuple]) -> bytes:
+    """Encodes (page, tf) pairs sorted by page.
+
+    Args:
+        page_tfs: Iterable of (page, tf) with ascending, unique pages.
+
+    Returns:
+        bytes: Varint delta encoded page list.
+    """
+
+    packed = bytearray()
+    previous = 0
+    for page, tf in page_tfs:
+        for value in (page - previous, tf):
+            while value >= 0x80:
+                packed.append(value & 0x7F | 0x80)
+                value >>= 7
+            packed.append(value)
+        previous = page
+
+    return bytes(packed)
+
+def unpack_pages(blob: bytes) -> list[tuple]:
+    """Decodes a page list of pack_pages.
+
+    Args:
+        blob: Bytes from pack_pages.
+
+    Returns:
+        list: (page, tf) tuples in ascending page order.
+    """
+
+    if len(blob) == 2 and blob[0] < 0x80 and blob[1] < 0x80:
+        return [(blob[0], blob[1])]
+
+    pairs = []
+    values = []
+    value = shift = 0
+    page = 0
+    for byte in blob:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value)
+        value = shift = 0
+        if len(values) == 2:
+            page += values[0]
+            pairs.append((page, values[1]))
+            values.clear()
+
+    return pairs
+
+def merge_page_blobs(*blobs: bytes) -> bytes:
+    """Combines page lists, summing the tf of pages present in several.
+
+    Args:
+        blobs: Bytes from pack_pages, None is skipped.
+
+    Returns:
+        bytes: One packed page list.
+    """
+
+    blobs = [blob for blob in blobs if blob]
+    if len(blobs) == 1:
+        return blobs[0]
+    tfs = {}
+    for blob in blobs:
+        for page, tf in unpack_pages(blob):
+            tfs[page] = tfs.get(page, 0) + tf
+
+    return pack_pages(sorted(tfs.items()))
+
+def _append_varint(packed: bytearray, value: int):
+    """Appends value to packed as unsigned LEB128 varint."""
+
+    while value >= 0x80:
+        packed.append(value & 0x7F | 0x80)
+        value >>= 7
+    packed.append(value)
+
+def _iter_varints(blob: bytes) -> Iterable[int]:
+    """Yields the unsigned LEB128 varints of blob."""
+
+    value = shift = 0
+    for byte in blob:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        yield value
+        value = shift = 0
+
+def pack_positions(page_positions: Iterable[tuple]) -> bytes:
+    """Encodes the token positions of a document.
+
+    Args:
+        page_positions: Iterable of (page, positions) with ascending,
+                unique pages and ascending positions per page.
+
+    Returns:
+        bytes: Varint delta encoded position list.
+    """
+
+    packed = bytearray()
+    previous_page = 0
+    for page, positions in page_positions:
+        _append_varint(packed, page - previous_page)
+        _append_varint(packed, len(positions))
+        previous = 0
+        for position in positions:
+            _append_varint(packed, position - previous)
+            previous = position
+        previous_page = page
+
+    return bytes(packed)
+
+def unpack_positions(blob: bytes) -> dict:
+    """Decodes a position list of pack_positions.
+
+    Args:
+        blob: Bytes from pack_positions.
+
+    Returns:
+        dict: page: array('I') of ascending positions.
+    """
+
+    pages = {}
+    values = _iter_varints(blob)
+    page = 0
+    for page_delta in values:
+        page += page_delta
+        positions = array('I')
+        position = 0
+        for _ in range(next(values)):
+            position += next(values)
+            positions.append(position)
+        pages[page] = positions
+
+    return pages
+
+def merge_position_blobs(*blobs: bytes) -> bytes:
+    """Combines position lists, uniting the positions of pages present in several.
+
+    Args:
+        blobs: Bytes from pack_positions, None is skipped.
+
+    Returns:
+        bytes: One packed position list.
+    """
+
+    blobs = [blob for blob in blobs if blob]
+    if len(blobs) == 1:
+        return blobs[0]
+    pages = {}
+    for blob in blobs:
+        for page, positions in unpack_positions(blob).items():
+            pages.setdefault(page, set()).update(positions)
+
+    return pack_positions((page, sorted(positions)) for page, positions in sorted(pages.items()))
+
+def pack_text(text: str) -> bytes:
+    """Compresses the text of one page for the PageText table.
+
+    Args:
+        text: String page text.
+
+    Returns:
+        bytes: zlib compressed UTF-8.
+    """
+
+    return zlib.compress(text.encode("utf-8", errors="replace"), TEXT_COMPRESSION_LEVEL)
+
+def unpack_text(blob: bytes) -> str:
+    """Decompresses a page text of pack_text.
+
+    Args:
+        blob: Bytes from pack_text.
+
+    Returns:
+        str: Page text.
+    """
+
+    return zlib.decompress(blob).decode("utf-8", errors="replace")
+
+class PackPages:
+    """SQL aggregate pack_pages(page, tf) building a page list per group."""
+
+    def __init__(self):
+        self.tfs = {}
+
+    def step(self, page: int, tf: int):
+        """Adds one row of the group."""
+
+        self.tfs[page] = self.tfs.get(page, 0) + tf
+
+    def finalize(self) -> bytes:
+        """Returns the packed page list of the group."""
+
+        return pack_pages(sorted(self.tfs.items()))
+
+class MergePositions:
+    """SQL aggregate merge_positions(positions) combining position lists per group."""
+
+    def __init__(self):
+        self.blobs = []
+
+    def step(self, blob: bytes):
+        """Adds one row of the group."""
+
+        self.blobs.append(blob)
+
+    def finalize(self) -> bytes:
+        """Returns the merged position list of the group."""
+
+        return merge_position_blobs(*self.blobs)
+
+class MergePages:
+    """SQL aggregate merge_pages(pages) combining packed page lists per group."""
+
+    def __init__(self):
+        self.blobs = []
+
+    def step(self, blob: bytes):
+        """Adds one row of the group."""
+
+        self.blobs.append(blob)
+
+    def finalize(self) -> bytes:
+        """Returns the merged page list of the group."""
+
+        return merge_page_blobs(*self.blobs)
+
+def register_functions(conn):
+    """Makes the page and position list functions available in SQL.
+
+    Args:
+        conn: SQLite3 connection object
+    """
+
+    conn.create_aggregate("pack_pages", 2, PackPages)
+    conn.create_aggregate("merge_pages", 1, MergePages)
+    conn.create_function("merge_page_blobs", 2, merge_page_blobs, deterministic=True)
+    conn.create_aggregate("merge_positions", 1, MergePositions)
+    conn.create_function("merge_position_blobs", 2, merge_position_blobs, deterministic=True)
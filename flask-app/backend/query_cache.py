@@ -0,0 +1,180 @@
+"""
+LRU caches of search results and posting lists with a memory budget.
+
+Entries belong to one index generation. When the generation changes,
+because documents were indexed, reindexed or deleted, the next access
+drops every entry. Entries can also expire after a number of seconds,
+and the least recently used ones are evicted when the cache exceeds its
+number of entries or its memory budget. Sizes are estimated by the caller.
+
+Typical usage:
+    from backend.query_cache import RESULT_CACHE
+
+    generation = get_index_generation()
+    results = RESULT_CACHE.get(key)
+    if results is None:
+        results = compute()
+        RESULT_CACHE.put(key, results, estimate_size(results), generation)
+    print(RESULT_CACHE.stats())
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from backend.database import get_index_generation # pylint: disable=import-error
+from backend.settings import load_settings # pylint: disable=import-error
+
+MB = 1024 * 1024
+
+class QueryCache:
+    """Dictionary of key: value with LRU, TTL and memory bounds.
+
+    Attributes:
+        max_entries: Integer number of entries kept, 0 for no limit.
+        ttl: Seconds an entry stays valid, 0 for no expiry.
+        max_bytes: Integer estimated bytes kept, 0 disables the cache.
+        generation: Index generation the entries belong to.
+        hits: Integer number of lookups answered from the cache.
+        misses: Integer number of lookups not found.
+        evictions: Integer number of entries dropped by the bounds.
+        expirations: Integer number of entries dropped by the TTL.
+    """
+
+    def __init__(self, max_entries: int = 0, ttl: float = 0, max_bytes: int = 0):
+        """Creates an empty cache.
+
+        Args:
+            max_entries: Integer number of entries kept, 0 for no limit.
+            ttl: Seconds an entry stays valid, 0 for no expiry.
+            max_bytes: Integer estimated bytes kept, 0 disables the cache.
+        """
+
+        self.max_entries = max(0, max_entries)
+        self.ttl = max(0, ttl)
+        self.max_bytes = max(0, max_bytes)
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        """Drops all entries, the counters are kept."""
+
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get(self, key):
+        """Returns the cached value of key.
+
+        Args:
+            key: Hashable key.
+
+        Returns:
+            The value stored with put or None if it isn't cached.
+        """
+
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        return entry[0]
+
+    def put(self, key, value, size: int, generation: int):
+        """Stores value under key.
+
+        Nothing is stored if the index changed since generation, so
+        values computed from an older index are never cached.
+
+        Args:
+            key: Hashable key.
+            value: Object to cache, not copied.
+            size: Integer estimated size of value in bytes.
+            generation: Index generation value was computed at.
+        """
+
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._sync()
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            expires = time.monotonic() + self.ttl if self.ttl else None
+            self._entries[key] = (value, size, expires)
+            self._bytes += size
+            self._evict()
+
+    def stats(self) -> dict:
+        """Returns the size and counters of the cache.
+
+        Returns:
+            dict: "size", "bytes", "max_entries", "max_bytes", "hits",
+                    "misses", "hit_rate", "evictions", "expirations"
+        """
+
+        lookups = self.hits + self.misses
+
+        return {
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _sync(self):
+        """Drops all entries if the index changed since they were stored.
+
+        Must be called while holding _lock.
+        """
+
+        current = get_index_generation()
+        if self.generation != current:
+            self._entries.clear()
+            self._bytes = 0
+            self.generation = current
+
+    def _drop(self, key):
+        """Removes one entry. Must be called while holding _lock."""
+
+        _value, size, _expires = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        """Drops least recently used entries beyond the bounds.
+
+        Must be called while holding _lock.
+        """
+
+        while self._entries and (self._bytes > self.max_bytes or (
+                self.max_entries and len(self._entries) > self.max_entries)):
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+_settings = load_settings()
+RESULT_CACHE = QueryCache(_settings["result_cache_size"], _settings["result_cache_ttl"],
+                          _settings["result_cache_mb"] * MB)
+POSTING_CACHE = QueryCache(max_bytes=_settings["posting_cache_mb"] * MB)
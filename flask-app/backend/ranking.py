@@ -0,0 +1,191 @@
+"""
+BM25 scoring of search results.
+
+Document lengths, the number of documents and their average length come
+from the statistics tables the indexer keeps up to date, document
+frequencies from the posting lists of the query terms. Pages are summed,
+so a document is scored as a whole.
+
+top_k keeps the best k documents in a heap and uses per-term score upper
+bounds (from TokenStats.max_tf) to skip documents that can't reach the
+heap anymore (MaxScore). For OR queries, documents that only contain
+low-bound terms are never visited at all.
+
+Typical usage:
+    from backend.ranking import Bm25, top_k
+
+    bm25 = Bm25(doc_count, avg_length)
+    score = bm25.score(term_tfs, dfs, length)
+    best = top_k(terms, bm25, lengths, k=20)
+"""
+
+import math
+import heapq
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+BM25_K1 = 1.2 # Term frequency saturation
+BM25_B = 0.75 # Strength of the document length normalisation
+
+class Bm25:
+    """BM25 scorer for one corpus state.
+
+    Attributes:
+        doc_count: Integer number of documents with postings.
+        avg_length: Float average number of tokens per document.
+        k1: Float term frequency saturation.
+        b: Float length normalisation between 0 and 1.
+    """
+
+    def __init__(self, doc_count: int, avg_length: float, k1: float = BM25_K1, b: float = BM25_B):
+        self.doc_count = doc_count
+        self.avg_length = avg_length or 1.0
+        self.k1 = k1
+        self.b = b
+
+    def idf(self, df: int) -> float:
+        """Returns the inverse document frequency of a term.
+
+        Uses the +1 variant, so terms in more than half of the documents
+        still score above 0.
+
+        Args:
+            df: Integer number of documents containing the term.
+
+        Returns:
+            float: Weight of the term.
+        """
+
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+    def term_score(self, tf: int, df: int, length: int) -> float:
+        """Returns the contribution of one term to a document's score.
+
+        Args:
+            tf: Integer occurrences of the term in the document.
+            df: Integer number of documents containing the term.
+            length: Integer number of tokens of the document.
+
+        Returns:
+            float: Partial score.
+        """
+
+        norm = self.k1 * (1 - self.b + self.b * length / self.avg_length)
+        return self.idf(df) * tf * (self.k1 + 1) / (tf + norm)
+
+    def upper_bound(self, df: int, max_tf: int) -> float:
+        """Returns a score no document can exceed for a term.
+
+        Takes the highest tf of the term and the shortest possible document.
+
+        Args:
+            df: Integer number of documents containing the term.
+            max_tf: Integer highest occurrences of the term in one document.
+
+        Returns:
+            float: Upper bound of term_score.
+        """
+
+        return self.idf(df) * max_tf * (self.k1 + 1) / (max_tf + self.k1 * (1 - self.b))
+
+    def score(self, term_tfs: dict, dfs: dict, length: int) -> float:
+        """Returns the BM25 score of a document.
+
+        Args:
+            term_tfs: Dictionary of term: occurrences in the document.
+            dfs: Dictionary of term: number of documents containing it.
+            length: Integer number of tokens of the document.
+
+        Returns:
+            float: Sum of the term scores.
+        """
+
+        return sum(self.term_score(tf, dfs[term], length) for term, tf in term_tfs.items())
+
+def top_k(terms: list[tuple], bm25: Bm25, lengths, k: int, candidates=None) -> list[tuple]:
+    """Returns the k best scoring documents.
+
+    Terms are ordered by upper bound. Once the heap is full, a document
+    stops being scored as soon as its partial score plus the bounds of the
+    remaining terms can't beat the worst document in the heap. Without
+    candidates, the low-bound terms whose bounds together can't reach the
+    heap are only probed, never iterated.
+
+    Args:
+        terms: List of (doc_ids, doc_tfs, df, max_tf) per query term, doc_ids
+                sorted as in engine.PostingList.
+        bm25: Bm25 scorer.
+        lengths: doc_id indexable lengths in tokens (dict or array).
+        k: Integer number of documents to return, at least 1.
+        candidates: Optional sorted doc_ids matching the query. Without,
+                every document containing any term matches (OR query).
+
+    Returns:
+        list: (score, doc_id) tuples, best first, ties by ascending doc_id.
+    """
+
+    # Bounds get a little headroom, they are summed in a different order than scores
+    terms = sorted(
+        ((bm25.upper_bound(df, max_tf) * (1 + 1e-9), doc_ids, doc_tfs, df)
+         for doc_ids, doc_tfs, df, max_tf in terms),
+        key=lambda term: term[0]
+    )
+    bounds = list(accumulate(bound for bound, _doc_ids, _doc_tfs, _df in terms))
+    cursors = [0] * len(terms)
+    heap = []
+    threshold = -1.0
+    essential = 0 # terms[essential:] can still get a document into the heap on their own
+
+    def probe(i: int, doc_id: int) -> int:
+        """Returns the tf of doc_id in terms[i], moving its cursor forward."""
+
+        doc_ids = terms[i][1]
+        position = bisect_left(doc_ids, doc_id, cursors[i])
+        cursors[i] = position
+        if position < len(doc_ids) and doc_ids[position] == doc_id:
+            return terms[i][2][position]
+        return 0
+
+    def finish(doc_id: int, score: float, last: int):
+        """Adds terms[last::-1] to score and pushes doc_id if it qualifies."""
+
+        nonlocal threshold, essential
+        try:
+            length = lengths[doc_id] or bm25.avg_length
+        except (IndexError, KeyError):
+            length = bm25.avg_length
+        for i in range(last, -1, -1):
+            if score + bounds[i] <= threshold:
+                return
+            tf = probe(i, doc_id)
+            if tf:
+                score += bm25.term_score(tf, terms[i][3], length)
+        if len(heap) < k:
+            heapq.heappush(heap, (score, -doc_id))
+        elif score > threshold:
+            heapq.heapreplace(heap, (score, -doc_id))
+        else:
+            return
+        if len(heap) == k:
+            threshold = heap[0][0]
+            while essential < len(terms) and bounds[essential] <= threshold:
+                essential += 1
+
+    if candidates is not None:
+        for doc_id in candidates:
+            finish(doc_id, 0.0, len(terms) - 1)
+    else:
+        while essential < len(terms):
+            current = [
+                terms[i][1][cursors[i]]
+                for i in range(essential, len(terms))
+                if cursors[i] < len(terms[i][1])
+            ]
+            if not current:
+                break
+            doc_id = min(current)
+            finish(doc_id, 0.0, len(terms) - 1)
+            for i in range(essential, len(terms)):
+                cursors[i] = bisect_right(terms[i][1], doc_id, cursors[i])
+
+    return [(score, -negative_id) for score, negative_id in sorted(heap, reverse=True)]
@@ -1,16 +1,28 @@
 """
 Document reading utilities for extracting text.
 
+Every extractor is a generator that yields the text of one page at a time,
+so only a single page has to be held in memory. Plain text and markdown
+files have no pages and are split into chunks of TEXT_CHUNK_SIZE characters
+at line boundaries instead.
+
 Typical usage:
-    file_func = matchextractor(file_path)
-    content = file_func(file_path, False)
+    file_func = match_extractor(file_path)
+    for page in file_func(file_path):
+        ...
 """
 
 from pathlib import Path
+from collections.abc import Iterator
 import pymupdf
 import docx2txt
 from pptx import Presentation
 
+TEXT_CHUNK_SIZE = 1 << 20 # Characters per page of txt / md files
+# Raised when an extractor splits files into different pages, files indexed
+# with an older version are reindexed. 2: pptx yields one page per slide.
+EXTRACTOR_VERSIONS = {"pptx": 2}
+
 def match_extractor(path: str):
     """Higher-level function returning appropriate extraction function for file.
 
@@ -35,94 +47,136 @@ def match_extractor(path: str):
         return extractors[ext]
     return None
 
-def txt(path: str) -> list | None:
+def extractor_version(path: str) -> int:
+    """Returns the version of the extractor for a file.
+
+    Args:
+        path: String of full path to file.
+
+    Returns:
+        int: Version from EXTRACTOR_VERSIONS, 1 if not listed.
+    """
+
+    return EXTRACTOR_VERSIONS.get(Path(path).suffix.lower().lstrip("."), 1)
+
+def txt(path: str) -> Iterator[str]:
     """Extracts text from txt file.
 
     Args:
         path: String of full path to file.
         
-    Returns:
-        list: One item list of text string.
-        None: If extraction fails.
+    Yields:
+        str: Chunk of at most about TEXT_CHUNK_SIZE characters.
+                Nothing if extraction fails.
     """
 
     if not Path(path).is_file():
-        return None
+        return
     with open(path, 'r', encoding='utf-8', errors='ignore') as file:
-        raw_content = file.read()
-    return [raw_content]
+        yield from _chunk_lines(file)
 
-def pdf(path: str) -> list | None:
+def pdf(path: str) -> Iterator[str]:
     """Extracts text from pdf file.
 
     Args:
         path: String of full path to file.
 
-    Returns:
-        list: One string per page.
-        None: If extraction fails.
+    Yields:
+        str: Text of one page. Stops early if extraction fails.
     """
 
     try:
         document = pymupdf.open(path)
-        pages = [page.get_text() for page in document]
-        return pages
     except Exception:
-        return None
-
-def docx(path: str) -> list | None:
+        return
+    with document:
+        try:
+            for page in document:
+                yield page.get_text()
+        except Exception:
+            return
+
+def docx(path: str) -> Iterator[str]:
     """Extracts text from docx file.
 
+    docx2txt can only read the whole document, so this yields once.
+
     Args:
        path: String of full path to file. 
     
-    Returns:
-        list: One item list of text string.
-        None: If extraction fails.
+    Yields:
+        str: Text of the whole document. Nothing if extraction fails.
     """
 
     try:
         raw_content = docx2txt.process(path)
-        return [raw_content]
     except Exception:
-        return None
+        return
+    yield raw_content
 
-def pptx(path: str) -> list | None:
+def pptx(path: str) -> Iterator[str]:
     """Extracts text from pptx file.
 
     Args:
         path: String of full path to file.
 
-    Returns:
-        list: One string per page.
-        None: If extraction fails.
+    Yields:
+        str: Text of one slide. Stops early if extraction fails.
     """
     try:
         prs = Presentation(path)
-        slides = []
+    except Exception:
+        return
+    try:
         for slide in prs.slides:
             slide_text = ""
             for shape in slide.shapes:
                 if hasattr(shape, "text"):
                     slide_text += shape.text+"\n"
-                slides.append(slide_text)
-        return slides
+            yield slide_text
     except Exception:
-        return None
+        return
 
-def markdown(path: str) -> list | None:
+def markdown(path: str) -> Iterator[str]:
     """Extracts text from markdown file.
 
     Args:
         path: String of full path to file.
 
-    Returns:
-        list: One item list of text string. 
-        None: If extraction fails.
+    Yields:
+        str: Chunk of at most about TEXT_CHUNK_SIZE characters.
+                Nothing if extraction fails.
     """
 
     if not Path(path).is_file():
-        return None
+        return
     with open(path, 'r', encoding='utf-8', errors='ignore') as file:
-        raw_content = file.read()
-    return [raw_content]
+        yield from _chunk_lines(file)
+
+def _chunk_lines(file) -> Iterator[str]:
+    """Groups the lines of an open text file into chunks.
+
+    Chunks only end on line boundaries, so no token is ever split in two.
+    An empty file still yields one empty chunk.
+
+    Args:
+        file: Text file object.
+
+    Yields:
+        str: Chunk of at least TEXT_CHUNK_SIZE characters, except the last.
+    """
+
+    buffer = []
+    size = 0
+    is_yielded = False
+    for line in file:
+        buffer.append(line)
+        size += len(line)
+        if size >= TEXT_CHUNK_SIZE:
+            yield "".join(buffer)
+            is_yielded = True
+            buffer = []
+            size = 0
+
+    if buffer or not is_yielded:
+        yield "".join(buffer)
@@ -1,77 +1,273 @@
 """
 Index database search and spellcheck utilities.
 
+Results can be fetched in pages: a page ends with an opaque cursor that
+continues the same ranking. iter_search hands out a page as soon as it is
+ranked and computes snippets and the spellcheck afterwards, so callers can
+stream them.
+
+Prefix and wildcard patterns (polymer*, polym?r) are expanded through the
+term dictionary of backend.terms.
+
+Phrases ("project management") and NEAR/n are matched on the token
+positions stored at index time. Their matches become posting lists of
+their own, so they are ranked and combined like single terms.
+
+Snippets are cut from the page texts the indexer stores in PageText, the
+extractor only runs for documents indexed without them. Rendered snippets
+and their regular expressions are kept in LRU caches, snippets until the
+index generation changes.
+
 Typical usage:
     results = search_index(query)
+    results, spellchecked, next_cursor = search_page(query, limit=50)
+    for event in iter_search(query, limit=50, offset=decode_cursor(next_cursor)):
+        print(event["type"])
 """
 
 import re
-import os
-import sqlite3
-from importlib.resources import files
-from collections import defaultdict
-from symspellpy import SymSpell
+import sys
+import json
+import heapq
+import base64
+from bisect import bisect_left
+from functools import lru_cache
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from symspellpy.suggest_item import SuggestItem
 from backend.tokenizer import tokenize_query # pylint: disable=import-error
 from backend.read import match_extractor # pylint: disable=import-error
-from backend.database import fetch_postings_for_token, fetch_all_documents # pylint: disable=import-error
-
-APP_FOLDER = os.path.join(os.getenv("APPDATA"), "Hirmes")
-os.makedirs(APP_FOLDER, exist_ok=True)
+from backend.settings import load_settings # pylint: disable=import-error
+from backend.connection import read_connection # pylint: disable=import-error
+from backend.engine import ( # pylint: disable=import-error
+    MEMORY_INDEX,
+    PostingList,
+    load_posting_list,
+    phrase_starts,
+    near_count,
+    intersect,
+    union,
+    difference
+)
+from backend.database import ( # pylint: disable=import-error
+    get_paths_for_doc_ids,
+    fetch_doc_id,
+    fetch_corpus_stats,
+    fetch_doc_lengths,
+    fetch_max_tfs,
+    fetch_page_texts,
+    fetch_positions,
+    get_index_generation
+)
+from backend.token_cache import TOKEN_CACHE # pylint: disable=import-error
+from backend.query_cache import RESULT_CACHE, POSTING_CACHE # pylint: disable=import-error
+from backend.ranking import Bm25, top_k # pylint: disable=import-error
+from backend.terms import is_wildcard # pylint: disable=import-error
+from backend.spelling import SPELL_CHECKER # pylint: disable=import-error
 
-DB_PATH = os.path.join(APP_FOLDER, "index.db")
 LOGICAL_OPERATORS = {"and", "not", "or", "(", ")"}
-
-DICTIONARY_PATH = str(files("symspellpy") / "frequency_dictionary_en_82_765.txt")
-BIGRAM_PATH = str(files("symspellpy") / "frequency_bigramdictionary_en_243_342.txt")
-
-sym_spell = SymSpell()
-sym_spell.load_dictionary(DICTIONARY_PATH, term_index=0, count_index=1)
-sym_spell.load_dictionary(BIGRAM_PATH, term_index=0, count_index=2)
-
-def search_index(query: str) -> tuple | None:
+NEAR_RE = re.compile(r'near/(\d+)', re.IGNORECASE)
+DOC_LENGTH_FETCH_LIMIT = 5000 # Matches up to which lengths are read from DocStats per query
+SNIPPET_RESULTS = 5 # Results of every page that get snippets without asking
+SNIPPET_CACHE_SIZE = 1024 # Rendered snippets kept in memory
+PATTERN_CACHE_SIZE = 1024 # Compiled context window expressions kept in memory
+SPELLCHECK_WORKERS = 2 # Threads running spellchecks next to query evaluation
+RESULT_ENTRY_BYTES = 400 # Estimated size of one cached result without its strings and lists
+
+_spellcheck_pool = ThreadPoolExecutor(max_workers=SPELLCHECK_WORKERS,
+                                      thread_name_prefix="spellcheck")
+
+def search_index(query: str, limit: int | None = None, offset: int = 0) -> tuple | None:
     """Returns ranked matching documents for query and a spellchecked query.
 
     Args:
         query: String combination of search words and logical operators.
+        limit: Optional integer number of results to return, all if None.
+        offset: Integer number of best results to skip.
 
     Returns:
         result_docs: List of search results
                 List[{path: str, page_numbers: list, matched_terms: list, snippet: list}] 
         spellchecked_query: String recommendation for "Did You Mean"
     """
-    spellchecked_query = spellcheck(query).term
 
-    tokenized_query = tokenize_query(query)
-    rpn = _to_rpn(tokenized_query)
-    result_docs = _evaluate_rpn_ranked(rpn)
-    if not result_docs:
-        return [], spellchecked_query
+    result_docs, spellchecked_query, _next_cursor = search_page(query, limit, offset)
 
+    return result_docs, spellchecked_query
 
-    for result_number, result in enumerate(result_docs):
-        if result_number < 5:
-            result["snippet"] = _search_snippet(result)
-        else:
-            result["snippet"] = []
+def search_page(query: str, limit: int | None = None, offset: int = 0) -> tuple:
+    """Returns one page of ranked results, the spellchecked query and a cursor.
 
-    return result_docs, spellchecked_query
+    Args:
+        query: String combination of search words and logical operators.
+        limit: Optional integer page size, everything if None.
+        offset: Integer number of best results to skip, see decode_cursor.
+
+    Returns:
+        result_docs: List of search results, see search_index.
+        spellchecked_query: String recommendation for "Did You Mean"
+        next_cursor: String cursor of the next page or None on the last page.
+    """
 
-def spellcheck(text: str) -> str:
-    """Spellcheck text against dictionary and bigram dictionary.
+    result_docs, spellchecked_query, next_cursor = [], None, None
+    for event in iter_search(query, limit, offset):
+        if event["type"] == "page":
+            result_docs, next_cursor = event["results"], event["next_cursor"]
+        elif event["type"] == "spellcheck":
+            spellchecked_query = event["spellchecked"]
+
+    return result_docs, spellchecked_query, next_cursor
+
+def iter_search(query: str, limit: int | None = None, offset: int = 0) -> Iterator[dict]:
+    """Runs a search in stages, yielding each stage as soon as it is done.
+
+    The page comes first, with empty snippets. The snippets of the first
+    SNIPPET_RESULTS results follow one by one, the spellcheck comes last.
+    Snippets of further results can be requested with search_snippet.
+
+    The spellcheck runs on a thread pool while the query is evaluated. With
+    the "spellcheck_mode" setting "auto" it only runs if a search term isn't
+    indexed or fewer than "spellcheck_threshold" results are found, with
+    "off" never; the query itself is sent as spellchecked then.
+
+    Args:
+        query: String combination of search words and logical operators.
+        limit: Optional integer page size, everything if None.
+        offset: Integer number of best results to skip, see decode_cursor.
+
+    Yields:
+        dict: One of
+            {"type": "page", "results": list, "next_cursor": str | None}
+            {"type": "snippet", "index": int, "snippet": list}
+            {"type": "spellcheck", "spellchecked": str}
+
+    Raises:
+        ValueError: If the query has unmatched parentheses, raised by the
+                first next().
+    """
+
+    rpn = _to_rpn(tokenize_query(query))
+    settings = load_settings()
+    mode = settings["spellcheck_mode"]
+    suggestion = None
+    if mode == "always" or (mode == "auto" and _has_unknown_term(rpn)):
+        suggestion = _spellcheck_pool.submit(spellcheck, query)
+    result_docs = _evaluate_rpn_ranked(rpn, None if limit is None else limit + 1, offset) or []
+    if (suggestion is None and mode == "auto"
+            and offset + len(result_docs) < settings["spellcheck_threshold"]):
+        suggestion = _spellcheck_pool.submit(spellcheck, query)
+    next_cursor = None
+    if limit is not None and len(result_docs) > limit:
+        result_docs = result_docs[:limit]
+        next_cursor = encode_cursor(offset + limit)
+    for result in result_docs:
+        result["snippet"] = []
+
+    yield {"type": "page", "results": result_docs, "next_cursor": next_cursor}
+
+    for index, result in enumerate(result_docs[:SNIPPET_RESULTS]):
+        result["snippet"] = _search_snippet(result)
+        yield {"type": "snippet", "index": index, "snippet": result["snippet"]}
+
+    spellchecked = query if suggestion is None else suggestion.result().term
+    yield {"type": "spellcheck", "spellchecked": spellchecked}
+
+def search_snippet(path: str, page_numbers: list, match_terms: list) -> list | None:
+    """Returns the snippets of one search result on request.
+
+    Args:
+        path: String path of an indexed document.
+        page_numbers: List of integer pages to search.
+        match_terms: List of string terms to show.
+
+    Returns:
+        list: String snippets, see _search_snippet.
+        None: If path isn't in the index.
+    """
+
+    if fetch_doc_id(read_connection(), path) is None:
+        return None
+
+    return _search_snippet({
+        "path": path,
+        "page_numbers": sorted(int(page) for page in page_numbers),
+        "match_terms": [str(term) for term in match_terms]
+    })
+
+def encode_cursor(offset: int) -> str:
+    """Returns the opaque cursor of the page starting at offset.
+
+    Args:
+        offset: Integer number of results before the page.
+
+    Returns:
+        str: URL safe cursor.
+    """
+
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+def decode_cursor(cursor: str | None) -> int:
+    """Returns the offset a cursor of encode_cursor stands for.
+
+    Args:
+        cursor: String cursor or None for the first page.
+
+    Returns:
+        int: Offset of the page.
+
+    Raises:
+        ValueError: If cursor is malformed.
+    """
+
+    if not cursor:
+        return 0
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"]
+    except (ValueError, TypeError, KeyError) as error:
+        raise ValueError("Invalid cursor") from error
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor")
+
+    return offset
+
+def spellcheck(text: str) -> SuggestItem:
+    """Spellcheck text against the words of the index.
+
+    The dictionary is loaded on the first call, see backend.spelling.
 
     Args:
         text: String to spellcheck
     
     Returns:
-        str: Spellchecked text
+        SuggestItem: Spellchecked text as term
+    """
+
+    return SPELL_CHECKER.spellcheck(read_connection(), text)
+
+def _has_unknown_term(rpn: list) -> bool:
+    """Returns whether a search term of the query isn't in the index.
+
+    Wildcards and the "*" placeholders of phrases are not checked.
+
+    Args:
+        rpn: List of tokens in RPN from _to_rpn.
+
+    Returns:
+        bool: True if a term has no token_id.
     """
 
-    suggestions = sym_spell.lookup_compound(text, max_edit_distance=2)
+    conn = read_connection()
+    for token in rpn:
+        if _is_operator(token):
+            continue
+        for term in _phrase_terms(token):
+            if term != "*" and not is_wildcard(term) and TOKEN_CACHE.lookup(conn, term) is None:
+                return True
 
-    return suggestions[0]
+    return False
 
 def _is_operator(token: str) -> bool:
-    """Returns whether token is a logical operator.
+    """Returns whether token is a logical or NEAR/n operator.
 
     Args:
         token: String to check
@@ -80,16 +276,19 @@ def _is_operator(token: str) -> bool:
         bool: True if token is logical operator.
     """
 
-    return token in LOGICAL_OPERATORS
+    return token in LOGICAL_OPERATORS or NEAR_RE.fullmatch(token) is not None
 
 def _to_rpn(tokens: list) -> list:
     """
     Convert list of tokens into Reverse Polish Notation (RPN).
 
     Supports:
-    - Operators: NOT, AND, OR
+    - Operators: NEAR/n, NOT, AND, OR (binding in this order)
     - Parentheses: ( and )
-    - Operands: numbers, words, etc.
+    - Operands: numbers, words, phrases in quotes, etc.
+
+    A NOT directly following an operand or ")" is read as AND NOT, so
+    "a NOT b" is evaluated as the difference of a and b.
 
     Args:
         tokens: List of string tokens.
@@ -102,36 +301,50 @@ def _to_rpn(tokens: list) -> list:
     """
 
     precedence = {
+        "near": 4,
         "not": 3,
         "and": 2,
         "or": 1
     }
     right_associative = {"not"}
 
+    def rank(tok: str) -> int | None:
+        return precedence["near"] if NEAR_RE.fullmatch(tok) else precedence.get(tok)
+
     output_queue = []
     operator_stack = []
 
+    def push_operator(tok: str):
+        while (operator_stack and rank(operator_stack[-1]) is not None and
+            ((tok not in right_associative and
+                rank(tok) <= rank(operator_stack[-1])) or
+                (tok in right_associative and
+                rank(tok) < rank(operator_stack[-1])))):
+            output_queue.append(operator_stack.pop())
+        operator_stack.append(tok)
+
+    is_after_operand = False
     for token in tokens:
         tok = token.lower()
 
-        if tok in precedence:
-            while (operator_stack and operator_stack[-1].lower() in precedence and
-                ((tok not in right_associative and
-                    precedence[tok] <= precedence[operator_stack[-1].lower()]) or
-                    (tok in right_associative and
-                    precedence[tok] < precedence[operator_stack[-1].lower()]))):
-                output_queue.append(operator_stack.pop())
-            operator_stack.append(tok)
+        if rank(tok) is not None:
+            if tok == "not" and is_after_operand:
+                push_operator("and")
+            push_operator(tok)
+            is_after_operand = False
         elif token == "(":
             operator_stack.append(token)
+            is_after_operand = False
         elif token == ")":
             while operator_stack and operator_stack[-1] != "(":
                 output_queue.append(operator_stack.pop())
             if not operator_stack:
                 raise ValueError("Mismatched parentheses")
             operator_stack.pop()
+            is_after_operand = True
         else:
             output_queue.append(token)
+            is_after_operand = True
 
     while operator_stack:
         if operator_stack[-1] in ("(", ")"):
@@ -140,91 +353,495 @@ def _to_rpn(tokens: list) -> list:
 
     return output_queue
 
-def _evaluate_or(left: dict, right: dict, result: dict) -> dict:
-    """Evaluate OR (|) gate and edit result accordingly.
+class _ResultSet:
+    """Documents matched by one operand or operator of a query.
+
+    Only doc_ids are combined while evaluating. Pages, terms and term
+    frequencies are looked up through the tree for the surviving documents.
+
+    Attributes:
+        doc_ids: Sorted array('I') of matching doc_ids.
+        operator: "and", "or", "not" or None for a search term.
+        children: Operand _ResultSets of an operator.
+        term: String token of a search term.
+        postings: PostingList of a search term.
+    """
+
+    __slots__ = ("doc_ids", "operator", "children", "term", "postings")
+
+    def __init__(self, doc_ids, operator=None, children=(), term=None, postings=None):
+        self.doc_ids = doc_ids
+        self.operator = operator
+        self.children = children
+        self.term = term
+        self.postings = postings
+
+    def contains(self, doc_id: int) -> bool:
+        """Returns whether doc_id matched this part of the query.
+
+        Args:
+            doc_id: Integer document identifier.
+
+        Returns:
+            bool: True if doc_id is in doc_ids.
+        """
+
+        index = bisect_left(self.doc_ids, doc_id)
+        return index < len(self.doc_ids) and self.doc_ids[index] == doc_id
+
+    def collect(self, doc_id: int, data: dict):
+        """Adds the matches of doc_id in this subtree to data.
+
+        AND sums both operands, OR sums the operands containing the
+        document and NOT contributes nothing.
+
+        Args:
+            doc_id: Integer document identifier contained in doc_ids.
+            data: Dictionary with "match_count", "total_tf", "terms", "pages".
+        """
+
+        if self.operator is None:
+            pages, tfs = self.postings.doc_postings(bisect_left(self.postings.doc_ids, doc_id))
+            data["match_count"] += len(pages)
+            data["total_tf"] += sum(tfs)
+            data["terms"].add(self.term)
+            data["pages"].update(pages)
+        elif self.operator == "and":
+            for child in self.children:
+                child.collect(doc_id, data)
+        elif self.operator == "or":
+            for child in self.children:
+                if child.contains(doc_id):
+                    child.collect(doc_id, data)
+
+    def scoring_terms(self) -> dict:
+        """Returns the search terms of this subtree that count towards a score.
+
+        Terms below a NOT are left out.
+
+        Returns:
+            dict: term: PostingList
+        """
+
+        if self.operator is None:
+            return {self.term: self.postings}
+        terms = {}
+        if self.operator != "not":
+            for child in self.children:
+                terms.update(child.scoring_terms())
+        return terms
+
+    def is_disjunctive(self) -> bool:
+        """Returns whether this subtree only ORs search terms together.
+
+        Returns:
+            bool: True if every document of every term matches.
+        """
+
+        if self.operator is None:
+            return True
+        return self.operator == "or" and all(child.is_disjunctive() for child in self.children)
+
+def _evaluate_or(left: _ResultSet, right: _ResultSet, all_doc_ids) -> _ResultSet:
+    """Evaluate OR (|) gate as a merge union of doc_ids.
+
+    Args:
+        left: _ResultSet of left operand.
+        right: _ResultSet of right operand.
+        all_doc_ids: Callable returning the sorted doc_ids of the whole index.
+
+    Returns:
+        _ResultSet: Documents matching either operand.
+    """
+
+    _materialize(left, all_doc_ids)
+    _materialize(right, all_doc_ids)
+
+    return _ResultSet(union(left.doc_ids, right.doc_ids), "or", (left, right))
+
+def _evaluate_and(left: _ResultSet, right: _ResultSet, all_doc_ids) -> _ResultSet:
+    """Evaluates AND (&) gate as a galloping intersection of doc_ids.
+
+    An operand that is a NOT is subtracted from the other operand
+    instead of being intersected, so "a AND NOT b" never needs the
+    complement of b.
+
+    Args:
+        left: _ResultSet of left operand.
+        right: _ResultSet of right operand.
+        all_doc_ids: Callable returning the sorted doc_ids of the whole index.
+
+    Returns:
+        _ResultSet: Documents matching both operands.
+    """
+
+    if right.doc_ids is None:
+        _materialize(left, all_doc_ids)
+        doc_ids = difference(left.doc_ids, right.children[0].doc_ids)
+    elif left.doc_ids is None:
+        doc_ids = difference(right.doc_ids, left.children[0].doc_ids)
+    else:
+        doc_ids = intersect(left.doc_ids, right.doc_ids)
+
+    return _ResultSet(doc_ids, "and", (left, right))
+
+def _evaluate_not(operand: _ResultSet, all_doc_ids) -> _ResultSet:
+    """Evaluate NOT (-) gate lazily.
+
+    The complement is only computed by _materialize if the result is used
+    by anything other than AND.
 
     Args:
-        left: Dictionary of left token.
-        right: Dictionary of right token.
-        result: Dictionary to be edited.
+        operand: _ResultSet that should be excluded.
+        all_doc_ids: Callable returning the sorted doc_ids of the whole index.
 
     Returns:
-        result: Edited result dictionary.
+        _ResultSet: Documents not matching operand, doc_ids still None.
     """
-    all_keys = left.keys() | right.keys()
-    for key in all_keys:
-        result[key]["match_count"] = (
-            left[key]["match_count"]
-            + right[key]["match_count"]
-        )
-        result[key]["total_tf"] = left[key]["total_tf"] + right[key]["total_tf"]
-        result[key]["terms"] = left[key]["terms"] | right[key]["terms"]
-        result[key]["pages"] = left[key]["pages"] | right[key]["pages"]
 
-    return result
+    _materialize(operand, all_doc_ids)
+
+    return _ResultSet(None, "not", (operand,))
 
-def _evaluate_and(left: dict, right: dict, result: dict) -> dict:
-    """Evaluates AND (&) gate and edit result accordingly.
+def _materialize(result_set: _ResultSet, all_doc_ids) -> _ResultSet:
+    """Computes the doc_ids of a lazy NOT against the whole index.
 
     Args:
-        left: Dictionary of left token.
-        right: Dictionary of right token.
-        result: Dictionary to be edited.
+        result_set: _ResultSet, possibly with doc_ids still None.
+        all_doc_ids: Callable returning the sorted doc_ids of the whole index.
 
     Returns:
-        result: Edited result dictionary.
+        _ResultSet: result_set with doc_ids filled in.
     """
-    common_keys = left.keys() & right.keys()
-    for key in common_keys:
-        result[key]["match_count"] = (
-            left[key]["match_count"]
-            + right[key]["match_count"]
-        )
-        result[key]["total_tf"] = left[key]["total_tf"] + right[key]["total_tf"]
-        result[key]["terms"] = left[key]["terms"] | right[key]["terms"]
-        result[key]["pages"] = left[key]["pages"] | right[key]["pages"]
 
-    return result
+    if result_set.doc_ids is None:
+        result_set.doc_ids = difference(all_doc_ids(), result_set.children[0].doc_ids)
 
-def _evaluate_not(conn, operand: dict) -> dict:
-    """Evaluate NOT (-) gate and edit result accordingly.
+    return result_set
+
+def _fetch_posting_list(conn, token: str, is_memory: bool) -> PostingList:
+    """Returns the posting list of a search term.
 
     Args:
         conn: SQLite3 connection object.
-        operand: Dictionary of token that should be excluded.
+        token: String token.
+        is_memory: Boolean whether to use the cached in-memory index.
 
     Returns:
-        result: Edited result dictionary.
+        PostingList: Possibly empty posting list.
     """
 
-    all_docs = fetch_all_documents(conn)
+    if is_memory:
+        return MEMORY_INDEX.postings(conn, token)
 
-    excluded_paths = set(operand.keys())
+    generation = get_index_generation()
+    posting_list = POSTING_CACHE.get(token)
+    if posting_list is None:
+        posting_list = load_posting_list(conn, token)
+        POSTING_CACHE.put(token, posting_list, posting_list.nbytes(), generation)
 
-    included_docs = all_docs.difference(excluded_paths)
+    return posting_list
 
-    result = {
-        doc_path: {"match_count": 0, "total_tf": 0, "terms": set(), "pages": set(), "path": ""}
-        for doc_path in included_docs
-    }
+def _phrase_terms(term: str) -> list[str]:
+    """Returns the terms of a phrase token, or the term itself in a list.
+
+    Args:
+        term: String search term or phrase in quotes from tokenize_query.
+
+    Returns:
+        list: String terms in phrase order, "*" for any word.
+    """
+
+    return term.strip('"').split()
+
+def _spans(conn, terms: list[str], doc_ids) -> dict:
+    """Finds where terms occur as a phrase in some documents.
+
+    Positions are read from the Position table for doc_ids only.
+    Documents indexed without positions never match.
+
+    Args:
+        conn: SQLite3 connection object.
+        terms: List of string terms from _phrase_terms.
+        doc_ids: Sorted doc_ids that contain every term.
+
+    Returns:
+        dict: doc_id: {page: array('I') of start positions} of every
+                document with at least one match.
+    """
+
+    offsets = [offset for offset, term in enumerate(terms) if term != "*"]
+    token_ids = [TOKEN_CACHE.lookup(conn, terms[offset]) for offset in offsets]
+    if not doc_ids or None in token_ids:
+        return {}
+
+    candidates = list(doc_ids)
+    term_positions = []
+    for token_id in token_ids:
+        positions = fetch_positions(conn, token_id, candidates)
+        candidates = [doc_id for doc_id in candidates if doc_id in positions]
+        term_positions.append(positions)
+
+    spans = {}
+    for doc_id in candidates:
+        doc_pages = [positions[doc_id] for positions in term_positions]
+        for page in sorted(set(doc_pages[0]).intersection(*doc_pages[1:])):
+            starts = phrase_starts([(offset, pages[page])
+                                    for offset, pages in zip(offsets, doc_pages)])
+            if starts:
+                spans.setdefault(doc_id, {})[page] = starts
+
+    return spans
 
-    return result
+def _evaluate_phrase(conn, phrase: str, is_memory: bool) -> _ResultSet:
+    """Evaluates a phrase by a positional merge of its terms.
 
-def _evaluate_rpn_ranked(rpn_tokens: list) -> list | None:
+    The documents containing all terms are found by intersecting their
+    doc_ids first, positions are only read for those.
+
+    Args:
+        conn: SQLite3 connection object.
+        phrase: String phrase in quotes from tokenize_query.
+        is_memory: Boolean whether to use the cached in-memory index.
+
+    Returns:
+        _ResultSet: Documents containing the phrase, the number of
+                occurrences per page as term frequency.
+    """
+
+    terms = _phrase_terms(phrase)
+    doc_ids = None
+    for term in set(terms) - {"*"}:
+        term_doc_ids = _fetch_posting_list(conn, term, is_memory).doc_ids
+        doc_ids = term_doc_ids if doc_ids is None else intersect(doc_ids, term_doc_ids)
+
+    postings = PostingList([
+        (doc_id, page, len(starts))
+        for doc_id, pages in sorted(_spans(conn, terms, doc_ids).items())
+        for page, starts in pages.items()
+    ])
+
+    return _ResultSet(postings.doc_ids, term=phrase, postings=postings)
+
+def _evaluate_near(conn, left: _ResultSet, right: _ResultSet, distance: int) -> _ResultSet | None:
+    """Evaluates NEAR/distance between two terms or phrases.
+
+    Both have to occur on the same page, at most distance positions apart
+    in either order ("a NEAR/1 b" matches "a b" and "b a").
+
+    Args:
+        conn: SQLite3 connection object.
+        left: _ResultSet of a search term or phrase.
+        right: _ResultSet of a search term or phrase.
+        distance: Integer maximum distance in positions.
+
+    Returns:
+        _ResultSet: Documents with a match, the number of matching left
+                spans per page as term frequency.
+        None: If an operand isn't a search term or phrase, or is a wildcard.
+    """
+
+    for operand in (left, right):
+        if operand.operator is not None or " NEAR/" in operand.term:
+            return None
+        if not operand.term.startswith('"') and is_wildcard(operand.term):
+            return None
+
+    left_terms = _phrase_terms(left.term)
+    right_terms = _phrase_terms(right.term)
+    left_spans = _spans(conn, left_terms, intersect(left.doc_ids, right.doc_ids))
+    right_spans = _spans(conn, right_terms, sorted(left_spans))
+
+    rows = []
+    for doc_id in sorted(right_spans):
+        left_pages = left_spans[doc_id]
+        right_pages = right_spans[doc_id]
+        for page in sorted(left_pages.keys() & right_pages.keys()):
+            count = near_count(left_pages[page], len(left_terms),
+                               right_pages[page], len(right_terms), distance)
+            if count:
+                rows.append((doc_id, page, count))
+    postings = PostingList(rows)
+
+    return _ResultSet(postings.doc_ids, term=f"{left.term} NEAR/{distance} {right.term}",
+                      postings=postings)
+
+def _evaluate_rpn_ranked(rpn_tokens: list, limit: int | None = None,
+                         offset: int = 0) -> list | None:
     """Evaluates RPN boolean expression and returns ranked results.
 
+    With the "ranking" setting "bm25" documents are ordered by their BM25
+    score, with "matches" by number of terms matched, then total term
+    frequency. Operators only combine sorted doc_id arrays. Only the best
+    offset + limit documents are kept while ranking; pages, terms and
+    paths are looked up for the returned ones.
 
-    Ranking is based on number of terms matched, then total term frequency.
-    Evaluates at the document level (doc_id as key), but stores pages inside each doc.
+    The ranked results are kept in RESULT_CACHE under the RPN, so repeated
+    searches and further pages of the same query are sliced from memory
+    as long as the index doesn't change.
 
     Args:
         rpn_tokens: List of tokens in RPN format.
+        limit: Optional integer number of results, all if None.
+        offset: Integer number of best results to skip.
 
     Returns:
         results: List[{path: str, page_numbers: list, matched_terms: list}] 
     """
 
-    conn = sqlite3.connect(DB_PATH)
+    settings = load_settings()
+    wanted = None if limit is None else offset + limit
+    key = (tuple(rpn_tokens), settings["ranking"], settings["search_engine"])
+    cached = RESULT_CACHE.get(key)
+    if cached is None or not (cached[1] or (wanted is not None and wanted <= len(cached[0]))):
+        generation = get_index_generation()
+        cached = _rank(rpn_tokens, wanted, settings)
+        if cached is None:
+            return None
+        RESULT_CACHE.put(key, cached, _results_size(cached[0]), generation)
+
+    return [dict(result) for result in cached[0][offset:wanted]]
+
+def _rank(rpn_tokens: list, limit: int | None, settings: dict) -> tuple | None:
+    """Evaluates RPN boolean expression and ranks the best documents.
+
+    Args:
+        rpn_tokens: List of tokens in RPN format.
+        limit: Optional integer number of results, all if None.
+        settings: Dictionary from load_settings.
+
+    Returns:
+        results: List of results, see _evaluate_rpn_ranked.
+        is_complete: Boolean whether results holds every match.
+        None: If the expression is malformed.
+    """
+
+    is_memory = settings["search_engine"] == "memory"
+    conn = read_connection()
+    final_set = _evaluate_rpn(conn, rpn_tokens, is_memory)
+    if final_set is None:
+        return None
+
+    k = len(final_set.doc_ids)
+    is_complete = limit is None or k <= limit
+    if limit is not None:
+        k = min(k, limit)
+    if k == 0:
+        return [], is_complete
+
+    if settings["ranking"] == "bm25":
+        ranked = [doc_id for _score, doc_id in _top_k_bm25(conn, final_set, k)]
+    else:
+        ranked = _top_k_matches(final_set, k)
+
+    results = []
+    for doc_id in ranked:
+        data = {"match_count": 0, "total_tf": 0, "terms": set(), "pages": set()}
+        final_set.collect(doc_id, data)
+        results.append((doc_id, data))
+
+    paths = get_paths_for_doc_ids(conn, ranked)
+
+    return [
+        {
+            "path": paths[doc_id],
+            "page_numbers": sorted(data["pages"]),
+            "match_terms": list(data["terms"])
+        }
+        for doc_id, data in results
+        if doc_id in paths
+    ], is_complete
+
+def _results_size(results: list) -> int:
+    """Returns the estimated memory of ranked results in bytes.
+
+    Args:
+        results: List of results from _rank.
+
+    Returns:
+        int: Estimated size.
+    """
+
+    return sum(
+        RESULT_ENTRY_BYTES + sys.getsizeof(result["path"]) + 8 * len(result["page_numbers"])
+        + sum(sys.getsizeof(term) for term in result["match_terms"])
+        for result in results
+    )
+
+def _top_k_bm25(conn, final_set: _ResultSet, k: int) -> list[tuple]:
+    """Returns the k documents of final_set with the highest BM25 score.
+
+    Score upper bounds come from TokenStats.max_tf. Document lengths are
+    read from DocStats for small result sets and from the cached length
+    array of MEMORY_INDEX for large ones.
+
+    Args:
+        conn: SQLite3 connection object.
+        final_set: Root _ResultSet of the query.
+        k: Integer number of documents, at least 1.
+
+    Returns:
+        list: (score, doc_id) tuples, best first.
+    """
+
+    terms = final_set.scoring_terms()
+    if not terms:
+        return [(0.0, doc_id) for doc_id in final_set.doc_ids[:k]]
+
+    doc_count, avg_length = fetch_corpus_stats(conn)
+    token_ids = {term: TOKEN_CACHE.lookup(conn, term) for term in terms}
+    max_tfs = fetch_max_tfs(conn, [token_id for token_id in token_ids.values() if token_id])
+    if len(final_set.doc_ids) <= DOC_LENGTH_FETCH_LIMIT:
+        lengths = fetch_doc_lengths(conn, list(final_set.doc_ids))
+    else:
+        lengths = MEMORY_INDEX.doc_lengths(conn)
+
+    return top_k(
+        [
+            (postings.doc_ids, postings.doc_tfs, len(postings),
+             max_tfs.get(token_ids[term]) or max(postings.doc_tfs, default=0))
+            for term, postings in terms.items()
+        ],
+        Bm25(doc_count, avg_length),
+        lengths,
+        k,
+        candidates=None if final_set.is_disjunctive() else final_set.doc_ids
+    )
+
+def _top_k_matches(final_set: _ResultSet, k: int) -> list[int]:
+    """Returns the k documents of final_set with the most matches.
+
+    Args:
+        final_set: Root _ResultSet of the query.
+        k: Integer number of documents.
+
+    Returns:
+        list: doc_ids ordered by match count, then total term frequency.
+    """
+
+    counts = []
+    for doc_id in final_set.doc_ids:
+        data = {"match_count": 0, "total_tf": 0, "terms": set(), "pages": set()}
+        final_set.collect(doc_id, data)
+        counts.append((-data["match_count"], -data["total_tf"], doc_id))
+
+    return [doc_id for _matches, _tf, doc_id in heapq.nsmallest(k, counts)]
+
+def _evaluate_rpn(conn, rpn_tokens: list, is_memory: bool) -> _ResultSet | None:
+    """Evaluates RPN boolean expression into a tree of _ResultSets.
+
+    Args:
+        conn: SQLite3 connection object.
+        rpn_tokens: List of tokens in RPN format.
+        is_memory: Boolean whether to use the cached in-memory index.
+
+    Returns:
+        _ResultSet: Root of the evaluated expression.
+        None: If the expression is malformed.
+    """
+
+    def all_doc_ids():
+        return MEMORY_INDEX.all_doc_ids(conn)
 
     stack = []
 
@@ -234,76 +851,45 @@ def _evaluate_rpn_ranked(rpn_tokens: list) -> list | None:
                 try:
                     operand = stack.pop()
                 except IndexError:
-                    conn.close()
                     return None
 
-                result = _evaluate_not(conn, operand)
+                stack.append(_evaluate_not(operand, all_doc_ids))
+
+            elif NEAR_RE.fullmatch(token):
+                try:
+                    right = stack.pop()
+                    left = stack.pop()
+                except IndexError:
+                    return None
 
-                stack.append(result)
+                near = _evaluate_near(conn, left, right, int(NEAR_RE.fullmatch(token).group(1)))
+                if near is None:
+                    return None
+                stack.append(near)
 
             else:
                 try:
                     right = stack.pop()
                     left = stack.pop()
                 except IndexError:
-                    conn.close()
                     return None
 
-                result = defaultdict(
-                    lambda: {"match_count": 0, "total_tf": 0, "terms": set(), "pages": set()}
-                )
-
                 if token == "and":
-                    result = _evaluate_and(left, right, result)
-
+                    stack.append(_evaluate_and(left, right, all_doc_ids))
                 elif token == "or":
-                    result = _evaluate_or(left, right, result)
+                    stack.append(_evaluate_or(left, right, all_doc_ids))
 
-                stack.append(result)
+        elif token.startswith('"'):
+            stack.append(_evaluate_phrase(conn, token, is_memory))
 
         else:
-            doc_map = defaultdict(
-                lambda: {"match_count": 0, "total_tf": 0, "terms": set(), "pages": set()}
-            )
-            for doc_path, page, tf in fetch_postings_for_token(conn, token):
-                doc_map[doc_path]["match_count"] += 1
-                doc_map[doc_path]["total_tf"] += tf
-                doc_map[doc_path]["terms"].add(token)
-                doc_map[doc_path]["pages"].add(page)
-
-            stack.append(doc_map)
+            postings = _fetch_posting_list(conn, token, is_memory)
+            stack.append(_ResultSet(postings.doc_ids, term=token, postings=postings))
 
     if len(stack) != 1:
-        conn.close()
         return None
 
-    final_map = stack.pop()
-
-    results = [
-        (
-            str(doc_path),
-            sorted(list(data["pages"])),
-            data["match_count"],
-            data["total_tf"],
-            list(data["terms"])
-        )
-        for doc_path, data in final_map.items()
-    ]
-
-    results.sort(key=lambda x: (-x[2], -x[3]))
-
-    truncated_results = [
-        {
-            "path": doc_path,
-            "page_numbers": pages,
-            "match_terms": terms
-        }
-        for doc_path, pages, _mc, _tf, terms in results
-    ]
-
-    conn.close()
-
-    return truncated_results
+    return _materialize(stack.pop(), all_doc_ids)
 
 def _search_snippet(result: dict) -> list:
     """Finds snippets in document for all matched terms.
@@ -315,31 +901,85 @@ def _search_snippet(result: dict) -> list:
     Returns:
         snippets: List of string snippets for matched terms.
     """
-    path = result["path"]
-    page_nums = result["page_numbers"]
-    tokens = result["match_terms"]
+
+    return list(_cached_snippet(
+        result["path"],
+        tuple(result["page_numbers"]),
+        tuple(result["match_terms"]),
+        get_index_generation()
+    ))
+
+@lru_cache(maxsize=SNIPPET_CACHE_SIZE)
+def _cached_snippet(path: str, page_nums: tuple, tokens: tuple, _generation: int) -> tuple:
+    """Renders the snippets of _search_snippet.
+
+    The index generation is part of the cache key, so reindexed documents
+    don't get snippets of their old text.
+
+    Args:
+        path: String path of the document.
+        page_nums: Tuple of integer pages to search.
+        tokens: Tuple of string terms to show.
+        _generation: Integer index generation, only used as key.
+
+    Returns:
+        tuple: String snippets for matched terms.
+    """
+
     num_tokens = len(tokens)
     num_snippets = 5
     context_length = 5
     snippets = []
-    file_function = match_extractor(path)
-    raw_content = file_function(path)
-    if not raw_content:
-        snippets.append("File Not Found")
-        return snippets
+    is_found = False
 
-    for num in page_nums:
-        # Higher order filetype function -> read content -> filter page
-        document_content = raw_content[num-1]
+    for document_content in _snippet_pages(path, page_nums):
+        is_found = True
+        if document_content is None:
+            continue
 
         for token in tokens:
             matches = _context_windows(document_content, token, context_length)
             if num_tokens <= num_snippets:
                 snippets += matches[:num_snippets//num_tokens]
             else:
-                snippets += matches[0]
+                snippets += matches[:1]
+
+    if not is_found:
+        snippets.append("File Not Found")
+
+    return tuple(snippets)
+
+def _snippet_pages(path: str, page_nums: tuple) -> Iterator[str | None]:
+    """Yields the text of the wanted pages of a document.
+
+    Stored page texts are used if the document has any, otherwise pages
+    are streamed from the extractor and skipped until a wanted one shows up.
+
+    Args:
+        path: String path of the document.
+        page_nums: Tuple of integer pages, ascending.
+
+    Yields:
+        str: Text of a wanted page.
+        None: For pages read from the file that aren't wanted.
+    """
+
+    conn = read_connection()
+    doc_id = fetch_doc_id(conn, path)
+    texts = fetch_page_texts(conn, doc_id, list(page_nums)) if doc_id is not None else {}
+    if texts:
+        for num in sorted(texts):
+            yield texts[num]
+        return
 
-    return snippets
+    wanted_pages = set(page_nums)
+    last_page = max(page_nums, default=0)
+    file_function = match_extractor(path)
+    for num, document_content in enumerate(file_function(path), start=1):
+        if num > last_page:
+            yield None
+            break
+        yield document_content if num in wanted_pages else None
 
 def _context_windows(text: str, word: str, n: int = 5) -> list:
     """
@@ -355,13 +995,54 @@ def _context_windows(text: str, word: str, n: int = 5) -> list:
     Returns:
         list: All matches for word in text in string format.
     """
+
+    return _context_pattern(word, n).findall(text)
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def _context_pattern(word: str, n: int) -> re.Pattern:
+    """Compiles the expression of _context_windows once per word and n.
+
+    Args:
+        word: String search term, phrase or NEAR match term.
+        n: Number of words to return before and after.
+
+    Returns:
+        re.Pattern: Case insensitive pattern.
+    """
+
     pattern = (
         rf'(?:\b\w+[^\s\w]*\s+){{0,{n}}}'
-        rf'\b{re.escape(word)}[^\s\w]*'
+        rf'\b{_term_pattern(word)}[^\s\w]*'
         rf'(?:\s+\w+[^\s\w]*){{0,{n}}}'
     )
 
-    return re.findall(pattern, text, flags=re.IGNORECASE)
+    return re.compile(pattern, flags=re.IGNORECASE)
+
+def _term_pattern(term: str) -> str:
+    """Returns the expression matching a term in the original text.
+
+    "*" in a phrase matches any word, the operands of "a NEAR/n b" may be
+    separated by up to n - 1 words, in either order. Wildcards inside a
+    word match word characters.
+
+    Args:
+        term: String search term, phrase or NEAR match term.
+
+    Returns:
+        str: Regular expression without anchors.
+    """
+
+    near = re.fullmatch(r'(.+) NEAR/(\d+) (.+)', term)
+    if near:
+        left, right = _term_pattern(near[1]), _term_pattern(near[3])
+        gap = rf'\W+(?:\w+\W+){{0,{max(int(near[2]) - 1, 0)}}}?'
+        return rf'(?:{left}{gap}{right}|{right}{gap}{left})'
+
+    return r'\W+'.join(
+        r'\w+' if word == "*"
+        else re.escape(word).replace(r'\*', r'\w*').replace(r'\?', r'\w')
+        for word in _phrase_terms(term)
+    )
 
 def make_full_text(query: str) -> str:
     split_query = query.split()
@@ -9,17 +9,49 @@ os.makedirs(APP_FOLDER, exist_ok=True)
 
 SETTINGS_FILE = os.path.join(APP_FOLDER, "config.json")
 
+DEFAULT_SETTINGS = {
+    "recursive": False,
+    "replace_filename": False,
+    "watchdog_number": 50,
+    "watchdog_interval": 900,
+    "watchdog_pause": 0.5,
+    "watchdog_mode": "auto",
+    "watchdog_debounce": 2.0,
+    "index_workers": 0,
+    "posting_batch_size": 100000,
+    "token_cache_size": 0,
+    "walk_workers": 1,
+    "ignore_patterns": [],
+    "change_detection_hash": True,
+    "search_engine": "sqlite",
+    "ranking": "bm25",
+    "store_page_text": True,
+    "store_positions": True,
+    "wildcard_limit": 1000,
+    "spellcheck_english": False,
+    "spellcheck_mode": "auto",
+    "spellcheck_threshold": 3,
+    "result_cache_size": 256,
+    "result_cache_ttl": 300,
+    "result_cache_mb": 16,
+    "posting_cache_mb": 64,
+    "memory_index_mb": 512
+}
+
 def load_settings():
     """Loads settings from SETTINGS_FILE or creates it if it doesn't exist.
 
+    Keys missing from SETTINGS_FILE are filled in from DEFAULT_SETTINGS.
+
     Returns:
         dict: Settings with "name": value format.    
     """
 
+    settings = dict(DEFAULT_SETTINGS)
     if os.path.exists(SETTINGS_FILE):
         with open(SETTINGS_FILE, 'r', encoding="utf-8") as f:
-            return json.load(f)
-    return {"recursive": False, "replace_filename": False, "watchdog_number": 50}
+            settings.update(json.load(f))
+    return settings
 
 def save_settings(updates: dict):
     """Saves current settings to SETTINGS_FILE.
@@ -32,4 +64,4 @@ def save_settings(updates: dict):
     config.update(updates)
 
     with open(SETTINGS_FILE, 'w', encoding="utf-8") as f:
-        json.dump(config, f)
\ No newline at end of file
+        json.dump(config, f)
@@ -0,0 +1,273 @@
+"""
+Spellcheck dictionary built from the indexed documents.
+
+The SymSpell dictionary holds every alphabetic token of the Token table,
+counted by its document frequency, so suggestions are words that can
+actually be found. It is built on the first spellcheck, not at import,
+and saved as a pickle next to the database. After a restart the pickle is
+loaded and only tokens with a higher token_id than it contains are added;
+the same happens whenever the index generation changes. Tokens that had
+no documents yet are read again on the next sync, and the document
+frequencies of all words are refreshed every DF_REFRESH_SECONDS.
+
+With the "spellcheck_english" setting the English word and bigram lists
+of symspellpy are loaded as well and queries are corrected as a whole
+with lookup_compound. Otherwise every search term is corrected on its
+own, operators, stop words, numbers and wildcards are kept as they are.
+
+Typical usage:
+    from backend.spelling import SPELL_CHECKER
+
+    suggestion = SPELL_CHECKER.spellcheck(conn, "Chemi AND Tensid")
+    print(suggestion.term)
+"""
+
+import os
+import re
+import time
+import pickle
+import threading
+from importlib.resources import files
+from symspellpy import SymSpell, Verbosity
+from symspellpy.suggest_item import SuggestItem
+from backend import connection # pylint: disable=import-error
+from backend.database import ( # pylint: disable=import-error
+    fetch_token_dfs_after,
+    fetch_token_dfs,
+    get_index_generation
+)
+from backend.settings import load_settings # pylint: disable=import-error
+from backend.tokenizer import STOPLIST # pylint: disable=import-error
+
+DICTIONARY_PATH = str(files("symspellpy") / "frequency_dictionary_en_82_765.txt")
+BIGRAM_PATH = str(files("symspellpy") / "frequency_bigramdictionary_en_243_342.txt")
+SPELLING_FILE = "spelling.pickle" # Saved next to the database
+PICKLE_VERSION = 2
+MAX_EDIT_DISTANCE = 2
+CORPUS_COUNT_WEIGHT = 1_000_000 # Count per document of an indexed word next to the English lists
+SAVE_AFTER_TOKENS = 1000 # New tokens that trigger saving the pickle again
+DF_REFRESH_SECONDS = 600 # Minimum time between rereading every document frequency
+QUERY_WORD_RE = re.compile(r'[\w*?]+')
+QUERY_OPERATORS = {"AND", "OR", "NOT", "NEAR"}
+
+class SpellChecker:
+    """Lazily loaded SymSpell dictionary of one index database.
+
+    Attributes:
+        db_path: String path of the database the dictionary belongs to.
+        is_english: Boolean whether the English lists are included.
+        generation: Index generation of the last sync.
+        max_token_id: Integer highest token_id read.
+        refreshed: time.monotonic() of the last full document frequency read.
+    """
+
+    def __init__(self):
+        self.db_path = None
+        self.is_english = None
+        self.generation = None
+        self.max_token_id = 0
+        self.refreshed = 0.0
+        self._sym_spell = None
+        self._counts = {}
+        self._pending = set()
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Drops the dictionary, the next spellcheck loads it again."""
+
+        with self._lock:
+            self.db_path = None
+            self._sym_spell = None
+
+    def spellcheck(self, conn, text: str) -> SuggestItem:
+        """Returns the corrected query.
+
+        Args:
+            conn: SQLite3 connection object, may be read-only.
+            text: String query.
+
+        Returns:
+            SuggestItem: Corrected query as term, summed edit distance.
+        """
+
+        with self._lock:
+            self._sync(conn)
+            if self.is_english:
+                return self._sym_spell.lookup_compound(text, max_edit_distance=MAX_EDIT_DISTANCE)[0]
+
+            distance = 0
+
+            def correct(match: re.Match) -> str:
+                nonlocal distance
+                word = match.group()
+                lower = word.lower()
+                if (word in QUERY_OPERATORS or not lower.isalpha() or lower in STOPLIST
+                        or self._sym_spell.words.get(lower)):
+                    return word
+                suggestions = self._sym_spell.lookup(lower, Verbosity.ALL, MAX_EDIT_DISTANCE)
+                suggestion = next((item for item in suggestions if item.count > 0), None)
+                if suggestion is None:
+                    return word
+                distance += suggestion.distance
+                return suggestion.term
+
+            term = QUERY_WORD_RE.sub(correct, text)
+
+        return SuggestItem(term, distance, 0)
+
+    def _sync(self, conn):
+        """Loads or builds the dictionary and adds new tokens.
+
+        Must be called while holding _lock.
+
+        Args:
+            conn: SQLite3 connection object.
+        """
+
+        is_english = load_settings()["spellcheck_english"]
+        if self._sym_spell is None or (self.db_path, self.is_english) != (
+                connection.DB_PATH, is_english):
+            self.db_path = connection.DB_PATH
+            self.is_english = is_english
+            self.generation = None
+            if not self._load(conn):
+                self._build()
+
+        current = get_index_generation()
+        if self.generation == current:
+            return
+        max_id = conn.execute("SELECT MAX(token_id) FROM Token").fetchone()[0] or 0
+        if max_id < self.max_token_id:
+            self._build()
+        changed = self._read_tokens(fetch_token_dfs(conn, list(self._pending)))
+        changed += self._read_tokens(fetch_token_dfs_after(conn, self.max_token_id))
+        if time.monotonic() - self.refreshed >= DF_REFRESH_SECONDS:
+            changed += self._read_tokens(fetch_token_dfs_after(conn, 0))
+            self.refreshed = time.monotonic()
+        self.generation = current
+        self._unsaved += changed
+        if self._unsaved >= SAVE_AFTER_TOKENS:
+            self._save(conn)
+
+    def _pickle_path(self) -> str:
+        """Returns where the dictionary of db_path is saved."""
+
+        return os.path.join(os.path.dirname(self.db_path), SPELLING_FILE)
+
+    def _build(self):
+        """Starts an empty dictionary, with the English lists if enabled."""
+
+        self._sym_spell = SymSpell(max_dictionary_edit_distance=MAX_EDIT_DISTANCE)
+        if self.is_english:
+            self._sym_spell.load_dictionary(DICTIONARY_PATH, term_index=0, count_index=1)
+            self._sym_spell.load_dictionary(BIGRAM_PATH, term_index=0, count_index=2)
+        self.max_token_id = 0
+        self.refreshed = time.monotonic()
+        self._counts = {}
+        self._pending = set()
+        self._unsaved = SAVE_AFTER_TOKENS # Saved after the first sync
+
+    def _read_tokens(self, rows: list[tuple]) -> int:
+        """Sets the counts of tokens to their document frequency.
+
+        Alphabetic tokens without documents are remembered in _pending and
+        read again on the next sync, a word whose documents were all
+        deleted keeps a count of 0 and is no longer suggested.
+
+        Args:
+            rows: List of (token_id, token_text, df) tuples from
+                    database.fetch_token_dfs_after or fetch_token_dfs.
+
+        Returns:
+            int: Number of words whose count changed.
+        """
+
+        weight = CORPUS_COUNT_WEIGHT if self.is_english else 1
+        words = self._sym_spell.words
+        changed = 0
+        for token_id, token_text, df in rows:
+            self.max_token_id = max(self.max_token_id, token_id)
+            if not token_text.isalpha():
+                continue
+            if df:
+                self._pending.discard(token_id)
+            else:
+                self._pending.add(token_id)
+            old = self._counts.get(token_text, 0)
+            if df == old:
+                continue
+            if token_text in words:
+                words[token_text] += (df - old) * weight
+            else:
+                self._sym_spell.create_dictionary_entry(token_text, df * weight)
+            self._counts[token_text] = df
+            changed += 1
+
+        return changed
+
+    def _load(self, conn) -> bool:
+        """Loads the saved dictionary if it belongs to the database.
+
+        The pickle remembers the text of its highest token_id. If the
+        database has another token there, it was rebuilt in between.
+
+        Args:
+            conn: SQLite3 connection object.
+
+        Returns:
+            bool: True if the dictionary was loaded.
+        """
+
+        try:
+            with open(self._pickle_path(), "rb") as f:
+                saved = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False
+        if (saved.get("version") != PICKLE_VERSION or saved["is_english"] != self.is_english
+                or saved["max_token_text"] != _token_text(conn, saved["max_token_id"])):
+            return False
+
+        sym_spell = SymSpell(max_dictionary_edit_distance=MAX_EDIT_DISTANCE)
+        sym_spell.load_pickle(saved["sym_spell"], compressed=False, from_bytes=True)
+        self._sym_spell = sym_spell
+        self.max_token_id = saved["max_token_id"]
+        self.refreshed = 0.0
+        self._counts = saved["counts"]
+        self._pending = saved["pending"]
+        self._unsaved = 0
+
+        return True
+
+    def _save(self, conn):
+        """Writes the dictionary next to the database, replacing the old file.
+
+        Args:
+            conn: SQLite3 connection object.
+        """
+
+        path = self._pickle_path()
+        saved = {
+            "version": PICKLE_VERSION,
+            "is_english": self.is_english,
+            "max_token_id": self.max_token_id,
+            "max_token_text": _token_text(conn, self.max_token_id),
+            "counts": self._counts,
+            "pending": self._pending,
+            "sym_spell": self._sym_spell.save_pickle(compressed=False, to_bytes=True),
+        }
+        try:
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(saved, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            return
+        self._unsaved = 0
+
+def _token_text(conn, token_id: int) -> str | None:
+    """Returns the text of token_id, None if it doesn't exist."""
+
+    row = conn.execute("SELECT token_text FROM Token WHERE token_id = ?", (token_id,)).fetchone()
+    return row[0] if row else None
+
+SPELL_CHECKER = SpellChecker()
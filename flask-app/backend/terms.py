@@ -0,0 +1,170 @@
+"""
+Sorted in-memory term dictionary for prefix and wildcard search.
+
+Every token_text of the Token table is kept in one sorted list, so the
+terms matching "polymer*" are a contiguous range found by two binary
+searches. Patterns with "*" or "?" after the first character are matched
+against that range only, a leading wildcard scans the whole list. The
+dictionary is loaded on first use and afterwards only reads tokens with a
+higher token_id than it has seen, whenever the index generation changes.
+
+Typical usage:
+    from backend.terms import TERM_DICTIONARY, is_wildcard
+
+    if is_wildcard(token):
+        expansions = TERM_DICTIONARY.expand(conn, token)
+"""
+
+import re
+import threading
+from bisect import bisect_left
+from backend.database import ( # pylint: disable=import-error
+    fetch_tokens_after,
+    get_index_generation
+)
+from backend.settings import load_settings # pylint: disable=import-error
+
+WILDCARD_CHARS = "*?"
+INSORT_LIMIT = 64 # New tokens inserted one by one, more trigger a re-sort
+
+def is_wildcard(token: str) -> bool:
+    """Returns whether a query token is a prefix or wildcard pattern.
+
+    Args:
+        token: String query token.
+
+    Returns:
+        bool: True if token contains "*" or "?".
+    """
+
+    return "*" in token or "?" in token
+
+def _literal_prefix(pattern: str) -> str:
+    """Returns the part of pattern in front of the first wildcard."""
+
+    for i, char in enumerate(pattern):
+        if char in WILDCARD_CHARS:
+            return pattern[:i]
+    return pattern
+
+def wildcard_regex(pattern: str) -> str:
+    """Translates a wildcard pattern into a regular expression.
+
+    "*" stands for any number of characters, "?" for exactly one.
+
+    Args:
+        pattern: String pattern like "polym?r*".
+
+    Returns:
+        str: Expression for re.fullmatch.
+    """
+
+    return re.escape(pattern).replace(r"\*", ".*").replace(r"\?", ".")
+
+class TermDictionary:
+    """Sorted list of all tokens with their token_ids.
+
+    Attributes:
+        generation: Index generation the dictionary was last synced at.
+        expansions: Integer number of patterns expanded.
+        truncated: Integer number of expansions cut at the limit.
+    """
+
+    def __init__(self):
+        self.generation = None
+        self.expansions = 0
+        self.truncated = 0
+        self._terms = []
+        self._ids = []
+        self._max_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def clear(self):
+        """Drops all terms, e.g. when the database changes."""
+
+        with self._lock:
+            self.generation = None
+            self._terms = []
+            self._ids = []
+            self._max_id = 0
+
+    def expand(self, conn, pattern: str, limit: int | None = None) -> list[tuple]:
+        """Returns the indexed terms matching pattern.
+
+        Args:
+            conn: SQLite3 connection object, may be read-only.
+            pattern: String with "*" and "?" wildcards.
+            limit: Optional integer maximum number of terms, the
+                    "wildcard_limit" setting if None.
+
+        Returns:
+            list: (token_text, token_id) tuples in alphabetical order, the
+                    first limit ones if more match.
+        """
+
+        if limit is None:
+            limit = load_settings()["wildcard_limit"]
+        prefix = _literal_prefix(pattern)
+        is_prefix_only = pattern == prefix + "*"
+        regex = None if is_prefix_only else re.compile(wildcard_regex(pattern))
+
+        with self._lock:
+            self._sync(conn)
+            start = bisect_left(self._terms, prefix)
+            end = (bisect_left(self._terms, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+                   if prefix else len(self._terms))
+            matches = []
+            for i in range(start, end):
+                if regex is None or regex.fullmatch(self._terms[i]):
+                    if len(matches) == limit:
+                        self.truncated += 1
+                        break
+                    matches.append((self._terms[i], self._ids[i]))
+            self.expansions += 1
+
+        return matches
+
+    def stats(self) -> dict:
+        """Returns the size and counters of the dictionary.
+
+        Returns:
+            dict: "size", "expansions", "truncated"
+        """
+
+        return {"size": len(self._terms), "expansions": self.expansions,
+                "truncated": self.truncated}
+
+    def _sync(self, conn):
+        """Adds tokens inserted since the last sync.
+
+        Must be called while holding _lock.
+
+        Args:
+            conn: SQLite3 connection object.
+        """
+
+        current = get_index_generation()
+        if self.generation == current:
+            return
+        max_id = conn.execute("SELECT MAX(token_id) FROM Token").fetchone()[0] or 0
+        if max_id < self._max_id:
+            self._terms, self._ids, self._max_id = [], [], 0
+        new_tokens = fetch_tokens_after(conn, self._max_id)
+        if len(new_tokens) <= INSORT_LIMIT:
+            for token_text, token_id in new_tokens:
+                index = bisect_left(self._terms, token_text)
+                self._terms.insert(index, token_text)
+                self._ids.insert(index, token_id)
+        else:
+            pairs = list(zip(self._terms, self._ids))
+            pairs += new_tokens
+            pairs.sort()
+            self._terms = [token_text for token_text, _token_id in pairs]
+            self._ids = [token_id for _token_text, token_id in pairs]
+        self._max_id = max([self._max_id] + [token_id for _token_text, token_id in new_tokens])
+        self.generation = current
+
+TERM_DICTIONARY = TermDictionary()
@@ -0,0 +1,163 @@
+"""
+Process wide cache of token_text: token_id.
+
+The indexer, the watchdog and search share one TokenCache, so vocabulary
+that is already in the Token table is resolved from memory instead of with
+INSERT OR IGNORE and SELECT round trips. The cache warms up lazily. With a
+"token_cache_size" above 0 it keeps only that many tokens, evicting the
+least recently used.
+
+Token ids are only valid for one database, so close_connections clears the
+cache. A rolled back transaction can hand out token ids again; get_ids
+notices this from MAX(token_id) and starts over.
+
+Typical usage:
+    from backend.token_cache import TOKEN_CACHE
+
+    token_ids = TOKEN_CACHE.get_ids(conn, ["chemie", "physik"])
+    token_id = TOKEN_CACHE.lookup(conn, "chemie")
+    print(TOKEN_CACHE.stats())
+"""
+
+import threading
+from collections import OrderedDict
+from backend.database import fetch_token_ids, insert_tokens # pylint: disable=import-error
+from backend.settings import load_settings # pylint: disable=import-error
+
+class TokenCache:
+    """Dictionary of token_text: token_id with optional LRU bound.
+
+    Attributes:
+        max_size: Integer number of tokens kept, 0 for no limit.
+        hits: Integer number of tokens found in the cache.
+        misses: Integer number of tokens looked up in the database.
+        evictions: Integer number of tokens dropped by the LRU bound.
+    """
+
+    def __init__(self, max_size: int = 0):
+        """Creates an empty cache.
+
+        Args:
+            max_size: Integer number of tokens kept, 0 for no limit.
+        """
+
+        self.max_size = max(0, max_size)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._ids = OrderedDict() if self.max_size else {}
+        self._max_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def clear(self):
+        """Drops all cached tokens, e.g. when the database changes."""
+
+        with self._lock:
+            self._ids = OrderedDict() if self.max_size else {}
+            self._max_id = 0
+
+    def get_ids(self, conn, tokens, is_create: bool = True) -> dict:
+        """Returns the token_ids of tokens, inserting missing tokens.
+
+        Args:
+            conn: SQLite3 connection object, the writer if is_create.
+            tokens: Iterable of unique token_text strings.
+            is_create: Boolean whether tokens missing from Token get inserted.
+
+        Returns:
+            dict: token_text: token_id. Without is_create, unknown tokens
+                    are left out.
+        """
+
+        if is_create:
+            self._check_max_id(conn)
+
+        result = {}
+        missing = []
+        with self._lock:
+            for token_text in tokens:
+                token_id = self._ids.get(token_text)
+                if token_id is None:
+                    missing.append(token_text)
+                else:
+                    result[token_text] = token_id
+                    if self.max_size:
+                        self._ids.move_to_end(token_text)
+            self.hits += len(result)
+            self.misses += len(missing)
+        if not missing:
+            return result
+
+        found = fetch_token_ids(conn, missing)
+        if is_create and len(found) < len(missing):
+            new_tokens = [token_text for token_text in missing if token_text not in found]
+            insert_tokens(conn, new_tokens)
+            found.update(fetch_token_ids(conn, new_tokens))
+        result.update(found)
+
+        with self._lock:
+            for token_text, token_id in found.items():
+                self._ids[token_text] = token_id
+                self._max_id = max(self._max_id, token_id)
+            self._evict()
+
+        return result
+
+    def lookup(self, conn, token_text: str) -> int | None:
+        """Returns the token_id of one token without inserting it.
+
+        Args:
+            conn: SQLite3 connection object, may be read-only.
+            token_text: String token.
+
+        Returns:
+            int: token_id
+            None: If the token isn't indexed.
+        """
+
+        return self.get_ids(conn, (token_text,), is_create=False).get(token_text)
+
+    def stats(self) -> dict:
+        """Returns the counters of the cache.
+
+        Returns:
+            dict: "size", "max_size", "hits", "misses", "evictions"
+        """
+
+        return {
+            "size": len(self._ids),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _check_max_id(self, conn):
+        """Clears the cache if the Token table lost ids it handed out.
+
+        Args:
+            conn: SQLite3 connection object.
+        """
+
+        if not self._max_id:
+            return
+        max_id = conn.execute("SELECT MAX(token_id) FROM Token").fetchone()[0]
+        if max_id is None or max_id < self._max_id:
+            self.clear()
+
+    def _evict(self):
+        """Drops least recently used tokens above max_size.
+
+        Must be called while holding _lock.
+        """
+
+        if not self.max_size:
+            return
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+            self.evictions += 1
+
+TOKEN_CACHE = TokenCache(load_settings()["token_cache_size"])
@@ -3,18 +3,39 @@
 Typical usage:
     tokens = tokenize(text)
 
+    token_tf_pairs = count_terms(page)
+
     tokenized_query = tokenize_query(query)
 """
 
 import re
+from array import array
+from collections import Counter
+from collections.abc import Iterator
 from backend.system import get_resource_path # pylint: disable=import-error
 
 LOGICAL_OPERATORS = {"AND", "NOT", "OR", "(", ")"}
 STOPLIST_PATH = get_resource_path("backend/stoplist.txt")
 URL_PATTERN = re.compile(r'\b(?:https?://)?(?:www\.)?[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}(?:/[^\s]*)?')
+URL_SUFFIX_RE = re.compile(r'\.\w{2,5}(/|$)')
 DATE_PATTERN = re.compile(r'\b(0?[1-9]|[12][0-9]|3[01])\.(0?[1-9]|1[0-2])\.(\d{4})\b')
 FILTER_RE = re.compile(r'[“\-_\.,0-9]{2,}')
 SPLIT_RE = re.compile(r"[’']+")
+# A "." before a letter or digit. URLs and dates (once "()/:" are gone)
+# can only be found in runs of non-whitespace containing one.
+DOT_HINT_RE = re.compile(r'\.[()/:]*[a-zA-Z0-9]')
+RUN_END_RE = re.compile(r'\S*')
+# "?" is only a wildcard between word characters, "chemie?" is a question
+QUERY_RE = re.compile(r'"[^"]*"|\bNEAR/\d+\b|\bAND\b|\bNOT\b|\bOR\b|\(|\)'
+                      r'|[\w*]*\*[\w*]*(?:\?[\w*]+)*|\w+(?:\?[\w*]+)+|\w+')
+NEAR_RE = re.compile(r'NEAR/\d+')
+HEADING_RE = re.compile(r'#+')
+LINE_BREAKS = frozenset('\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029') # As in str.splitlines
+
+SPECIAL_CHARS = '%^&*~[]'
+URL_PUNCTUATION = '()/:'
+STRIP_CHARS = '",.“”>`!?;=_'
+FILTER_CHARS = frozenset('“-. _,0123456789')
 
 def tokenize(content: str) -> list:
     """
@@ -28,61 +49,235 @@ def tokenize(content: str) -> list:
     Returns:
         list: All tokens.
     """
-    content = re.sub(r'[%^&*~\[\]]', '', content)
+    return list(iter_tokens(content))
 
-    urls = URL_PATTERN.findall(content)
-    content = URL_PATTERN.sub('', content)
+def iter_tokens(content: str, is_gaps: bool = False) -> Iterator[str | None]:
+    """
+    Yields the tokens of a string one by one, in the order of tokenize.
 
-    clean_urls = []
-    for url in urls:
-        url = url.split('(')[0] if '(' in url and url.count('http') > 1 else url
-        url = url.rstrip(').,;')
-        if re.search(r'\.\w{2,5}(/|$)', url):
-            clean_urls.append(url)
-    clean_urls = list(set(clean_urls))
+    URLs and dates can only occur in runs of non-whitespace characters
+    with a "." in front of a letter or digit, so only those runs go
+    through the URL and date patterns. Everything else is handled by str
+    methods and one split.
 
-    content = re.sub(r'[()/:]', '', content)
+    Args:
+        content: String to be tokenized.
+        is_gaps: Boolean whether to yield None for every stop word, so
+                positions in the stream count stop words too.
 
-    dates = ['.'.join(date) for date in DATE_PATTERN.findall(content)]
-    content = DATE_PATTERN.sub('', content)
+    Yields:
+        str: Words, then dates, then unique URLs.
+        None: In place of a stop word, only if is_gaps.
+    """
+    content = _delete_chars(content, SPECIAL_CHARS)
 
-    lines = [line.lstrip('#').strip() for line in content.splitlines() if line.strip()]
-    tokens = []
+    urls = []
+    dates = []
+    if '.' in content:
+        content = _cut_dotted_runs(content, urls, dates)
+    content = _delete_chars(content, URL_PUNCTUATION)
 
-    filter_set = set(
-        '“-. _,.' + ''.join(map(str, range(10))) + ''.join(f'{i:02}' for i in range(10))
-    )
+    if '#' in content:
+        content = HEADING_RE.sub(lambda match: _strip_heading(match, content), content)
 
-    for line in lines:
-        for word in line.split():
-            word = word.strip('",.“”>`!?;=_')
-            if len(word) == 1 and word in filter_set:
-                continue
+    for word in _iter_words(content):
+        word = word.strip(STRIP_CHARS)
+        if not word or len(word) == 1 and word in FILTER_CHARS:
+            continue
+        if not word.isalpha():
             word = FILTER_RE.sub('', word)
-            if word:
-                tokens.extend(SPLIT_RE.split(word.lower()))
+            if not word:
+                continue
+        word = word.lower()
+        if "'" in word or '’' in word:
+            for part in SPLIT_RE.split(word):
+                if part and part not in STOPLIST:
+                    yield part
+                elif part and is_gaps:
+                    yield None
+        elif word not in STOPLIST:
+            yield word
+        elif is_gaps:
+            yield None
+
+    yield from dates
+    yield from dict.fromkeys(urls)
+
+def count_terms(content: str, is_positions: bool = False) -> list[tuple]:
+    """
+    Counts the tokens of a string without building the token list.
+
+    Equal tokens are only kept once, so a page needs memory for its
+    vocabulary instead of for every token.
+
+    Args:
+        content: String to be tokenized, e.g. one page.
+        is_positions: Boolean whether token positions are collected.
+
+    Returns:
+        list: (token, tf) tuples, or (token, tf, positions) tuples with
+                positions as array('I') of indices into the token stream
+                of iter_tokens(content, is_gaps=True), so stop words
+                take up a position. Tokens are in order of first occurrence.
+    """
+    if not is_positions:
+        return list(Counter(iter_tokens(content)).items())
+
+    positions = {}
+    for position, token in enumerate(iter_tokens(content, is_gaps=True)):
+        if token is None:
+            continue
+        token_positions = positions.get(token)
+        if token_positions is None:
+            positions[token] = array('I', (position,))
+        else:
+            token_positions.append(position)
+
+    return [(token, len(token_positions), token_positions)
+            for token, token_positions in positions.items()]
+
+def _iter_words(content: str) -> Iterator[str]:
+    """
+    Splits content at whitespace one line at a time.
+
+    Yields the same words as content.split() without holding all of them.
+
+    Args:
+        content: String to split.
+
+    Yields:
+        str: Words.
+    """
+    for line in content.splitlines():
+        yield from line.split()
+
+def _delete_chars(content: str, chars: str) -> str:
+    """
+    Removes every occurrence of chars from content.
 
-    filtered_tokens = [t for t in tokens if t and t not in STOPLIST]
+    Faster than str.translate, which is slow on non-ASCII text.
 
-    return filtered_tokens + dates + clean_urls
+    Args:
+        content: String to clean.
+        chars: String of characters to remove.
+
+    Returns:
+        str: content without chars.
+    """
+    for char in chars:
+        if char in content:
+            content = content.replace(char, '')
+    return content
+
+def _cut_dotted_runs(content: str, urls: list, dates: list) -> str:
+    """
+    Removes URLs and dates from the runs of non-whitespace found by DOT_HINT_RE.
+
+    Neither pattern can match across whitespace, so working on single runs
+    finds exactly what a pass over the whole text would find.
+
+    Args:
+        content: String to clean.
+        urls: List the cleaned URLs are appended to.
+        dates: List the dates are appended to.
+
+    Returns:
+        str: content without URLs and dates.
+    """
+    parts = []
+    position = 0
+    for hint in DOT_HINT_RE.finditer(content):
+        if hint.start() < position:
+            continue
+        start = hint.start()
+        while start > position and not content[start - 1].isspace():
+            start -= 1
+        end = RUN_END_RE.match(content, hint.start()).end()
+        parts.append(content[position:start])
+        parts.append(_cut_urls_and_dates(content[start:end], urls, dates))
+        position = end
+    if not parts:
+        return content
+    parts.append(content[position:])
+
+    return ''.join(parts)
+
+def _cut_urls_and_dates(run: str, urls: list, dates: list) -> str:
+    """
+    Removes URLs and dates from a run of non-whitespace characters.
+
+    Args:
+        run: String without whitespace.
+        urls: List the cleaned URLs are appended to.
+        dates: List the dates are appended to.
+
+    Returns:
+        str: run without URLs, "()/:" and dates.
+    """
+    for url in URL_PATTERN.findall(run):
+        url = url.split('(')[0] if '(' in url and url.count('http') > 1 else url
+        url = url.rstrip(').,;')
+        if URL_SUFFIX_RE.search(url):
+            urls.append(url)
+    run = _delete_chars(URL_PATTERN.sub('', run), URL_PUNCTUATION)
+    if '.' in run:
+        dates.extend('.'.join(date) for date in DATE_PATTERN.findall(run))
+        run = DATE_PATTERN.sub('', run)
+
+    return run
+
+def _strip_heading(match: re.Match, content: str) -> str:
+    """
+    Drops a run of "#" at the start of a line, keeps it anywhere else.
+
+    Args:
+        match: Match of HEADING_RE in content.
+        content: String the match was found in.
+
+    Returns:
+        str: Replacement for the match.
+    """
+    start = match.start()
+    if start == 0 or content[start - 1] in LINE_BREAKS:
+        return ''
+    return match.group()
 
 def tokenize_query(query: str) -> list:
     """
     Tokenizes query in string format.
 
+    A phrase in double quotes becomes one token of its terms in quotes,
+    e.g. '"project management"'. Stop words inside a phrase become "*",
+    which matches any single word: '"state * * art"'. Words with "*" or
+    "?" are kept as lowercase wildcard patterns, e.g. "polymer*". A "?"
+    at the start or end of a word is punctuation, not a wildcard.
+
     Args:
         query: String query to be tokenized.
     
     Returns:
         processed_query: Query in tokenized list form.
     """
-    pattern = r'\bAND\b|\bNOT\b|\bOR\b|\(|\)|\w+'
-    tokens = re.findall(pattern, query)
+    tokens = QUERY_RE.findall(query)
 
     processed_query = []
     for token in tokens:
         if _is_operator(token):
             processed_query.append(token)
+        elif "*" in token or "?" in token:
+            if any(char.isalnum() for char in token):
+                processed_query.append(token.lower())
+        elif token.startswith('"'):
+            terms = ["*" if term is None else term
+                     for term in iter_tokens(token.strip('"').lower(), is_gaps=True)]
+            while terms and terms[-1] == "*":
+                terms.pop()
+            while terms and terms[0] == "*":
+                terms.pop(0)
+            if len(terms) > 1:
+                processed_query.append('"' + ' '.join(terms) + '"')
+            elif terms:
+                processed_query.append(terms[0])
         else:
             tokenized = tokenize(token.lower())
             if tokenized:
@@ -93,7 +288,7 @@ def tokenize_query(query: str) -> list:
 
 def _is_operator(token: str) -> bool:
     """
-    Returns whether token is a logical operator.
+    Returns whether token is a logical or NEAR/n operator.
 
     Args:
         token: String to test.
@@ -102,7 +297,7 @@ def _is_operator(token: str) -> bool:
         True: If token is logical operator.
         False: Else.
     """
-    return token in LOGICAL_OPERATORS
+    return token in LOGICAL_OPERATORS or NEAR_RE.fullmatch(token) is not None
 
 def _return_stop_list() -> set:
     """
@@ -0,0 +1,110 @@
+"""
+Directory walker built on os.scandir.
+
+Files are yielded as os.DirEntry objects while the walk is still running,
+so callers can start working on the first files right away. DirEntry caches
+what readdir already reported, so telling files from folders needs no extra
+system call on most platforms. Subtrees can be scanned by a thread pool,
+which hides the latency of network drives. Symlinked folders are not
+followed, which also rules out endless loops.
+
+Typical usage:
+    from backend.walker import walk_files
+
+    for entry in walk_files(path, is_recursive=True, ignore=["~$*"]):
+        print(entry.path)
+"""
+
+import os
+import fnmatch
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+def walk_files(
+        path: str,
+        is_recursive: bool,
+        ignore: list[str] | None = None,
+        workers: int = 1
+    ) -> Iterator[os.DirEntry]:
+    """Yields every file below path.
+
+    Folders that vanish or can't be read during the walk are skipped.
+
+    Args:
+        path: String of the folder to walk.
+        is_recursive: Boolean whether subfolders are walked.
+        ignore: Optional list of fnmatch patterns. Matching files and
+                folders (by name) are skipped, folders with everything
+                inside them.
+        workers: Integer number of threads scanning folders in parallel.
+                With 1 the walk is depth first in directory order.
+
+    Yields:
+        os.DirEntry: Entries of regular files (or symlinks to them).
+    """
+
+    ignore = tuple(ignore or ())
+    if workers <= 1:
+        pending = [path]
+        while pending:
+            files, folders = _scan_folder(pending.pop(), is_recursive, ignore)
+            yield from files
+            pending.extend(reversed(folders))
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="walker") as executor:
+        running = {executor.submit(_scan_folder, path, is_recursive, ignore)}
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, folders = future.result()
+                running.update(
+                    executor.submit(_scan_folder, folder, is_recursive, ignore)
+                    for folder in folders
+                )
+                yield from files
+
+def _scan_folder(path: str, is_recursive: bool, ignore: tuple) -> tuple[list]:
+    """Reads one folder.
+
+    Args:
+        path: String of the folder.
+        is_recursive: Boolean whether subfolders are returned.
+        ignore: Tuple of fnmatch patterns.
+
+    Returns:
+        (list, list): File entries and subfolder paths.
+    """
+
+    files = []
+    folders = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if ignore and is_ignored(entry.name, ignore):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if is_recursive:
+                            folders.append(entry.path)
+                    elif entry.is_file():
+                        files.append(entry)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+
+    return files, folders
+
+def is_ignored(name: str, ignore: tuple) -> bool:
+    """Checks name against the ignore patterns.
+
+    Args:
+        name: File or folder name.
+        ignore: Sequence of fnmatch patterns.
+
+    Returns:
+        bool: True if any pattern matches.
+    """
+
+    return any(fnmatch.fnmatch(name, pattern) for pattern in ignore)
@@ -1,24 +1,48 @@
 """
 Utilities for reindexing documents regularly
 
+The WatchdogScheduler runs in a background thread so reindexing never
+blocks a request. Every "watchdog_interval" seconds it queues a reindex job
+for "watchdog_number" stale files and a scan of the watchdog folders. Files
+are indexed and reindexed in small batches with a pause of "watchdog_pause"
+seconds in between, so the writer lock and the CPU are released for searches.
+
+Unless "watchdog_mode" is "polling", the watchdog folders are also watched
+for file system events (see backend.fswatch). Settled changes are queued as
+"changes" jobs and the periodic folder scan is skipped after the first run.
+If no event backend works on this system, the scan keeps running.
+
 Typical usage:
     run_watchdog(50) # Reindexes 50 files
+
+    start_watchdog()
+    get_watchdog_status()
 """
 
-import sqlite3
-import json
 import os
-from backend.indexer import repeat_indexing, index_path
+import time
+import queue
+import datetime
+import threading
+from collections.abc import Iterable, Iterator
+from backend.indexer import repeat_indexing, index_files
 from backend.settings import load_settings
-from backend.database import initialise_db
+from backend.connection import write_connection
+from backend.database import fetch_paths_under
+from backend.fswatch import create_backend, FolderWatcher, DELETED, MOVED_FROM
+from backend.read import EXTRACTOR_VERSIONS
+from backend.walker import walk_files, is_ignored
 
 APP_FOLDER = os.path.join(os.getenv("APPDATA"), "Hirmes")
 os.makedirs(APP_FOLDER, exist_ok=True)
 
-DB_PATH = os.path.join(APP_FOLDER, "index.db")
-
 WATCHDOG_PATH = os.path.join(APP_FOLDER, "watchdog.txt")
 
+WATCHDOG_BATCH_SIZE = 10 # Files reindexed per write transaction
+
+_scheduler = None # pylint: disable=invalid-name
+_scheduler_lock = threading.Lock()
+
 def run_watchdog(n: int) -> tuple[int]:
     """Reindexes n files.
 
@@ -28,19 +52,19 @@ def run_watchdog(n: int) -> tuple[int]:
     Returns:
         (int, int, int): Files reindexed, deleted, newly indexed
     """
-    conn = sqlite3.connect(DB_PATH)
-    initialise_db(conn)
-    to_index = _find_files_to_reindex(conn, n)
-    number_reindexed, number_deleted = repeat_indexing(conn, to_index)
+    with write_connection() as conn:
+        to_index = _find_files_to_reindex(conn, n)
+        number_reindexed, number_deleted = repeat_indexing(conn, to_index)
     number_files_indexed = _check_watchdog_list()
-    conn.commit()
-    conn.close()
 
     return number_reindexed, number_deleted, number_files_indexed
 
 def _find_files_to_reindex(conn, n: int) -> list[str]:
     """Finds n files that haven't been indexed in the past two weeks
 
+    Files indexed with an older extractor (see read.EXTRACTOR_VERSIONS)
+    come first, however recently they were indexed.
+
     Args:
         conn: SQLite3 connection object.
         n: Number of files to find.
@@ -49,39 +73,334 @@ def _find_files_to_reindex(conn, n: int) -> list[str]:
         results: List of paths to documents.
     """
 
+    outdated = " OR ".join(
+        "(path LIKE ? AND COALESCE(json_extract(metadata, '$.extractor'), 1) < ?)"
+        for _extension in EXTRACTOR_VERSIONS
+    ) or "0"
+    outdated_params = [param for extension, version in EXTRACTOR_VERSIONS.items()
+                       for param in (f"%.{extension}", version)]
     cursor = conn.cursor()
-    cursor.execute("""
+    cursor.execute(f"""
         SELECT path
         FROM Document
         WHERE 
             metadata IS NULL
             OR json_extract(metadata, '$.last_indexed') IS NULL
             OR datetime(json_extract(metadata, '$.last_indexed')) <= datetime('now', '-14 days')
-        ORDER BY datetime(json_extract(metadata, '$.last_indexed')) ASC
+            OR {outdated}
+        ORDER BY
+            ({outdated}) DESC,
+            datetime(json_extract(metadata, '$.last_indexed')) ASC
         LIMIT ?;
-    """, (n,))
+    """, (*outdated_params, *outdated_params, n))
     results = cursor.fetchall()
 
     return [row[0] for row in results]
 
-def _check_watchdog_list() -> int:
+def _check_watchdog_list(stop_event: threading.Event | None = None) -> int:
     """Checks all paths in the watchdog list for new files to index.
 
-    Also indexes them.
+    Also indexes them in rate limited batches, see _index_in_batches.
+
+    Args:
+        stop_event: Optional threading.Event that ends the scan early.
 
     Returns:
         number_files_indexed: Integer
     """
-    number_files_indexed = 0
     settings = load_settings()
-    is_recursive = settings["recursive"]
-    is_replace_full = False
+
+    def new_files() -> Iterator[str]:
+        for path in _read_watchdog_list():
+            for entry in walk_files(path, settings["recursive"], settings["ignore_patterns"],
+                                    settings["walk_workers"]):
+                if "★" not in entry.name:
+                    yield entry.path
+
+    return _index_in_batches(new_files(), stop_event)
+
+def _index_in_batches(file_paths: Iterable[str], stop_event: threading.Event | None = None) -> int:
+    """Indexes new files, WATCHDOG_BATCH_SIZE per write transaction.
+
+    The writer lock is released between batches and "watchdog_pause"
+    seconds pass before the next one, so searches and indexing started by
+    the user aren't blocked while a large folder is walked.
+
+    Args:
+        file_paths: Iterable of full paths without ID, consumed lazily.
+        stop_event: Optional threading.Event that ends indexing early.
+
+    Returns:
+        int: Number of files indexed.
+    """
+
+    pause = load_settings()["watchdog_pause"]
+    number_files_indexed = 0
+    batch = []
+    for file_path in file_paths:
+        batch.append(file_path)
+        if len(batch) < WATCHDOG_BATCH_SIZE:
+            continue
+        number_files_indexed += index_files(batch, False)
+        batch = []
+        if stop_event is None:
+            time.sleep(pause)
+        elif stop_event.wait(pause):
+            return number_files_indexed
+    if batch:
+        number_files_indexed += index_files(batch, False)
+
+    return number_files_indexed
+
+def _read_watchdog_list() -> list[str]:
+    """Returns the folders listed in WATCHDOG_PATH, creating it if missing.
+
+    Returns:
+        list: Paths without surrounding whitespace, blank lines skipped.
+    """
+
     try:
-        open(WATCHDOG_PATH, 'x')
+        with open(WATCHDOG_PATH, 'x', encoding="UTF-8"):
+            return []
     except FileExistsError:
         with open(WATCHDOG_PATH, 'r', encoding="UTF-8") as file:
-            content = file.readlines()
-        for path in content:
-            number_files_indexed += index_path(path, is_recursive, is_replace_full)
+            return [line.strip() for line in file if line.strip()]
+
+class WatchdogScheduler(threading.Thread):
+    """Background thread working through a queue of watchdog jobs.
+
+    Jobs are "reindex" (reindex up to n stale files), "scan" (index new
+    files in the watchdog folders) and "changes" (apply file system events).
+    Reindex and scan are queued every interval seconds and can be queued
+    early through request_run. With a watcher, only the first run scans.
+
+    Attributes:
+        interval: Float seconds between scheduled runs.
+        jobs: queue.Queue of (job name, argument) tuples.
+        watcher: FolderWatcher feeding "changes" jobs, or None when polling.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="watchdog", daemon=True)
+        self.interval = interval
+        self.jobs = queue.Queue()
+        self.watcher = None
+        self._stop_event = threading.Event()
+        self._status_lock = threading.Lock()
+        self._status = {
+            "state": "idle",
+            "job": None,
+            "files_done": 0,
+            "files_total": 0,
+            "reindexed": 0,
+            "deleted": 0,
+            "indexed": 0,
+            "last_run": None,
+            "next_run": None,
+            "error": None
+        }
+
+    def status(self) -> dict:
+        """Returns a snapshot of the scheduler's progress.
+
+        Returns:
+            dict: State, current job, progress and totals of the last run.
+        """
+
+        with self._status_lock:
+            status = dict(self._status)
+        status["queued"] = self.jobs.qsize()
+        status["mode"] = "polling" if self.watcher is None else "events"
+        status["events_seen"] = 0 if self.watcher is None else self.watcher.events_seen
+
+        return status
+
+    def request_run(self, is_scan: bool = True):
+        """Queues a full watchdog run without waiting for the interval.
+
+        Args:
+            is_scan: Boolean whether the watchdog folders are scanned too.
+        """
+
+        settings = load_settings()
+        self.jobs.put(("reindex", settings["watchdog_number"]))
+        if is_scan:
+            self.jobs.put(("scan", None))
+
+    def queue_changes(self, changes: dict):
+        """Queues settled file system events. Used as FolderWatcher callback.
+
+        Args:
+            changes: Dictionary of path: (kind, is_dir).
+        """
+
+        self.jobs.put(("changes", changes))
+
+    def stop(self):
+        """Stops the thread after the current batch."""
+
+        self._stop_event.set()
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.jobs.put(("stop", None))
+
+    def run(self):
+        next_run = time.monotonic()
+        is_first_run = True
+        while not self._stop_event.is_set():
+            timeout = max(0.0, next_run - time.monotonic())
+            self._update(next_run=_wall_clock_in(timeout))
+            try:
+                job, argument = self.jobs.get(timeout=timeout)
+            except queue.Empty:
+                self.request_run(is_scan=is_first_run or self.watcher is None)
+                is_first_run = False
+                next_run = time.monotonic() + self.interval
+                continue
+            if job == "stop":
+                break
+
+            self._update(state="running", job=job, error=None)
+            try:
+                if job == "reindex":
+                    self._reindex(argument)
+                elif job == "scan":
+                    self._update(indexed=_check_watchdog_list(self._stop_event))
+                elif job == "changes":
+                    self._apply_changes(argument)
+            except Exception as error: # pylint: disable=broad-exception-caught
+                self._update(error=str(error))
+            self._update(state="idle", job=None,
+                         last_run=datetime.datetime.now().isoformat(timespec="seconds"))
+
+        self._update(state="stopped", next_run=None)
+
+    def _reindex(self, n: int):
+        """Reindexes up to n stale files in rate limited batches.
+
+        Args:
+            n: Integer of files to reindex.
+        """
+
+        with write_connection() as conn:
+            to_index = _find_files_to_reindex(conn, n)
+        self._reindex_paths(to_index)
+
+    def _apply_changes(self, changes: dict):
+        """Indexes new files and reindexes changed or removed ones.
+
+        Args:
+            changes: Dictionary of path: (kind, is_dir) from FolderWatcher.
+        """
+
+        settings = load_settings()
+        ignore = settings["ignore_patterns"]
+        to_index = []
+        to_reindex = []
+        with write_connection() as conn:
+            for path, (kind, is_dir) in changes.items():
+                if kind in (DELETED, MOVED_FROM):
+                    if is_dir:
+                        to_reindex.extend(fetch_paths_under(conn, path))
+                    elif "★" in os.path.basename(path):
+                        to_reindex.append(path)
+                    continue
+                if is_dir:
+                    file_paths = [entry.path for entry in walk_files(
+                        path, settings["recursive"], ignore, settings["walk_workers"]
+                    )]
+                elif is_ignored(os.path.basename(path), ignore):
+                    continue
+                else:
+                    file_paths = [path]
+                for file_path in file_paths:
+                    if "★" in os.path.basename(file_path):
+                        to_reindex.append(file_path)
+                    else:
+                        to_index.append(file_path)
+
+        self._update(indexed=_index_in_batches(to_index, self._stop_event))
+        self._reindex_paths(to_reindex)
+
+    def _reindex_paths(self, to_index: list[str]):
+        """Reindexes files in rate limited batches.
+
+        Args:
+            to_index: List of file paths in str format.
+        """
+
+        self._update(files_total=len(to_index), files_done=0, reindexed=0, deleted=0)
+
+        pause = load_settings()["watchdog_pause"]
+        reindexed = deleted = 0
+        for start in range(0, len(to_index), WATCHDOG_BATCH_SIZE):
+            batch = to_index[start:start + WATCHDOG_BATCH_SIZE]
+            with write_connection() as conn:
+                number_reindexed, number_deleted = repeat_indexing(conn, batch)
+            reindexed += number_reindexed
+            deleted += number_deleted
+            self._update(files_done=start + len(batch), reindexed=reindexed, deleted=deleted)
+            if self._stop_event.wait(pause):
+                return
+
+    def _update(self, **changes):
+        """Updates the status dictionary.
+
+        Args:
+            **changes: Status keys and their new values.
+        """
+
+        with self._status_lock:
+            self._status.update(changes)
+
+def _wall_clock_in(seconds: float) -> str:
+    """Returns the local time in seconds as ISO string.
+
+    Args:
+        seconds: Float offset from now.
+
+    Returns:
+        str: ISO formatted time.
+    """
+
+    moment = datetime.datetime.now() + datetime.timedelta(seconds=seconds)
+    return moment.isoformat(timespec="seconds")
+
+def start_watchdog() -> WatchdogScheduler:
+    """Starts the background scheduler unless it is already running.
+
+    The first run is queued immediately. Unless "watchdog_mode" is
+    "polling", a FolderWatcher is started for the watchdog folders.
+
+    Returns:
+        WatchdogScheduler: The running scheduler.
+    """
+
+    global _scheduler # pylint: disable=global-statement
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            settings = load_settings()
+            scheduler = WatchdogScheduler(settings["watchdog_interval"])
+            if settings["watchdog_mode"] != "polling":
+                folders = [path for path in _read_watchdog_list() if os.path.isdir(path)]
+                backend = create_backend(folders, settings["recursive"]) if folders else None
+                if backend is not None:
+                    scheduler.watcher = FolderWatcher(
+                        backend, scheduler.queue_changes, settings["watchdog_debounce"]
+                    )
+                    scheduler.watcher.start()
+            scheduler.start()
+            _scheduler = scheduler
+
+    return _scheduler
+
+def get_watchdog_status() -> dict:
+    """Returns the status of the background scheduler.
+
+    Returns:
+        dict: See WatchdogScheduler.status, or {"state": "stopped"}.
+    """
 
-    return number_files_indexed
\ No newline at end of file
+    if _scheduler is None:
+        return {"state": "stopped"}
+    return _scheduler.status()
\ No newline at end of file
@@ -0,0 +1,271 @@
+"""
+Buffered writer for the Posting table.
+
+Postings of many documents are collected in memory and written in large
+batches: tokens are resolved through the process wide token cache once
+per batch, the pages of each (token, document) are packed into one row and
+rows are inserted sorted by primary key, together with the ranking
+statistics. Documents the caller marks as
+fresh (no postings stored yet) get plain INSERTs, all others go through the
+upsert of bulk_upsert_postings. In staging mode every page is appended to
+the unindexed PostingStage table of a bulk build instead.
+
+Token positions, if the caller passes them, take the same way into the
+Position table (or PositionStage), one packed row per token and document.
+
+Typical usage:
+    from backend.writer import PostingWriter
+
+    writer = PostingWriter(conn, batch_size=100_000)
+    writer.add(doc_id, page, token_tf_pairs)
+    writer.flush()
+    conn.commit()
+    print(writer.stats())
+"""
+
+import time
+from backend.database import ( # pylint: disable=import-error
+    delete_postings_for_doc_id,
+    delete_staged_postings_for_doc_id,
+    update_posting_stats,
+    UPSERT_POSTING_SQL,
+    UPSERT_POSITION_SQL
+)
+from backend.packing import pack_pages, pack_positions # pylint: disable=import-error
+from backend.token_cache import TOKEN_CACHE # pylint: disable=import-error
+
+DEFAULT_BATCH_SIZE = 100_000 # Buffered postings that trigger a flush
+
+INSERT_SQL = "INSERT INTO Posting(token_id, doc_id, pages, tf) VALUES (?, ?, ?, ?)"
+STAGE_SQL = "INSERT INTO PostingStage(token_id, doc_id, page, tf) VALUES (?, ?, ?, ?)"
+UPSERT_SQL = UPSERT_POSTING_SQL
+INSERT_POSITION_SQL = "INSERT INTO Position(token_id, doc_id, positions) VALUES (?, ?, ?)"
+STAGE_POSITION_SQL = "INSERT INTO PositionStage(token_id, doc_id, positions) VALUES (?, ?, ?)"
+
+class PostingWriter:
+    """Collects postings across documents and writes them in batches.
+
+    Postings added twice for the same doc_id and page are summed up in
+    the buffer. The writer never commits; callers flush before they commit.
+
+    Attributes:
+        conn: SQLite3 connection object the rows are written to.
+        batch_size: Integer number of buffered postings that triggers a flush.
+        token_cache: TokenCache resolving token_text to token_id.
+        is_staging: Boolean whether rows go to PostingStage (see
+                database.create_posting_stage).
+    """
+
+    def __init__(self, conn, batch_size: int | None = None, token_cache=None,
+                 is_staging: bool = False):
+        """Prepares an empty buffer.
+
+        Args:
+            conn: SQLite3 connection object.
+            batch_size: Optional integer, DEFAULT_BATCH_SIZE if None or < 1.
+            token_cache: Optional TokenCache, the process wide TOKEN_CACHE if None.
+            is_staging: Boolean whether rows are appended to PostingStage
+                    unsorted, to be merged by database.merge_posting_stage.
+        """
+
+        self.conn = conn
+        self.batch_size = batch_size if batch_size and batch_size > 0 else DEFAULT_BATCH_SIZE
+        self.token_cache = TOKEN_CACHE if token_cache is None else token_cache
+        self.is_staging = is_staging
+        self._buffer = {}
+        self._positions = {}
+        self._fresh = set()
+        self._staged = set()
+        self._last_doc = None
+        self._flushed_doc = None
+        self._buffered = 0
+        self._postings_written = 0
+        self._flushes = 0
+        self._seconds = 0.0
+
+    def add(self, doc_id: int, page: int, token_tf_pairs: list[tuple], is_fresh: bool = True):
+        """Buffers the postings of one page and flushes if the buffer is full.
+
+        Args:
+            doc_id: Integer ID of the file the tokens belong to.
+            page: Integer page number.
+            token_tf_pairs: List of (token_text, tf) tuples, or of
+                    (token_text, tf, positions) tuples from
+                    tokenizer.count_terms to also store the positions.
+            is_fresh: Boolean whether doc_id has no postings in the database,
+                    so its rows can't conflict. A document that was being
+                    added when the buffer got flushed counts as stored.
+        """
+
+        if doc_id == self._flushed_doc:
+            is_fresh = False
+        self._last_doc = doc_id
+        if is_fresh and doc_id not in self._buffer:
+            self._fresh.add(doc_id)
+        elif not is_fresh:
+            self._fresh.discard(doc_id)
+        if token_tf_pairs and len(token_tf_pairs[0]) == 3:
+            self._add_positions(doc_id, page, token_tf_pairs)
+            token_tf_pairs = [(token_text, tf) for token_text, tf, _positions in token_tf_pairs]
+        pages = self._buffer.setdefault(doc_id, {})
+        counts = pages.get(page)
+        if counts is None:
+            pages[page] = dict(token_tf_pairs)
+            self._buffered += len(pages[page])
+        else:
+            for token_text, tf in token_tf_pairs:
+                if token_text not in counts:
+                    self._buffered += 1
+                counts[token_text] = counts.get(token_text, 0) + tf
+        if self._buffered >= self.batch_size:
+            self.flush()
+
+    def _add_positions(self, doc_id: int, page: int, token_tf_positions: list[tuple]):
+        """Buffers the positions of one page, see add.
+
+        Args:
+            doc_id: Integer ID of the file the tokens belong to.
+            page: Integer page number.
+            token_tf_positions: List of (token_text, tf, positions) tuples.
+        """
+
+        page_positions = self._positions.setdefault(doc_id, {}).setdefault(page, {})
+        for token_text, _tf, positions in token_tf_positions:
+            stored = page_positions.get(token_text)
+            if stored is None:
+                page_positions[token_text] = positions
+            else:
+                page_positions[token_text] = sorted(set(stored).union(positions))
+
+    def delete_doc(self, doc_id: int):
+        """Drops buffered and stored postings of doc_id.
+
+        In staging mode rows this writer already staged for doc_id are
+        deleted from the staging tables too, so the merge doesn't bring
+        them back.
+
+        Args:
+            doc_id: Integer document identifier.
+        """
+
+        self._positions.pop(doc_id, None)
+        pages = self._buffer.pop(doc_id, None)
+        if pages:
+            self._buffered -= sum(len(counts) for counts in pages.values())
+        delete_postings_for_doc_id(self.conn, doc_id)
+        if doc_id in self._staged:
+            delete_staged_postings_for_doc_id(self.conn, doc_id)
+            self._staged.discard(doc_id)
+        self._fresh.add(doc_id)
+        if doc_id == self._flushed_doc:
+            self._flushed_doc = None
+
+    def flush(self):
+        """Writes all buffered postings."""
+
+        if not self._buffer:
+            return
+        start = time.perf_counter()
+
+        tokens = {
+            token_text
+            for pages in self._buffer.values()
+            for counts in pages.values()
+            for token_text in counts
+        }
+        token_ids = self.token_cache.get_ids(self.conn, tokens)
+
+        cur = self.conn.cursor()
+        if self.is_staging:
+            rows = [
+                (token_ids[token_text], doc_id, page, int(tf))
+                for doc_id, pages in self._buffer.items()
+                for page, counts in pages.items()
+                for token_text, tf in counts.items()
+            ]
+            cur.executemany(STAGE_SQL, rows)
+            self._staged.update(self._buffer)
+            cur.executemany(STAGE_POSITION_SQL, [
+                (token_ids[token_text], doc_id, pack_positions(((page, positions),)))
+                for doc_id, pages in self._positions.items()
+                for page, page_positions in pages.items()
+                for token_text, positions in page_positions.items()
+            ])
+            written = len(rows)
+        else:
+            fresh_rows = []
+            other_rows = []
+            written = 0
+            for doc_id, pages in self._buffer.items():
+                page_tfs = {}
+                for page, counts in pages.items():
+                    for token_text, tf in counts.items():
+                        page_tfs.setdefault(token_ids[token_text], []).append((page, int(tf)))
+                rows = fresh_rows if doc_id in self._fresh else other_rows
+                for token_id, pairs in page_tfs.items():
+                    pairs.sort()
+                    rows.append((token_id, doc_id, pack_pages(pairs),
+                                 sum(tf for _page, tf in pairs)))
+                    written += len(pairs)
+            for rows, is_new, sql in ((fresh_rows, True, INSERT_SQL),
+                                      (other_rows, False, UPSERT_SQL)):
+                if not rows:
+                    continue
+                rows.sort()
+                update_posting_stats(self.conn, [(token_id, doc_id, tf)
+                                                 for token_id, doc_id, _pages, tf in rows], is_new)
+                cur.executemany(sql, rows)
+            self._write_positions(token_ids)
+
+        self._postings_written += written
+        self._flushes += 1
+        self._seconds += time.perf_counter() - start
+        self._buffer = {}
+        self._positions = {}
+        self._fresh = set()
+        self._flushed_doc = self._last_doc
+        self._buffered = 0
+
+    def _write_positions(self, token_ids: dict):
+        """Packs the buffered positions per token and document and writes them.
+
+        Args:
+            token_ids: Dictionary of token_text: token_id covering the buffer.
+        """
+
+        fresh_rows = []
+        other_rows = []
+        for doc_id, pages in self._positions.items():
+            doc_positions = {}
+            for page, page_positions in pages.items():
+                for token_text, positions in page_positions.items():
+                    doc_positions.setdefault(token_ids[token_text], []).append((page, positions))
+            rows = fresh_rows if doc_id in self._fresh else other_rows
+            for token_id, page_positions in doc_positions.items():
+                page_positions.sort(key=lambda item: item[0])
+                rows.append((token_id, doc_id, pack_positions(page_positions)))
+
+        cur = self.conn.cursor()
+        for rows, sql in ((fresh_rows, INSERT_POSITION_SQL), (other_rows, UPSERT_POSITION_SQL)):
+            if rows:
+                rows.sort(key=lambda row: row[:2])
+                cur.executemany(sql, rows)
+
+    def stats(self) -> dict:
+        """Returns the throughput of all flushes so far.
+
+        Returns:
+            dict:
+                postings: Integer number of postings written.
+                flushes: Integer number of flushes.
+                seconds: Float seconds spent flushing.
+                postings_per_second: Float throughput of the flushes.
+        """
+
+        return {
+            "postings": self._postings_written,
+            "flushes": self._flushes,
+            "seconds": self._seconds,
+            "postings_per_second": (self._postings_written / self._seconds
+                                    if self._seconds else 0.0),
+        }
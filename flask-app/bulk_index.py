@@ -0,0 +1,41 @@
+"""Builds the index of a large folder in bulk mode.
+
+Postings are loaded into an unindexed staging table and the Posting table
+is rebuilt and swapped in once at the end, see backend.indexer.index_path.
+Run it while the app is closed.
+
+Usage:
+    python bulk_index.py <folder> [--recursive] [--replace-filename] [--workers N]
+"""
+
+import time
+import argparse
+from backend.connection import init_db, close_connections
+from backend.indexer import index_path
+from backend.settings import load_settings
+
+def main():
+    """Parses the command line and runs the bulk build."""
+
+    parser = argparse.ArgumentParser(description="Index a folder in bulk mode.")
+    parser.add_argument("path", help="folder to index")
+    parser.add_argument("--recursive", action="store_true", help="include subfolders")
+    parser.add_argument("--replace-filename", action="store_true",
+                        help="replace the full file name with the ID")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="extraction processes, 0 for one per CPU")
+    args = parser.parse_args()
+
+    workers = load_settings()["index_workers"] if args.workers is None else args.workers
+    print(f"Indexing {args.path} with {workers or 'all'} workers...")
+
+    init_db()
+    start = time.perf_counter()
+    number_indexed = index_path(args.path, args.recursive, args.replace_filename, is_bulk=True,
+                                workers=workers)
+    close_connections()
+
+    print(f"Done! Indexed {number_indexed} files in {time.perf_counter() - start:.1f} s.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Migrates the index database to the current schema and compacts it.
+
+The app migrates an old Posting table on startup as well; this script
+additionally runs VACUUM, so the space of the old table is given back to
+the file system, and reports the sizes. Run it while the app is closed.
+
+Usage:
+    python migrate_db.py [--db PATH]
+"""
+
+import os
+import time
+import sqlite3
+import argparse
+from backend.connection import DB_PATH
+from backend.database import initialise_db, get_schema_version, SCHEMA_VERSION
+
+def main():
+    """Parses the command line and migrates the database."""
+
+    parser = argparse.ArgumentParser(description="Migrate the index to the current schema.")
+    parser.add_argument("--db", default=DB_PATH, help="path of index.db")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"No database at {args.db}.")
+        return
+
+    conn = sqlite3.connect(args.db)
+    size_before = os.path.getsize(args.db)
+    version = get_schema_version(conn)
+    print(f"Migrating {args.db} from schema {version} to {SCHEMA_VERSION}...")
+
+    start = time.perf_counter()
+    initialise_db(conn)
+    conn.commit()
+    conn.execute("VACUUM")
+    rows = conn.execute("SELECT COUNT(*) FROM Posting").fetchone()[0]
+    conn.close()
+
+    size_after = os.path.getsize(args.db)
+    print(f"Done! {rows} posting rows, {size_before / 2**20:.1f} MB -> "
+          f"{size_after / 2**20:.1f} MB in {time.perf_counter() - start:.1f} s.")
+
+if __name__ == '__main__':
+    main()
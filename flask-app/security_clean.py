@@ -3,6 +3,7 @@ Reverts all filename changes and ID assignments.
 """
 
 import os
+from backend.walker import walk_files # pylint: disable=import-error
 
 def clean(path):
     """
@@ -15,35 +16,26 @@ def clean(path):
         i: Number of changes reverted
     """
     i = 0
-    try:
-        entries = os.listdir(path)
-    except FileNotFoundError:
+    if not os.path.isdir(path):
         print(f"Path not found: {path}")
         return 0
 
-    for entry in entries:
-        full_path = os.path.join(path, entry)
+    for entry in walk_files(path, is_recursive=True):
+        if "★" in entry.name:
+            dir_name = os.path.dirname(entry.path)
+            file_name, file_extension = os.path.splitext(entry.name)
 
-        if os.path.isdir(full_path):
-            i += clean(full_path)
+            cutoff_char = " ★"
+            trimmed = file_name.split(cutoff_char)[0] + file_extension
 
-        elif os.path.isfile(full_path):
-            if "★" in entry:
-                dir_name = os.path.dirname(full_path)
-                base_name = os.path.basename(full_path)
-                file_name, file_extension = os.path.splitext(base_name)
+            new_path = os.path.join(dir_name, trimmed)
 
-                cutoff_char = " ★"
-                trimmed = file_name.split(cutoff_char)[0] + file_extension
-
-                new_path = os.path.join(dir_name, trimmed)
-
-                if not os.path.exists(new_path):
-                    os.rename(full_path, new_path)
-                    print(f"Renamed: {full_path} -> {new_path}\n")
-                    i += 1
-                else:
-                    print(f"Skipped (target exists): {new_path}\n")
+            if not os.path.exists(new_path):
+                os.rename(entry.path, new_path)
+                print(f"Renamed: {entry.path} -> {new_path}\n")
+                i += 1
+            else:
+                print(f"Skipped (target exists): {new_path}\n")
     return i
 
 if __name__ == '__main__':
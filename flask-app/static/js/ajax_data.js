@@ -77,55 +77,115 @@ document.getElementById("progressOverlay").addEventListener("click", function(e)
     e.stopPropagation();
 });
 
-function displaySearchResults(results) {
-    const container = document.getElementById("searchResults") || document.createElement("div");
-    container.id = "searchResults";
-    container.innerHTML = `
-        <h2>Search Results</h2>
-        <table>
-            <tr>
-                <th>Path</th>
-                <th>Pages</th>
-                <th>Terms matched</th>
-                <th>Snippets</th>
-            </tr>
-            ${results.map(row => `
+const PAGE_SIZE = 50;
+
+function displaySearchResults(results, nextCursor, isAppend) {
+    let container = document.getElementById("searchResults");
+    if (!container) {
+        container = document.createElement("div");
+        container.id = "searchResults";
+        document.body.appendChild(container);
+    }
+    if (!isAppend) {
+        container.innerHTML = `
+            <h2>Search Results</h2>
+            <table id="resultTable">
                 <tr>
-                    <td>${row.path}</td>
-                    <td>${row.page_numbers.join(", ")}</td>
-                    <td><ul>${row.match_terms.map(t => `<li>${t}</li>`).join('')}</ul></td>
-                    <td><ul>${row.snippet.map(s => `<li>${s}</li>`).join('')}</ul></td>
+                    <th>Path</th>
+                    <th>Pages</th>
+                    <th>Terms matched</th>
+                    <th>Snippets</th>
                 </tr>
-            `).join('')}
-        </table>
-    `;
-    document.body.appendChild(container);
+            </table>
+            <button id="moreResults" style="display: none">More results</button>
+        `;
+    }
+
+    const table = document.getElementById("resultTable");
+    const rows = results.map(result => {
+        const row = table.insertRow();
+        row.innerHTML = `
+            <td>${result.path}</td>
+            <td>${result.page_numbers.join(", ")}</td>
+            <td><ul>${result.match_terms.map(t => `<li>${t}</li>`).join('')}</ul></td>
+            <td><button class="snippet-button">Show snippets</button></td>
+        `;
+        row.querySelector(".snippet-button").addEventListener("click", () => loadSnippet(result, row));
+        return row;
+    });
+
+    const more = document.getElementById("moreResults");
+    more.style.display = nextCursor ? "block" : "none";
+    more.onclick = () => callSearch(currentSearch.query, currentSearch.fullText, nextCursor);
+
+    return rows;
+}
+
+function showSnippet(row, snippet) {
+    row.cells[3].innerHTML = `<ul>${snippet.map(s => `<li>${s}</li>`).join('')}</ul>`;
 }
 
-function callSearch(query, full_text) {
-    fetch(`/search`, {
+function loadSnippet(result, row) {
+    fetch("/snippet", {
         method: "POST",
         headers: {"Content-Type": "application/json"},
-        body: JSON.stringify({
-            query: query,
-            full_text: full_text,
-        })
+        body: JSON.stringify(result)
     })
     .then(res => res.json())
-    .then(data => {
-        if (data.error) {
+    .then(data => showSnippet(row, data.snippet || []))
+    .catch(() => showPopup("Snippets failed!"));
+}
+
+let currentSearch = {query: "", fullText: false};
+
+async function callSearch(query, full_text, cursor) {
+    currentSearch = {query: query, fullText: full_text};
+    try {
+        const res = await fetch(`/search`, {
+            method: "POST",
+            headers: {"Content-Type": "application/json"},
+            body: JSON.stringify({
+                query: query,
+                full_text: full_text,
+                limit: PAGE_SIZE,
+                cursor: cursor,
+                stream: true
+            })
+        });
+        if (!res.ok) {
+            const data = await res.json();
             showPopup(data.error);
-        } else {
-            displaySearchResults(data.results);
-            if (data.spellchecked != query) {
-                showDidYouMean(data.spellchecked);
+            return;
+        }
+
+        // One JSON object per line: the page, its snippets, then the spellcheck
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = "";
+        let rows = [];
+        for (;;) {
+            const {done, value} = await reader.read();
+            if (done) {
+                break;
+            }
+            buffered += decoder.decode(value, {stream: true});
+            const lines = buffered.split("\n");
+            buffered = lines.pop();
+            for (const line of lines.filter(Boolean)) {
+                const event = JSON.parse(line);
+                if (event.type === "page") {
+                    rows = displaySearchResults(event.results, event.next_cursor, Boolean(cursor));
+                } else if (event.type === "snippet") {
+                    showSnippet(rows[event.index], event.snippet);
+                } else if (event.type === "spellcheck" && !cursor && event.spellchecked != query) {
+                    showDidYouMean(event.spellchecked);
+                }
             }
         }
-    })
-    .catch(err => {
+    } catch (err) {
         console.error("Fetch failed:", err);
         showPopup("Search failed!");
-    });
+    }
 }
 
 function showDidYouMean(text) {
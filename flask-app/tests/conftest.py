@@ -0,0 +1,54 @@
+import os
+import sqlite3
+import pytest
+import backend.search as search
+from backend import connection
+from backend import settings as backend_settings
+from backend.database import initialise_db
+from backend.indexer import index_path
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Points all connections at a fresh database in tmp_path."""
+    path = str(tmp_path / "index.db")
+    connection.close_connections()
+    monkeypatch.setattr(connection, "DB_PATH", path)
+    yield path
+    connection.close_connections()
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    """Keeps config.json in tmp_path and returns save_settings to change it."""
+    monkeypatch.setattr(backend_settings, "SETTINGS_FILE", str(tmp_path / "config.json"))
+    return backend_settings.save_settings
+
+@pytest.fixture
+def fresh_db():
+    """Returns a function creating an empty in-memory database."""
+    def make():
+        conn = sqlite3.connect(":memory:")
+        initialise_db(conn)
+        return conn
+    return make
+
+@pytest.fixture
+def index_texts():
+    """Returns a function indexing {name: text} as .txt files in a new folder.
+
+    Keyword arguments are passed on to index_path, e.g. is_bulk=True.
+    """
+    def index(folder, texts, **kwargs):
+        folder.mkdir()
+        for name, text in texts.items():
+            (folder / f"{name}.txt").write_text(text, encoding="utf-8")
+        return index_path(str(folder), False, False, **kwargs)
+    return index
+
+@pytest.fixture
+def result_names():
+    """Returns a function giving the sorted names of the .txt files a query finds."""
+    def names(query):
+        results, _spellchecked = search.search_index(query)
+        return sorted(os.path.basename(result["path"]).split(" ★")[0].removesuffix(".txt")
+                      for result in results or [])
+    return names
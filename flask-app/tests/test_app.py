@@ -0,0 +1,77 @@
+import json
+import pytest
+from backend.indexer import index_path
+
+@pytest.fixture
+def client(tmp_path, db_path, settings):
+    from app import app
+    folder = tmp_path / "corpus"
+    folder.mkdir()
+    for i in range(12):
+        (folder / f"note{i}.txt").write_text("Chemie " * (i + 1) + "und Physik", encoding="utf-8")
+    settings({"index_workers": 1})
+    index_path(str(folder), False, False)
+    return app.test_client()
+
+def test_cursor_pages_through_all_results(client):
+    everything = client.post("/search", json={"query": "Chemie"}).get_json()
+    assert len(everything["results"]) == 12 and everything["next_cursor"] is None
+
+    paths, cursor = [], None
+    while True:
+        page = client.post("/search", json={"query": "Chemie", "limit": 5, "cursor": cursor}).get_json()
+        paths += [result["path"] for result in page["results"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert paths == [result["path"] for result in everything["results"]]
+
+def test_stream_sends_page_before_snippets(client):
+    response = client.post("/search", json={"query": "Chemie", "limit": 8, "stream": True})
+    assert response.mimetype == "application/x-ndjson"
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert [event["type"] for event in events] == ["page"] + ["snippet"] * 5 + ["spellcheck"]
+    page = events[0]
+    assert len(page["results"]) == 8 and page["next_cursor"]
+    assert all(result["snippet"] == [] for result in page["results"])
+    assert all(event["snippet"] for event in events[1:6])
+
+def test_snippet_on_request(client):
+    result = client.post("/search", json={"query": "Physik", "limit": 10}).get_json()["results"][-1]
+    assert result["snippet"] == []
+
+    snippet = client.post("/snippet", json=result).get_json()["snippet"]
+    assert snippet and "Physik" in snippet[0]
+    assert client.post("/snippet", json={**result, "path": "/etc/passwd"}).status_code == 404
+
+def test_invalid_cursor_and_query(client):
+    assert client.post("/search", json={"query": "Chemie", "cursor": "kaputt"}).status_code == 400
+    assert client.post("/search", json={"query": "( Chemie", "stream": True}).status_code == 400
+
+def test_snippets_come_from_stored_page_text(client):
+    from backend.connection import write_connection
+    from backend.indexer import repeat_indexing
+    result = client.post("/search", json={"query": "Physik", "limit": 1}).get_json()["results"][0]
+    with open(result["path"], "w", encoding="utf-8") as f:
+        f.write("Biologie und Physik der Zelle")
+
+    snippet = client.post("/snippet", json=result).get_json()["snippet"]
+    assert snippet and "Chemie" in snippet[0]
+
+    with write_connection() as conn:
+        conn.execute("UPDATE Document SET metadata = NULL")
+        repeat_indexing(conn, [result["path"]])
+    snippet = client.post("/snippet", json=result).get_json()["snippet"]
+    assert snippet == ["Biologie und Physik der Zelle"]
+
+def test_suggest(client):
+    assert client.post("/suggest", json={"query": "Chemi AND Physk"}).get_json() == {
+        "spellchecked": "chemie AND physik"}
+
+def test_stats_report_cache_hit_rates(client):
+    client.post("/search", json={"query": "Chemie", "limit": 5})
+    client.post("/search", json={"query": "Chemie", "limit": 5})
+    stats = client.get("/stats").get_json()
+    assert stats["result_cache"]["hits"] >= 1 and 0 < stats["result_cache"]["hit_rate"] <= 1
+    assert stats["posting_cache"]["size"] >= 1
@@ -0,0 +1,20 @@
+import threading
+from backend.connection import init_db, read_connection, write_connection
+
+def _read_in_thread(sql):
+    rows = []
+    thread = threading.Thread(target=lambda: rows.extend(read_connection().execute(sql).fetchall()),
+                              daemon=True)
+    thread.start()
+    thread.join(2)
+    return rows
+
+def test_new_reader_does_not_wait_for_the_writer(db_path):
+    init_db()
+    with write_connection() as conn:
+        conn.execute("INSERT INTO Token(token_text) VALUES ('chemie')")
+        conn.commit()
+        assert _read_in_thread("SELECT token_text FROM Token") == [("chemie",)]
+
+def test_first_reader_creates_the_schema(db_path):
+    assert _read_in_thread("SELECT COUNT(*) FROM Document") == [(0,)]
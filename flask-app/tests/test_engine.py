@@ -0,0 +1,92 @@
+import threading
+import pytest
+import backend.engine as engine
+import backend.search as search
+from backend.connection import read_connection
+from backend.indexer import index_path
+from backend.tokenizer import tokenize_query
+
+DOCUMENTS = {
+    "a.txt": "Chemie und Synthetische Kunststoffe. Chemie!",
+    "b.txt": "Tenside sind Polymerbausteine",
+    "c.md": "Wasserstoff und Veresterung in der Chemie",
+    "d.txt": "Synthetische Tenside und Kunststoffe",
+    "e.txt": "Nichts davon",
+}
+
+QUERIES = [
+    "Chemie",
+    "Synthetische AND Kunststoffe",
+    "Tenside OR Polymerbausteine",
+    "NOT Chemie",
+    "( Wasserstoff OR Veresterung ) AND Chemie",
+    "( Tenside OR Chemie ) AND NOT Kunststoffe",
+    "Fehlt OR Chemie",
+    "Chemie NOT Kunststoffe",
+    "Tenside OR Wasserstoff NOT Chemie",
+]
+
+@pytest.fixture
+def indexed_db(tmp_path, db_path, settings):
+    folder = tmp_path / "corpus"
+    folder.mkdir()
+    for name, text in DOCUMENTS.items():
+        (folder / name).write_text(text, encoding="utf-8")
+    settings({"index_workers": 1})
+    index_path(str(folder), False, False)
+    return db_path
+
+def _run(settings, engine, query):
+    settings({"search_engine": engine})
+    results = search._evaluate_rpn_ranked(search._to_rpn(tokenize_query(query)))
+    return sorted((r["path"], r["page_numbers"], sorted(r["match_terms"])) for r in results)
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_memory_engine_matches_sqlite(indexed_db, settings, query):
+    assert _run(settings, "memory", query) == _run(settings, "sqlite", query)
+
+def test_binary_not_is_difference(indexed_db, settings):
+    both = {r[0] for r in _run(settings, "sqlite", "Chemie AND Kunststoffe")}
+    chemie = [r[0] for r in _run(settings, "sqlite", "Chemie")]
+    difference = [r[0] for r in _run(settings, "sqlite", "Chemie NOT Kunststoffe")]
+    assert both and difference == [path for path in chemie if path not in both]
+
+def test_set_algebra_matches_python_sets():
+    import random
+    from array import array
+    from backend.engine import intersect, union, difference
+
+    rng = random.Random(4)
+    for _ in range(500):
+        small = array('I', sorted(rng.sample(range(2000), rng.randint(0, 50))))
+        large = array('I', sorted(rng.sample(range(2000), rng.randint(0, 1500))))
+        for left, right in ((small, large), (large, small)):
+            assert list(intersect(left, right)) == sorted(set(left) & set(right))
+            assert list(union(left, right)) == sorted(set(left) | set(right))
+            assert list(difference(left, right)) == sorted(set(left) - set(right))
+
+def test_memory_index_loads_outside_the_lock_and_stays_bounded(indexed_db, monkeypatch):
+    memory_index = engine.MemoryIndex(max_bytes=100)
+    conn = read_connection()
+    chemie = memory_index.postings(conn, "chemie")
+    is_loading, is_released = threading.Event(), threading.Event()
+    load = engine.load_posting_list
+
+    def slow_load(conn, token_text):
+        if token_text == "tenside":
+            is_loading.set()
+            is_released.wait(5)
+        return load(conn, token_text)
+
+    monkeypatch.setattr(engine, "load_posting_list", slow_load)
+    thread = threading.Thread(target=lambda: memory_index.postings(read_connection(), "tenside"))
+    thread.start()
+    assert is_loading.wait(5)
+    assert memory_index.postings(conn, "chemie") is chemie
+    assert len(memory_index.all_doc_ids(conn)) == len(DOCUMENTS)
+    is_released.set()
+    thread.join()
+
+    for token_text in ("kunststoffe", "synthetische", "wasserstoff", "veresterung"):
+        memory_index.postings(conn, token_text)
+    assert 0 < memory_index.stats()["bytes"] <= 100 and memory_index.stats()["evictions"] > 0
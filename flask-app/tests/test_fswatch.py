@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import pytest
+import backend.watchdog as watchdog
+from backend import fswatch
+from backend.connection import read_connection
+from backend.indexer import _get_files_without_id
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+
+BENCH_FILES = int(os.getenv("HIRMES_BENCH_FILES", "2000")) # e.g. 100000 for a large corpus
+
+def _wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+def _indexed_paths():
+    return {path for (path,) in read_connection().execute("SELECT path FROM Document")}
+
+def test_backend_reports_created_modified_and_deleted(tmp_path):
+    backend = fswatch.create_backend([str(tmp_path)], is_recursive=True)
+    assert backend is not None
+    try:
+        events = []
+        (tmp_path / "sub").mkdir()
+        # Files written before the new folder's watch exists are picked up by
+        # the watchdog walking the created folder, so wait for the watch here.
+        _wait_for(lambda: events.extend(backend.read_events(0.1)) or events)
+        (tmp_path / "sub" / "a.txt").write_text("Hallo", encoding="utf-8")
+        (tmp_path / "b.txt").write_text("Welt", encoding="utf-8")
+        (tmp_path / "b.txt").unlink()
+        _wait_for(lambda: events.extend(backend.read_events(0.1)) or len(events) >= 6)
+    finally:
+        backend.close()
+
+    assert (fswatch.CREATED, str(tmp_path / "sub"), True) in events
+    assert (fswatch.MODIFIED, str(tmp_path / "sub" / "a.txt"), False) in events
+    assert (fswatch.DELETED, str(tmp_path / "b.txt"), False) in events
+
+def test_events_index_new_files_and_drop_deleted_ones(tmp_path, monkeypatch, db_path, settings):
+    folder = tmp_path / "corpus"
+    folder.mkdir()
+    watch_list = tmp_path / "watchdog.txt"
+    watch_list.write_text(str(folder) + "\n", encoding="utf-8")
+    settings({"index_workers": 1, "watchdog_pause": 0, "watchdog_debounce": 0.1, "watchdog_interval": 3600})
+    monkeypatch.setattr(watchdog, "WATCHDOG_PATH", str(watch_list))
+    monkeypatch.setattr(watchdog, "_scheduler", None)
+
+    scheduler = watchdog.start_watchdog()
+    try:
+        assert scheduler.status()["mode"] == "events"
+        note = folder / "note.txt"
+        note.write_text("Chemie und Physik", encoding="utf-8")
+        assert _wait_for(lambda: any("note" in path for path in _indexed_paths()))
+
+        starred = next(path for path in _indexed_paths() if "note" in path)
+        os.remove(starred)
+        assert _wait_for(lambda: not _indexed_paths())
+    finally:
+        scheduler.stop()
+        scheduler.join(5)
+
+@pytest.mark.bench
+def test_benchmark_event_detection_against_polling(tmp_path, benchmark):
+    for i in range(BENCH_FILES):
+        folder = tmp_path / f"dir{i // 500}"
+        folder.mkdir(exist_ok=True)
+        (folder / f"file{i}.txt").write_text("x", encoding="utf-8")
+
+    backend = fswatch.create_backend([str(tmp_path)], is_recursive=True)
+    try:
+        cpu, wall = time.process_time(), time.perf_counter()
+        found = sum(1 for _path in _get_files_without_id(str(tmp_path), True))
+        benchmark.extra_info["polling_wall_ms"] = (time.perf_counter() - wall) * 1000
+        benchmark.extra_info["polling_cpu_ms"] = (time.process_time() - cpu) * 1000
+        assert found == BENCH_FILES
+
+        target = tmp_path / "dir0" / "new.txt"
+        events = []
+
+        def detect():
+            cpu = time.process_time()
+            target.write_text("y", encoding="utf-8")
+            _wait_for(lambda: events.extend(backend.read_events(0.05)) or
+                      (fswatch.MODIFIED, str(target), False) in events)
+            benchmark.extra_info["inotify_cpu_ms"] = (time.process_time() - cpu) * 1000
+
+        benchmark.pedantic(detect, rounds=1, iterations=1)
+    finally:
+        backend.close()
+
+    assert (fswatch.MODIFIED, str(target), False) in events
@@ -1,4 +1,14 @@
+import os
+import time
+import random
+import sqlite3
+import pytest
+import bulk_index
+from backend import connection, indexer, read
+from backend.database import fetch_doc_id, fetch_page_texts, store_page_text
 from backend.indexer import index_path
+from backend.packing import pack_text, unpack_pages
+from backend.settings import load_settings
 from security_clean import clean 
 
 
@@ -8,3 +18,176 @@ path = 'F:\\auto-id-test\\biblio'
 def test_indexing_speed(benchmark):
     result = benchmark.pedantic(index_path, args=(path, True, False), iterations=1, rounds=1, warmup_rounds=0)
     assert result > 0
+
+SAMPLE_TEXTS = [
+    "Synthetische Kunststoffe und Polymerbausteine.\nSiehe https://example.com/chemie am 12.03.2024",
+    "Tenside, Veresterung und Wasserstoff.\n# Überschrift\nChemie ist überall",
+    "project management OR geography, it's a plan's outline",
+]
+
+def _make_corpus(folder):
+    for i in range(12):
+        extension = "md" if i % 3 == 0 else "txt"
+        (folder / f"doc{i}.{extension}").write_text(SAMPLE_TEXTS[i % 3] * (i + 1), encoding="utf-8")
+    (folder / "ignored.bin").write_bytes(b"\x00\x01")
+
+def _dump_index(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("""
+        SELECT d.path, t.token_text, p.pages
+        FROM Posting p
+        JOIN Token t ON t.token_id = p.token_id
+        JOIN Document d ON d.doc_id = p.doc_id
+    """).fetchall()
+    conn.close()
+    return sorted((os.path.basename(path).split(" ★")[0], token, page, tf)
+                  for path, token, pages in rows
+                  for page, tf in unpack_pages(pages))
+
+BENCH_FILES = int(os.getenv("HIRMES_BENCH_FILES", "300")) # e.g. 50000 for a large corpus
+
+def _index_with_workers(tmp_path, monkeypatch, settings, workers, is_bulk=False, make_corpus=None):
+    name = f"{workers}_{'bulk' if is_bulk else 'incremental'}"
+    folder = tmp_path / f"corpus_{name}"
+    folder.mkdir()
+    (make_corpus or _make_corpus)(folder)
+    db_path = str(tmp_path / f"index_{name}.db")
+    connection.close_connections()
+    monkeypatch.setattr(connection, "DB_PATH", db_path)
+    settings({"index_workers": workers})
+    found = index_path(str(folder), True, False, is_bulk=is_bulk)
+    connection.close_connections()
+    return found, _dump_index(db_path)
+
+def test_worker_pool_matches_serial(tmp_path, monkeypatch, settings):
+    serial_found, serial_index = _index_with_workers(tmp_path, monkeypatch, settings, 1)
+    pool_found, pool_index = _index_with_workers(tmp_path, monkeypatch, settings, 3)
+    assert serial_found == pool_found == 13
+    assert serial_index and serial_index == pool_index
+
+def test_worker_pool_streams_pages(tmp_path, monkeypatch, settings):
+    monkeypatch.setattr(read, "TEXT_CHUNK_SIZE", 40)
+    monkeypatch.setattr(indexer, "PAGES_PER_CHUNK", 1)
+    monkeypatch.setattr(indexer, "TASKS_PER_WORKER", 1)
+    serial_found, serial_index = _index_with_workers(tmp_path, monkeypatch, settings, 1)
+    pool_found, pool_index = _index_with_workers(tmp_path, monkeypatch, settings, 2)
+    assert serial_found == pool_found == 13
+    assert max(page for _name, _token, page, _tf in pool_index) > 10
+    assert serial_index == pool_index
+
+def test_change_detection_uses_stat_then_hash(tmp_path):
+    from backend.indexer import _file_signature, _is_unchanged
+    path = tmp_path / "notes.txt"
+    path.write_text("Chemie " * 20000, encoding="utf-8")
+    stored = _file_signature(str(path), os.stat(path), {}, True)
+
+    os.utime(path, (1, 1))
+    touched = _file_signature(str(path), os.stat(path), stored, True)
+    assert _is_unchanged(stored, touched)
+    assert not _is_unchanged(stored, _file_signature(str(path), os.stat(path), stored, False))
+
+    path.write_text("Physik " * 20000, encoding="utf-8")
+    os.utime(path, (2, 2))
+    assert not _is_unchanged(touched, _file_signature(str(path), os.stat(path), touched, True))
+
+def test_bulk_build_matches_incremental(tmp_path, monkeypatch, settings):
+    incremental_found, incremental_index = _index_with_workers(tmp_path, monkeypatch, settings, 1)
+    bulk_found, bulk_index = _index_with_workers(tmp_path, monkeypatch, settings, 1, is_bulk=True)
+    assert incremental_found == bulk_found == 13
+    assert incremental_index and incremental_index == bulk_index
+
+def test_bulk_build_adds_to_existing_index(tmp_path, db_path, settings):
+    settings({"index_workers": 1})
+    for name in ("first", "second"):
+        folder = tmp_path / name
+        folder.mkdir()
+        _make_corpus(folder)
+        index_path(str(folder), True, False, is_bulk=True)
+
+    conn = sqlite3.connect(db_path)
+    documents = conn.execute("SELECT COUNT(*) FROM Document").fetchone()[0]
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert documents == 24
+    assert "idx_posting_doc" in indexes and "idx_posting_token" not in indexes
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+
+def test_interrupted_bulk_build_is_merged_on_start(tmp_path, db_path, settings, monkeypatch):
+    settings({"index_workers": 1})
+    folder = tmp_path / "corpus"
+    folder.mkdir()
+    _make_corpus(folder)
+
+    def interrupted(_conn):
+        raise KeyboardInterrupt
+
+    merge = indexer.merge_posting_stage
+    monkeypatch.setattr(indexer, "merge_posting_stage", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        index_path(str(folder), True, False, is_bulk=True)
+    monkeypatch.setattr(indexer, "merge_posting_stage", merge)
+    connection.close_connections()
+
+    conn = connection.read_connection()
+    assert conn.execute("SELECT COUNT(DISTINCT doc_id) FROM Posting").fetchone()[0] == 12
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE '%Stage'").fetchone()[0] == 0
+
+def _make_large_corpus(folder):
+    folder.mkdir()
+    rng = random.Random(5)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocabulary = ["begriff" + letters[i // 676] + letters[i // 26 % 26] + letters[i % 26]
+                  for i in range(26 ** 3)]
+    for i in range(BENCH_FILES):
+        subfolder = folder / f"part{i // 1000}"
+        subfolder.mkdir(exist_ok=True)
+        (subfolder / f"doc{i}.txt").write_text(" ".join(rng.sample(vocabulary, 200)),
+                                               encoding="utf-8")
+
+@pytest.mark.bench
+def test_benchmark_bulk_against_incremental(tmp_path, monkeypatch, settings, benchmark):
+    settings({"index_workers": 1})
+
+    def build(is_bulk):
+        folder = tmp_path / f"large_{is_bulk}"
+        _make_large_corpus(folder)
+        connection.close_connections()
+        monkeypatch.setattr(connection, "DB_PATH", str(tmp_path / f"large_{is_bulk}.db"))
+        return str(folder)
+
+    folder = build(False)
+    start = time.perf_counter()
+    assert index_path(folder, True, False) == BENCH_FILES
+    benchmark.extra_info["incremental_seconds"] = time.perf_counter() - start
+
+    folder = build(True)
+    found = benchmark.pedantic(index_path, args=(folder, True, False),
+                               kwargs={"is_bulk": True}, rounds=1, iterations=1)
+    connection.close_connections()
+    assert found == BENCH_FILES
+
+def test_indexing_an_existing_document_drops_old_page_texts(tmp_path, db_path, settings, monkeypatch):
+    settings({"index_workers": 1})
+    path = tmp_path / "doc.txt"
+    path.write_text("Neue Seite", encoding="utf-8")
+    monkeypatch.setattr(indexer, "_rename_file", lambda file_path, _is_replace_full: file_path)
+    indexer._index_files([str(path)], False)
+    with connection.write_connection() as conn:
+        doc_id = fetch_doc_id(conn, str(path))
+        store_page_text(conn, doc_id, 2, pack_text("Alte zweite Seite"))
+        conn.commit()
+
+    indexer._index_files([str(path)], False)
+    conn = connection.read_connection()
+    assert fetch_page_texts(conn, doc_id, [1, 2]) == {1: "Neue Seite"}
+    assert conn.execute("SELECT COUNT(*) FROM Posting WHERE doc_id = ?", (doc_id,)).fetchone()[0] == 2
+
+def test_bulk_index_workers_leave_settings_alone(tmp_path, db_path, settings, monkeypatch):
+    settings({"index_workers": 3})
+    folder = tmp_path / "corpus"
+    folder.mkdir()
+    _make_corpus(folder)
+    monkeypatch.setattr("sys.argv", ["bulk_index.py", str(folder), "--workers", "1"])
+    bulk_index.main()
+
+    assert load_settings()["index_workers"] == 3
+    assert connection.read_connection().execute("SELECT COUNT(*) FROM Document").fetchone()[0] == 12
@@ -0,0 +1,97 @@
+import os
+import time
+import random
+import pytest
+import backend.search as search
+from backend.connection import write_connection
+from backend.indexer import index_path, repeat_indexing
+from backend.packing import pack_positions, unpack_positions, merge_position_blobs
+from backend.tokenizer import tokenize_query
+
+BENCH_DOCS = int(os.getenv("HIRMES_BENCH_FILES", "300"))
+
+CORPUS = {
+    "exact": "Das Projekt Management der Firma",
+    "reversed": "Management im Projekt",
+    "apart": "Projekt Budget Plan Liste Management",
+    "state": "The state of the art in Chemie",
+}
+
+def test_query_tokens_and_rpn():
+    assert tokenize_query('"Project of Management" NEAR/3 budget') == [
+        '"project * management"', "NEAR/3", "budget"]
+    assert tokenize_query('"the Chemie" AND "der"') == ["chemie", "AND"]
+    assert search._to_rpn(tokenize_query('a1 NEAR/2 b1 AND NOT c1')) == [
+        "a1", "b1", "near/2", "c1", "not", "and"]
+
+def test_positions_round_trip():
+    page_positions = [(1, [0, 7, 300]), (4, [2]), (200, [70000])]
+    assert {page: list(positions) for page, positions
+            in unpack_positions(pack_positions(page_positions)).items()} == dict(page_positions)
+    merged = unpack_positions(merge_position_blobs(pack_positions([(1, [0, 9])]),
+                                                   pack_positions([(1, [4]), (2, [1])])))
+    assert {page: list(positions) for page, positions in merged.items()} == {1: [0, 4, 9], 2: [1]}
+
+def test_phrase_and_near(tmp_path, db_path, settings, index_texts, result_names):
+    settings({"index_workers": 1})
+    index_texts(tmp_path / "corpus", CORPUS)
+
+    assert result_names("Projekt AND Management") == ["apart", "exact", "reversed"]
+    assert result_names('"Projekt Management"') == ["exact"]
+    assert result_names('"state of the art"') == ["state"]
+    assert result_names('"state art"') == []
+    assert result_names("Projekt NEAR/2 Management") == ["exact", "reversed"]
+    assert result_names("Projekt NEAR/4 Management") == ["apart", "exact", "reversed"]
+    assert result_names('"Projekt Management" NEAR/2 Firma') == ["exact"]
+    assert result_names('Projekt AND NOT "Projekt Management"') == ["apart", "reversed"]
+    assert search._evaluate_rpn_ranked(search._to_rpn(tokenize_query(
+        "(Projekt OR Plan) NEAR/2 Management"))) is None
+
+    result = search.search_index('"Projekt Management"')[0][0]
+    assert search._search_snippet(result) == ["Das Projekt Management der Firma"]
+
+def test_positions_follow_reindex_and_bulk_build(tmp_path, db_path, settings, index_texts,
+                                                  result_names):
+    settings({"index_workers": 1})
+    index_texts(tmp_path / "corpus", CORPUS, is_bulk=True)
+    assert result_names('"Projekt Management"') == ["exact"]
+
+    path = next(str(path) for path in (tmp_path / "corpus").iterdir() if "apart" in path.name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Neues Projekt Management")
+    with write_connection() as conn:
+        conn.execute("UPDATE Document SET metadata = NULL")
+        repeat_indexing(conn, [path])
+        assert conn.execute("SELECT COUNT(*) FROM Position WHERE doc_id NOT IN "
+                            "(SELECT doc_id FROM Posting)").fetchone()[0] == 0
+    assert result_names('"Projekt Management"') == ["apart", "exact"]
+
+@pytest.mark.bench
+def test_benchmark_phrase_against_and(tmp_path, db_path, settings, benchmark):
+    settings({"index_workers": 1})
+    rng = random.Random(4)
+    words = [f"wort{i}" for i in range(2000)] + ["projekt", "management"] * 40
+    folder = tmp_path / "bench"
+    folder.mkdir()
+    for i in range(BENCH_DOCS):
+        text = " ".join(rng.choice(words) for _ in range(600))
+        if i % 10 == 0:
+            text += " Projekt Management"
+        (folder / f"doc{i}.txt").write_text(text, encoding="utf-8")
+    index_path(str(folder), False, False)
+
+    def evaluate(query):
+        return search._evaluate_rpn_ranked(search._to_rpn(tokenize_query(query)))
+
+    def timed(query):
+        start = time.perf_counter()
+        for _ in range(5):
+            results = evaluate(query)
+        benchmark.extra_info[f"{query} ms"] = (time.perf_counter() - start) / 5 * 1000
+        return len(results)
+
+    and_matches = timed("Projekt AND Management")
+    near_matches = timed("Projekt NEAR/3 Management")
+    phrase_matches = len(benchmark.pedantic(evaluate, args=('"Projekt Management"',),
+                                            rounds=5, iterations=1))
+    assert BENCH_DOCS // 10 <= phrase_matches <= near_matches <= and_matches
@@ -0,0 +1,109 @@
+import os
+import time
+import random
+import pytest
+import backend.search as search
+from backend.database import bump_index_generation, get_index_generation
+from backend.connection import write_connection
+from backend.indexer import index_path, repeat_indexing
+from backend.query_cache import QueryCache, RESULT_CACHE, POSTING_CACHE
+
+BENCH_DOCS = int(os.getenv("HIRMES_BENCH_FILES", "300"))
+
+def test_lru_memory_ttl_and_generation(monkeypatch):
+    cache = QueryCache(max_entries=2, ttl=10, max_bytes=100)
+    generation = get_index_generation()
+    cache.put("a", 1, 10, generation)
+    cache.put("b", 2, 10, generation)
+    assert cache.get("a") == 1
+    cache.put("c", 3, 10, generation)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+
+    cache.put("d", 4, 95, generation)
+    assert len(cache) == 1 and cache.get("d") == 4
+    cache.put("e", 5, 101, generation)
+    assert cache.get("e") is None
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get("d") is None and cache.expirations == 1
+
+    cache.put("f", 6, 10, generation)
+    bump_index_generation()
+    assert cache.get("f") is None
+    cache.put("g", 7, 10, generation)
+    assert cache.get("g") is None
+    assert cache.stats()["hits"] == 4 and cache.stats()["evictions"] == 3
+
+def test_results_are_cached_until_the_index_changes(tmp_path, db_path, settings):
+    settings({"index_workers": 1})
+    folder = tmp_path / "corpus"
+    folder.mkdir()
+    for i in range(6):
+        (folder / f"note{i}.txt").write_text("Chemie " * (i + 1) + "Physik", encoding="utf-8")
+    index_path(str(folder), False, False)
+
+    first, _spellchecked, cursor = search.search_page("Chemie AND Physik", limit=3)
+    hits = RESULT_CACHE.hits
+    again, _spellchecked, _cursor = search.search_page("chemie  AND physik", limit=3)
+    assert again == first and RESULT_CACHE.hits == hits + 1
+    second, _spellchecked, _cursor = search.search_page(
+        "Chemie AND Physik", limit=3, offset=search.decode_cursor(cursor))
+    assert len(second) == 3 and not {result["path"] for result in second} & {
+        result["path"] for result in first}
+    assert POSTING_CACHE.get("chemie") is not None
+
+    (folder / "extra.txt").write_text("Chemie " * 20 + "Physik", encoding="utf-8")
+    index_path(str(folder), False, False)
+    assert POSTING_CACHE.get("chemie") is None
+    assert any("extra" in result["path"] for result in search.search_index("Chemie AND Physik")[0])
+
+def test_runs_without_changes_keep_the_generation(tmp_path, db_path, settings):
+    settings({"index_workers": 1})
+    folder = tmp_path / "corpus"
+    folder.mkdir()
+    (folder / "note.txt").write_text("Chemie", encoding="utf-8")
+    index_path(str(folder), False, False)
+    generation = get_index_generation()
+    paths = [str(path) for path in folder.iterdir()]
+
+    assert index_path(str(folder), False, False) == 0
+    with write_connection() as conn:
+        assert repeat_indexing(conn, paths) == (0, 0)
+    assert get_index_generation() == generation
+
+    os.remove(paths[0])
+    with write_connection() as conn:
+        assert repeat_indexing(conn, paths) == (0, 1)
+    assert get_index_generation() > generation
+
+@pytest.mark.bench
+def test_benchmark_repeated_query(tmp_path, db_path, settings, benchmark):
+    settings({"index_workers": 1, "spellcheck_mode": "off"})
+    rng = random.Random(8)
+    words = [f"wort{i}" for i in range(1000)] + ["chemie", "physik"] * 30
+    folder = tmp_path / "bench"
+    folder.mkdir()
+    for i in range(BENCH_DOCS):
+        (folder / f"doc{i}.txt").write_text(" ".join(rng.choice(words) for _ in range(400)),
+                                            encoding="utf-8")
+    index_path(str(folder), False, False)
+    query = "(chemie OR wort7) AND physik NOT wort12"
+
+    def run():
+        return search.search_page(query, limit=20)[0]
+
+    def timed(name):
+        start = time.perf_counter()
+        results = run()
+        benchmark.extra_info[f"{name} ms"] = (time.perf_counter() - start) * 1000
+        return results
+
+    bump_index_generation()
+    cold_results = timed("cold")
+    warm_results = benchmark.pedantic(run, rounds=1, iterations=1)
+    posting_hits = POSTING_CACHE.hits
+    RESULT_CACHE.clear()
+    postings_results = timed("posting lists cached")
+    assert cold_results == warm_results == postings_results
+    assert POSTING_CACHE.hits > posting_hits
@@ -0,0 +1,140 @@
+import os
+import time
+import random
+import sqlite3
+from array import array
+import pytest
+import backend.search as search
+from backend.connection import write_connection
+from backend.database import REBUILD_STATS_SQL
+from backend.indexer import index_path, repeat_indexing
+from backend.ranking import Bm25, top_k
+from backend.tokenizer import tokenize_query
+
+STATS_QUERIES = (
+    "SELECT token_id, df FROM TokenStats WHERE df > 0 ORDER BY token_id",
+    "SELECT doc_id, length FROM DocStats ORDER BY doc_id",
+    "SELECT doc_count, total_length FROM CorpusStats",
+)
+
+def _stats(conn):
+    return [conn.execute(query).fetchall() for query in STATS_QUERIES]
+
+def _recomputed_stats(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript("BEGIN;" + REBUILD_STATS_SQL)
+    stats = _stats(conn)
+    conn.rollback()
+    conn.close()
+    return stats
+
+def _make_corpus(folder):
+    folder.mkdir()
+    (folder / "short.txt").write_text("Chemie und Tenside", encoding="utf-8")
+    (folder / "long.txt").write_text("Chemie Chemie Tenside " + "Wasser " * 200, encoding="utf-8")
+    (folder / "other.txt").write_text("Physik Physik Wasser", encoding="utf-8")
+    for i in range(5):
+        (folder / f"filler{i}.txt").write_text(f"Geographie Karte {i}", encoding="utf-8")
+
+def _ranked(settings, query, ranking):
+    settings({"ranking": ranking})
+    results = search._evaluate_rpn_ranked(search._to_rpn(tokenize_query(query)))
+    return [os.path.basename(result["path"]).split(" ★")[0].removesuffix(".txt")
+            for result in results]
+
+def test_stats_follow_indexing_and_deletes(tmp_path, db_path, settings):
+    settings({"index_workers": 1})
+    folder = tmp_path / "corpus"
+    _make_corpus(folder)
+    index_path(str(folder), False, False)
+    with write_connection() as conn:
+        assert _stats(conn) == _recomputed_stats(db_path)
+        assert _stats(conn)[2][0][0] == 8
+
+    paths = sorted(str(path) for path in folder.iterdir())
+    os.remove(paths[0])
+    with open(paths[1], "a", encoding="utf-8") as f:
+        f.write(" Chemie Chemie Physik")
+    with write_connection() as conn:
+        conn.execute("UPDATE Document SET metadata = NULL")
+        assert repeat_indexing(conn, paths) == (7, 1)
+        assert _stats(conn) == _recomputed_stats(db_path)
+
+def test_bulk_build_computes_stats(tmp_path, db_path, settings):
+    settings({"index_workers": 1})
+    _make_corpus(tmp_path / "corpus")
+    index_path(str(tmp_path / "corpus"), False, False, is_bulk=True)
+    with write_connection() as conn:
+        assert _stats(conn)[2][0][0] == 8
+        assert _stats(conn) == _recomputed_stats(db_path)
+
+def test_bm25_prefers_short_documents(tmp_path, db_path, settings):
+    settings({"index_workers": 1})
+    _make_corpus(tmp_path / "corpus")
+    index_path(str(tmp_path / "corpus"), False, False)
+
+    assert _ranked(settings, "Chemie", "matches") == ["long", "short"]
+    assert _ranked(settings, "Chemie", "bm25") == ["short", "long"]
+    assert _ranked(settings, "Physik OR Chemie", "bm25")[0] == "other"
+
+def _random_terms(rng, doc_count):
+    terms = []
+    for df in (doc_count // 2, doc_count // 5, 40, 3):
+        doc_ids = array('I', sorted(rng.sample(range(1, doc_count + 1), df)))
+        doc_tfs = array('I', (rng.choice((1, 1, 2, 5, 30)) for _ in doc_ids))
+        terms.append((doc_ids, doc_tfs, df, max(doc_tfs)))
+    return terms
+
+def _brute_force(terms, bm25, lengths, candidates):
+    scores = {}
+    for doc_ids, doc_tfs, df, _max_tf in terms:
+        for doc_id, tf in zip(doc_ids, doc_tfs):
+            if candidates is None or doc_id in candidates:
+                scores[doc_id] = scores.get(doc_id, 0.0) + bm25.term_score(tf, df, lengths[doc_id])
+    for doc_id in candidates or ():
+        scores.setdefault(doc_id, 0.0)
+    return scores
+
+def test_top_k_matches_brute_force():
+    rng = random.Random(8)
+    for _ in range(30):
+        doc_count = rng.randint(50, 3000)
+        terms = _random_terms(rng, doc_count)
+        lengths = [0] + [rng.randint(1, 500) for _ in range(doc_count)]
+        bm25 = Bm25(doc_count, sum(lengths) / doc_count)
+        candidates = rng.choice((None, sorted(set(terms[0][0]) & set(terms[1][0]))))
+        scores = _brute_force(terms, bm25, lengths, candidates)
+        for k in (1, 10, len(scores) + 5):
+            best = top_k(terms, bm25, lengths, k, candidates)
+            expected = sorted(scores.values(), reverse=True)[:k]
+            assert [round(score, 9) for score, _doc_id in best] == [round(s, 9) for s in expected]
+            assert all(abs(scores[doc_id] - score) < 1e-9 for score, doc_id in best)
+
+def test_limit_and_offset_page_through_results(tmp_path, db_path, settings):
+    settings({"index_workers": 1})
+    _make_corpus(tmp_path / "corpus")
+    index_path(str(tmp_path / "corpus"), False, False)
+    query = search._to_rpn(tokenize_query("Chemie OR Wasser OR Geographie"))
+
+    everything = search._evaluate_rpn_ranked(query)
+    pages = [search._evaluate_rpn_ranked(query, limit=3, offset=offset) for offset in (0, 3, 6)]
+    assert len(everything) == 8
+    assert [result for page in pages for result in page] == everything
+    assert search._evaluate_rpn_ranked(query, limit=3, offset=30) == []
+
+@pytest.mark.bench
+def test_benchmark_top_k_against_full_ranking(benchmark):
+    rng = random.Random(2)
+    doc_count = 200_000
+    terms = _random_terms(rng, doc_count)
+    lengths = [0] + [rng.randint(1, 500) for _ in range(doc_count)]
+    bm25 = Bm25(doc_count, sum(lengths) / doc_count)
+
+    start = time.perf_counter()
+    scores = _brute_force(terms, bm25, lengths, None)
+    full = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:10]
+    benchmark.extra_info["matches"] = len(scores)
+    benchmark.extra_info["full_ranking_ms"] = (time.perf_counter() - start) * 1000
+
+    best = benchmark.pedantic(top_k, args=(terms, bm25, lengths, 10), rounds=1, iterations=1)
+    assert [doc_id for _score, doc_id in best] == [doc_id for doc_id, _score in full]
@@ -0,0 +1,59 @@
+import backend.read as read
+import backend.watchdog as watchdog
+from pptx import Presentation
+from pptx.util import Inches
+from backend.connection import write_connection
+from backend.indexer import index_path, repeat_indexing
+from backend.tokenizer import tokenize
+
+def _make_pptx(path, slides):
+    presentation = Presentation()
+    for texts in slides:
+        slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+        for i, text in enumerate(texts):
+            slide.shapes.add_textbox(Inches(1), Inches(1 + i), Inches(4), Inches(1)).text = text
+    presentation.save(path)
+
+def test_large_txt_is_chunked_on_lines(tmp_path, monkeypatch):
+    monkeypatch.setattr(read, "TEXT_CHUNK_SIZE", 64)
+    lines = [f"Zeile {i} mit Polymerbausteine und https://example.com/{i}\n" for i in range(50)]
+    path = tmp_path / "log.txt"
+    path.write_text("".join(lines), encoding="utf-8")
+
+    pages = list(read.txt(str(path)))
+
+    assert len(pages) > 1
+    assert all(page.endswith("\n") for page in pages)
+    assert "".join(pages) == "".join(lines)
+    assert sorted(t for page in pages for t in tokenize(page)) == sorted(tokenize("".join(lines)))
+
+def test_empty_and_missing_files(tmp_path):
+    path = tmp_path / "empty.md"
+    path.write_text("", encoding="utf-8")
+
+    assert list(read.markdown(str(path))) == [""]
+    assert list(read.txt(str(tmp_path / "missing.txt"))) == []
+    assert list(read.pdf(str(tmp_path / "missing.pdf"))) == []
+
+def test_pptx_yields_one_page_per_slide(tmp_path):
+    path = str(tmp_path / "talk.pptx")
+    _make_pptx(path, [["Chemie", "Physik"], ["Wasser"]])
+
+    assert list(read.pptx(path)) == ["Chemie\nPhysik\n", "Wasser\n"]
+
+def test_files_of_an_older_extractor_are_reindexed(tmp_path, db_path, settings):
+    settings({"index_workers": 1})
+    folder = tmp_path / "corpus"
+    folder.mkdir()
+    _make_pptx(str(folder / "talk.pptx"), [["Chemie", "Physik"], ["Wasser"]])
+    (folder / "notes.txt").write_text("Chemie", encoding="utf-8")
+    index_path(str(folder), False, False)
+    with write_connection() as conn:
+        assert watchdog._find_files_to_reindex(conn, 10) == []
+        conn.execute("UPDATE Document SET metadata = json_remove(metadata, '$.extractor')")
+        conn.commit()
+
+        outdated = watchdog._find_files_to_reindex(conn, 10)
+        assert len(outdated) == 1 and outdated[0].endswith(".pptx")
+        assert repeat_indexing(conn, outdated) == (1, 0)
+        assert watchdog._find_files_to_reindex(conn, 10) == []
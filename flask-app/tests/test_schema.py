@@ -0,0 +1,117 @@
+import os
+import time
+import random
+import sqlite3
+import pytest
+from backend.database import (initialise_db, get_schema_version, fetch_doc_postings_for_token_id,
+                              fetch_postings_for_token, SCHEMA_VERSION)
+from backend.packing import pack_pages, unpack_pages, merge_page_blobs
+
+V1_SCHEMA = """
+    CREATE TABLE Document (
+    doc_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+    path     TEXT UNIQUE NOT NULL,
+    metadata TEXT
+    );
+    CREATE TABLE Token (
+    token_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+    token_text TEXT UNIQUE NOT NULL
+    );
+    CREATE TABLE Posting (
+    token_id INTEGER NOT NULL,
+    doc_id   INTEGER NOT NULL,
+    page     INTEGER NOT NULL,
+    tf       INTEGER NOT NULL,
+    PRIMARY KEY (token_id, doc_id, page)
+    );
+    CREATE INDEX idx_posting_token ON Posting(token_id);
+    CREATE INDEX idx_posting_doc   ON Posting(doc_id);
+    CREATE INDEX idx_token_text    ON Token(token_text);
+"""
+
+BENCH_DOCS = int(os.getenv("HIRMES_BENCH_FILES", "300"))
+
+def _make_v1_db(path, doc_count, vocabulary=3000, seed=3):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(V1_SCHEMA)
+    conn.executemany("INSERT INTO Token(token_text) VALUES (?)",
+                     ((f"wort{i}",) for i in range(vocabulary)))
+    for doc_id in range(1, doc_count + 1):
+        conn.execute("INSERT INTO Document(doc_id, path) VALUES (?, ?)", (doc_id, f"doc{doc_id}.pdf"))
+        page_count = 1 if doc_id % 2 else rng.randint(2, 40)
+        conn.executemany("INSERT INTO Posting VALUES (?, ?, ?, ?)", (
+            (token_id, doc_id, page, rng.choice((1, 1, 2, 3, 200)))
+            for page in range(1, page_count + 1)
+            for token_id in rng.sample(range(1, vocabulary + 1), 150)
+        ))
+    conn.commit()
+    return conn
+
+def _v1_postings(conn, token_id):
+    return conn.execute("SELECT doc_id, page, tf FROM Posting WHERE token_id = ? "
+                        "ORDER BY doc_id, page", (token_id,)).fetchall()
+
+def test_pack_pages_round_trip():
+    pairs = [(1, 1), (2, 127), (3, 128), (300, 5), (70000, 100000)]
+    assert unpack_pages(pack_pages(pairs)) == pairs
+    assert len(pack_pages([(1, 4)])) == 2
+    assert unpack_pages(merge_page_blobs(pack_pages([(1, 2), (5, 1)]),
+                                         pack_pages([(5, 3), (9, 1)]))) == [(1, 2), (5, 4), (9, 1)]
+
+def test_new_database_uses_current_schema():
+    conn = sqlite3.connect(":memory:")
+    initialise_db(conn)
+    assert get_schema_version(conn) == SCHEMA_VERSION
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+
+def test_migration_keeps_every_posting(tmp_path):
+    conn = _make_v1_db(str(tmp_path / "index.db"), doc_count=40)
+    expected = {token_id: _v1_postings(conn, token_id) for token_id in range(1, 3001)}
+    assert get_schema_version(conn) == 1
+
+    initialise_db(conn)
+    conn.commit()
+
+    assert get_schema_version(conn) == SCHEMA_VERSION
+    assert {token_id: fetch_doc_postings_for_token_id(conn, token_id)
+            for token_id in range(1, 3001)} == expected
+    assert sorted(fetch_postings_for_token(conn, "wort7")) == sorted(
+        (f"doc{doc_id}.pdf", page, tf) for doc_id, page, tf in expected[8])
+    assert conn.execute("SELECT doc_count FROM CorpusStats").fetchone()[0] == 40
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+
+@pytest.mark.bench
+def test_benchmark_compact_schema(tmp_path, benchmark):
+    path = str(tmp_path / "index.db")
+    conn = _make_v1_db(path, doc_count=BENCH_DOCS)
+    conn.execute("VACUUM")
+    conn.close()
+    tokens = random.Random(1).sample(range(1, 3001), 300)
+
+    def cold_lookups(fetch):
+        conn = sqlite3.connect(path)
+        postings = sum(len(fetch(conn, token_id)) for token_id in tokens)
+        conn.close()
+        return postings
+
+    size_v1 = os.path.getsize(path)
+    start = time.perf_counter()
+    postings_v1 = cold_lookups(_v1_postings)
+    benchmark.extra_info["v1_lookup_ms"] = (time.perf_counter() - start) * 1000
+
+    conn = sqlite3.connect(path)
+    start = time.perf_counter()
+    initialise_db(conn)
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    benchmark.extra_info["migration_seconds"] = time.perf_counter() - start
+
+    size_v2 = os.path.getsize(path)
+    benchmark.extra_info["v1_mb"] = size_v1 / 2**20
+    benchmark.extra_info["v2_mb"] = size_v2 / 2**20
+    postings_v2 = benchmark.pedantic(cold_lookups, args=(fetch_doc_postings_for_token_id,),
+                                     rounds=1, iterations=1)
+    assert postings_v1 == postings_v2
+    assert size_v2 < size_v1
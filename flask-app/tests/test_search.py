@@ -23,7 +23,8 @@ test_cases = [
 ]
 
 @pytest.mark.parametrize("query,expected", test_cases)
-def test_spellcheck_correctness(query, expected):
+def test_spellcheck_correctness(query, expected, settings):
+    settings({"spellcheck_english": True})
     DICTIONARY_PATH = str(files("symspellpy") / "frequency_dictionary_en_82_765.txt")
     bigram_path = str(files("symspellpy") / "frequency_bigramdictionary_en_243_342.txt")
     result = spellcheck(query).term
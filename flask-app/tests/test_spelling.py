@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import random
+import subprocess
+import pytest
+from backend import spelling
+from backend.connection import read_connection, write_connection
+from backend.database import bump_index_generation
+from backend.indexer import index_path, repeat_indexing
+from backend.spelling import SPELL_CHECKER, SpellChecker, SPELLING_FILE
+import backend.search as search
+from backend.search import spellcheck
+
+BENCH_TERMS = int(os.getenv("HIRMES_BENCH_FILES", "300")) * 100
+
+def test_import_does_not_load_dictionary():
+    code = "import backend.search, backend.spelling as s; print(s.SPELL_CHECKER._sym_spell)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(__file__)), check=True,
+                            env={**os.environ, "APPDATA": os.getenv("APPDATA", "/tmp")})
+    assert output.stdout.strip() == "None"
+
+def test_corrects_to_indexed_words(tmp_path, db_path, settings, index_texts):
+    settings({"index_workers": 1})
+    index_texts(tmp_path / "first", {"a": "Polymerchemie und Tenside", "b": "Veresterung der Säure"})
+
+    assert spellcheck("Polymerchemi AND Tensde").term == "polymerchemie AND tenside"
+    assert spellcheck("Veresterung NEAR/3 saure OR poly*").term == "Veresterung NEAR/3 säure OR poly*"
+    assert spellcheck("quantenfeld").term == "quantenfeld"
+
+    index_texts(tmp_path / "second", {"c": "Quantenfeldtheorie"})
+    assert spellcheck("Quantenfeldtheori").term == "quantenfeldtheorie"
+
+def test_document_frequencies_follow_the_index(tmp_path, db_path, settings, index_texts,
+                                               monkeypatch):
+    settings({"index_workers": 1})
+    index_texts(tmp_path / "first", {"a": "Chemie"})
+    with write_connection() as conn:
+        conn.execute("INSERT INTO Token(token_text) VALUES ('tenside')")
+        conn.commit()
+    bump_index_generation()
+    assert spellcheck("tensid").term == "tensid"
+
+    index_texts(tmp_path / "second", {"b": "Tenside"})
+    assert spellcheck("tensid").term == "tenside"
+
+    monkeypatch.setattr(spelling, "DF_REFRESH_SECONDS", 0)
+    path = next(str(path) for path in (tmp_path / "second").iterdir())
+    os.remove(path)
+    with write_connection() as conn:
+        repeat_indexing(conn, [path])
+    assert spellcheck("tensid").term == "tensid"
+
+def test_dictionary_is_saved_and_reloaded(tmp_path, db_path, settings, index_texts):
+    settings({"index_workers": 1})
+    index_texts(tmp_path / "corpus", {"a": "Polymerchemie und Tenside"})
+    spellcheck("Tensid")
+    assert os.path.exists(tmp_path / SPELLING_FILE)
+
+    def restart():
+        restarted = SpellChecker()
+        restarted.db_path, restarted.is_english = db_path, False
+        return restarted
+
+    restarted = restart()
+    assert restarted._load(read_connection())
+    assert restarted.spellcheck(read_connection(), "Tensid").term == "tenside"
+
+    with write_connection() as conn:
+        conn.execute("UPDATE Token SET token_text = 'anders' WHERE token_id = ?",
+                     (restarted.max_token_id,))
+        conn.commit()
+    assert not restart()._load(read_connection())
+
+def test_spellcheck_mode(tmp_path, db_path, settings, index_texts, monkeypatch):
+    settings({"index_workers": 1, "spellcheck_threshold": 2})
+    index_texts(tmp_path / "corpus", {"a": "Chemie Tenside", "b": "Chemie Polymer", "c": "Chemi"})
+    calls = []
+
+    def counted(text):
+        calls.append(text)
+        return spellcheck(text)
+
+    monkeypatch.setattr(search, "spellcheck", counted)
+    assert search.search_index("Chemie")[1] == "Chemie"
+    assert search.search_index("Chemie AND Tensde")[1] == "Chemie AND tenside"
+    assert search.search_index("Tenside")[1] == "Tenside"
+    assert calls == ["Chemie AND Tensde", "Tenside"]
+
+    settings({"index_workers": 1, "spellcheck_mode": "off"})
+    assert search.search_index("Tensde")[1] == "Tensde"
+    settings({"index_workers": 1, "spellcheck_mode": "always"})
+    assert search.search_index("Chemie")[1] == "Chemie"
+    assert calls == ["Chemie AND Tensde", "Tenside", "Chemie"]
+
+@pytest.mark.bench
+def test_benchmark_build_against_pickle(tmp_path, db_path, settings, benchmark):
+    rng = random.Random(6)
+    syllables = ["po", "ly", "mer", "che", "mie", "ka", "ta", "se", "ter", "lo", "su", "ng"]
+    tokens = {"".join(rng.choice(syllables) for _ in range(rng.randint(2, 6)))
+              for _ in range(BENCH_TERMS)}
+    with write_connection() as conn:
+        conn.executemany("INSERT INTO Token(token_text) VALUES (?)", ((token,) for token in tokens))
+        conn.execute("INSERT INTO TokenStats(token_id, df, max_tf) SELECT token_id, 1, 1 FROM Token")
+        conn.commit()
+
+    start = time.perf_counter()
+    spellcheck("polymerchemi")
+    benchmark.extra_info["terms"] = len(tokens)
+    benchmark.extra_info["build_ms"] = (time.perf_counter() - start) * 1000
+
+    restarted = SpellChecker()
+    benchmark.pedantic(restarted.spellcheck, args=(read_connection(), "polymerchemi"),
+                       rounds=1, iterations=1)
+    assert restarted.max_token_id == SPELL_CHECKER.max_token_id
+
+@pytest.mark.bench
+def test_benchmark_spellcheck_modes(tmp_path, db_path, settings, benchmark):
+    settings({"index_workers": 1, "spellcheck_english": True})
+    rng = random.Random(7)
+    words = [f"chemie{i}" for i in range(500)] + ["polymer", "tenside"] * 20
+    folder = tmp_path / "bench"
+    folder.mkdir()
+    for i in range(BENCH_TERMS // 100):
+        text = " ".join(rng.choice(words) for _ in range(300))
+        (folder / f"doc{i}.txt").write_text(text, encoding="utf-8")
+    index_path(str(folder), False, False)
+    queries = ["polymer AND tenside", "polymer OR chemie7", "tenside NOT chemie12"]
+    spellcheck("polymer")
+
+    def run(mode):
+        settings({"index_workers": 1, "spellcheck_english": True, "spellcheck_mode": mode})
+        for query in queries * 5:
+            search.search_page(query, limit=50)
+
+    def timed(name, function, *args):
+        start = time.perf_counter()
+        function(*args)
+        benchmark.extra_info[f"{name} ms per query"] = (
+            (time.perf_counter() - start) / len(queries) / 5 * 1000)
+
+    def sequential():
+        for query in queries * 5:
+            search._evaluate_rpn_ranked(search._to_rpn(search.tokenize_query(query)), 51)
+            spellcheck(query)
+
+    timed("off", run, "off")
+    timed("always", run, "always")
+    timed("evaluation then spellcheck", sequential)
+    benchmark.pedantic(run, args=("auto",), rounds=1, iterations=1)
@@ -0,0 +1,74 @@
+import time
+import pytest
+from backend.token_cache import TokenCache
+from backend.connection import write_connection, read_connection
+from backend.indexer import index_path
+from backend.token_cache import TOKEN_CACHE
+
+def test_get_ids_inserts_once_and_counts_hits(fresh_db):
+    conn = fresh_db()
+    cache = TokenCache()
+    first = cache.get_ids(conn, ["chemie", "physik"])
+    second = cache.get_ids(conn, ["physik", "chemie", "wasser"])
+
+    assert second["chemie"] == first["chemie"] and second["physik"] == first["physik"]
+    assert conn.execute("SELECT COUNT(*) FROM Token").fetchone()[0] == 3
+    assert cache.stats() == {"size": 3, "max_size": 0, "hits": 2, "misses": 3, "evictions": 0}
+
+def test_lookup_does_not_insert(fresh_db):
+    conn = fresh_db()
+    cache = TokenCache()
+
+    assert cache.lookup(conn, "fehlt") is None
+    assert conn.execute("SELECT COUNT(*) FROM Token").fetchone()[0] == 0
+
+def test_lru_bound_evicts_least_recently_used(fresh_db):
+    conn = fresh_db()
+    cache = TokenCache(max_size=2)
+    cache.get_ids(conn, ["a", "b"])
+    cache.get_ids(conn, ["a"])
+    cache.get_ids(conn, ["c"])
+
+    assert len(cache) == 2 and cache.evictions == 1
+    cache.get_ids(conn, ["a", "c"])
+    assert cache.hits == 3
+    cache.get_ids(conn, ["b"])
+    assert cache.misses == 4
+
+def test_rollback_clears_handed_out_ids(fresh_db):
+    conn = fresh_db()
+    conn.commit()
+    cache = TokenCache()
+    cache.get_ids(conn, ["chemie"])
+    conn.rollback()
+    token_ids = cache.get_ids(conn, ["physik", "chemie"])
+
+    stored = dict(conn.execute("SELECT token_text, token_id FROM Token"))
+    assert token_ids == stored
+
+def test_cache_is_shared_by_indexer_and_search(tmp_path, db_path, settings):
+    folder = tmp_path / "corpus"
+    folder.mkdir()
+    (folder / "a.txt").write_text("Chemie und Physik", encoding="utf-8")
+    settings({"index_workers": 1})
+    index_path(str(folder), False, False)
+    hits = TOKEN_CACHE.hits
+
+    assert TOKEN_CACHE.lookup(read_connection(), "chemie") is not None
+    assert TOKEN_CACHE.hits == hits + 1
+    with write_connection() as conn:
+        stored = dict(conn.execute("SELECT token_text, token_id FROM Token"))
+    assert TOKEN_CACHE.get_ids(read_connection(), stored, is_create=False) == stored
+
+@pytest.mark.bench
+def test_benchmark_warm_against_cold_cache(fresh_db, benchmark):
+    conn = fresh_db()
+    tokens = [f"wort{i}" for i in range(50000)]
+    warm = TokenCache()
+    warm.get_ids(conn, tokens)
+
+    start = time.perf_counter()
+    TokenCache().get_ids(conn, tokens)
+    benchmark.extra_info["cold_ms"] = (time.perf_counter() - start) * 1000
+    benchmark.pedantic(warm.get_ids, args=(conn, tokens), rounds=1, iterations=1)
+    assert warm.hits == len(tokens)
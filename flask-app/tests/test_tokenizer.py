@@ -0,0 +1,139 @@
+import re
+import time
+import random
+import timeit
+import tracemalloc
+from collections import Counter
+import pytest
+from backend import tokenizer
+from backend.tokenizer import tokenize, tokenize_query, count_terms, iter_tokens, STOPLIST
+
+def _legacy_tokenize(content):
+    """The multi-pass tokenizer tokenize replaced, kept as reference.
+
+    Returns words and dates apart from the URLs, whose order came from a set.
+    """
+    content = re.sub(r'[%^&*~\[\]]', '', content)
+
+    urls = tokenizer.URL_PATTERN.findall(content)
+    content = tokenizer.URL_PATTERN.sub('', content)
+
+    clean_urls = []
+    for url in urls:
+        url = url.split('(')[0] if '(' in url and url.count('http') > 1 else url
+        url = url.rstrip(').,;')
+        if re.search(r'\.\w{2,5}(/|$)', url):
+            clean_urls.append(url)
+    clean_urls = list(set(clean_urls))
+
+    content = re.sub(r'[()/:]', '', content)
+
+    dates = ['.'.join(date) for date in tokenizer.DATE_PATTERN.findall(content)]
+    content = tokenizer.DATE_PATTERN.sub('', content)
+
+    lines = [line.lstrip('#').strip() for line in content.splitlines() if line.strip()]
+    tokens = []
+
+    filter_set = set(
+        '“-. _,.' + ''.join(map(str, range(10))) + ''.join(f'{i:02}' for i in range(10))
+    )
+
+    for line in lines:
+        for word in line.split():
+            word = word.strip('",.“”>`!?;=_')
+            if len(word) == 1 and word in filter_set:
+                continue
+            word = tokenizer.FILTER_RE.sub('', word)
+            if word:
+                tokens.extend(tokenizer.SPLIT_RE.split(word.lower()))
+
+    filtered_tokens = [t for t in tokens if t and t not in STOPLIST]
+
+    return filtered_tokens + dates, clean_urls
+
+GOLDEN = [
+    "",
+    "   \n\t ",
+    "Synthetische Kunststoffe und Polymerbausteine.",
+    "# Überschrift\n## Unterpunkt\n  #kein Titel\nText #mitte",
+    "Siehe https://example.com/chemie (Quelle: www.uni-koeln.de/a.pdf), am 12.03.2024 und 1.1.1999.",
+    "it's a plan’s outline, rock'n'roll ''quoted''",
+    "Preis: 1.234,56 € - 2-3 Stück_ _x_ 00 7 “Zitat” >Antwort` !? ;= ",
+    "[Fußnote]* 100% ^hoch ~tilde & mehr",
+    "line one\r\n#line two\rline three\x0b#four #five",
+    "ISTANBUL İstanbul ΣΊΣΥΦΟΣ straße STRASSE",
+    "http://a.com(http://b.com) foo.bar baz.qux/ 31.12.2020.",
+    "a/b/c dd:ee (ff) 2024-01-01 v1.2.3 3.14",
+]
+
+PROSE = (
+    "Die Veresterung ist eine Gleichgewichtsreaktion, bei der aus einer Carbonsäure "
+    "und einem Alkohol ein Ester und Wasser entstehen. The reaction is catalysed by "
+    "acids; see the lecture notes from 12.03.2024 for details.\n"
+)
+
+ALPHABET = "aAzZäÄß01239 .,-_“”'’#%^&*~[]()/:\n\r\t\"><`!?;=İΣhttpwww.com/"
+
+def _fuzz_inputs(count, seed=1234):
+    rng = random.Random(seed)
+    return ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 60))) for _ in range(count)]
+
+@pytest.mark.parametrize("text", GOLDEN + _fuzz_inputs(2000))
+def test_matches_legacy_tokenizer(text):
+    words_and_dates, urls = _legacy_tokenize(text)
+    tokens = tokenize(text)
+
+    assert tokens[:len(words_and_dates)] == words_and_dates
+    assert sorted(tokens[len(words_and_dates):]) == sorted(urls)
+
+def test_query_tokens_unchanged():
+    assert tokenize_query("Chemie AND (Physik OR NOT Wasserstoff)") == [
+        "chemie", "AND", "(", "physik", "OR", "NOT", "wasserstoff", ")"
+    ]
+
+@pytest.mark.bench
+def test_benchmark_against_legacy_tokenizer(benchmark):
+    text = (" ".join(GOLDEN) + PROSE * 30) * 20
+    legacy = min(timeit.repeat(lambda: _legacy_tokenize(text), number=3, repeat=3))
+    benchmark.extra_info["legacy_ms"] = legacy * 1000 / 3
+    tokens = benchmark.pedantic(tokenize, args=(text,), rounds=3, iterations=3)
+    assert tokens[:1000] == _legacy_tokenize(text)[0][:1000]
+
+@pytest.mark.parametrize("text", GOLDEN + [PROSE * 3])
+def test_count_terms_matches_counted_tokens(text):
+    tokens = tokenize(text)
+
+    assert count_terms(text) == list(Counter(tokens).items())
+    stream = list(iter_tokens(text, is_gaps=True))
+    assert [token for token in stream if token is not None] == tokens
+    for token, tf, positions in count_terms(text, is_positions=True):
+        assert tf == len(positions)
+        assert all(stream[position] == token for position in positions)
+
+def _measure(function, text):
+    start = time.perf_counter()
+    function(text)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(text)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+@pytest.mark.bench
+def test_report_memory_and_time_per_megabyte(benchmark):
+    text = PROSE * (2 ** 20 // len(PROSE))
+    megabytes = len(text.encode("utf-8")) / 2 ** 20
+    counted = [
+        ("Counter(tokenize)", lambda page: list(Counter(tokenize(page)).items())),
+        ("count_terms", count_terms),
+        ("count_terms positions", lambda page: count_terms(page, is_positions=True)),
+    ]
+
+    peaks = {}
+    for name, function in counted:
+        elapsed, peaks[name] = _measure(function, text)
+        benchmark.extra_info[f"{name} ms/MB"] = elapsed / megabytes * 1000
+        benchmark.extra_info[f"{name} peak MB/MB"] = peaks[name] / 2 ** 20 / megabytes
+    benchmark.pedantic(count_terms, args=(text,), rounds=1, iterations=1)
+    assert peaks["count_terms"] < peaks["Counter(tokenize)"]
@@ -0,0 +1,61 @@
+import os
+import time
+import pytest
+from backend.walker import walk_files
+from backend.indexer import index_path
+
+def _make_tree(root, folders=20, files=25):
+    for i in range(folders):
+        folder = root / f"dir{i}" / "sub"
+        folder.mkdir(parents=True)
+        for j in range(files):
+            (folder / f"file{j}.txt").write_text("x", encoding="utf-8")
+    (root / "top.txt").write_text("x", encoding="utf-8")
+
+def _os_walk(root, is_recursive):
+    found = set()
+    for folder, dirs, file_names in os.walk(root):
+        found.update(os.path.join(folder, name) for name in file_names)
+        if not is_recursive:
+            dirs.clear()
+    return found
+
+def test_walk_matches_os_walk_serial_and_parallel(tmp_path):
+    _make_tree(tmp_path)
+    for is_recursive in (True, False):
+        expected = _os_walk(str(tmp_path), is_recursive)
+        assert {entry.path for entry in walk_files(str(tmp_path), is_recursive)} == expected
+        assert {entry.path for entry in walk_files(str(tmp_path), is_recursive, workers=4)} == expected
+
+def test_ignore_patterns_skip_files_and_folders(tmp_path):
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "config.txt").write_text("x", encoding="utf-8")
+    (tmp_path / "~$report.docx").write_text("x", encoding="utf-8")
+    (tmp_path / "report.docx").write_text("x", encoding="utf-8")
+
+    names = [entry.name for entry in walk_files(str(tmp_path), True, ignore=[".*", "~$*"])]
+
+    assert names == ["report.docx"]
+
+def test_missing_folder_yields_nothing(tmp_path):
+    assert not list(walk_files(str(tmp_path / "missing"), True))
+
+def test_index_path_streams_walk_into_indexer(tmp_path, db_path, settings):
+    corpus = tmp_path / "corpus"
+    _make_tree(corpus, folders=3, files=4)
+    settings({"index_workers": 1, "walk_workers": 2, "ignore_patterns": ["top.txt"]})
+
+    assert index_path(str(corpus), True, False) == 12
+    assert all("★" in name for name in os.listdir(corpus / "dir0" / "sub"))
+    assert index_path(str(corpus), True, False) == 0
+
+@pytest.mark.bench
+def test_benchmark_walk_against_os_walk(tmp_path, benchmark):
+    _make_tree(tmp_path, folders=40, files=50)
+    start = time.perf_counter()
+    expected = _os_walk(str(tmp_path), True)
+    benchmark.extra_info["os_walk_ms"] = (time.perf_counter() - start) * 1000
+
+    found = benchmark.pedantic(lambda: sum(1 for _entry in walk_files(str(tmp_path), True)),
+                               rounds=1, iterations=1)
+    assert found == len(expected)
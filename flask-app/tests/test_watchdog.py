@@ -0,0 +1,63 @@
+import time
+import backend.watchdog as watchdog
+from backend.connection import write_connection
+from backend.indexer import index_path
+
+SETTINGS = {"index_workers": 1, "watchdog_pause": 0}
+
+def _wait_until_idle(scheduler, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = scheduler.status()
+        if status["state"] == "idle" and status["last_run"] and not status["queued"]:
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"watchdog still busy: {scheduler.status()}")
+
+def test_scheduler_reindexes_stale_files_in_background(tmp_path, monkeypatch, db_path, settings):
+    folder = tmp_path / "corpus"
+    folder.mkdir()
+    for i in range(25):
+        (folder / f"note{i}.txt").write_text(f"Notiz {i} über Chemie", encoding="utf-8")
+    settings(SETTINGS)
+    monkeypatch.setattr(watchdog, "WATCHDOG_PATH", str(tmp_path / "watchdog.txt"))
+    index_path(str(folder), False, False)
+    with write_connection() as conn:
+        conn.execute("UPDATE Document SET metadata = json_set(metadata, '$.last_indexed', '2000-01-01')")
+        conn.commit()
+    for path in sorted(folder.iterdir())[:10]:
+        path.write_text(path.read_text(encoding="utf-8") + " und Physik", encoding="utf-8")
+
+    scheduler = watchdog.WatchdogScheduler(interval=3600)
+    scheduler.start()
+    try:
+        status = _wait_until_idle(scheduler)
+    finally:
+        scheduler.stop()
+        scheduler.join(5)
+
+    assert status["files_total"] == status["files_done"] == 25
+    assert status["reindexed"] == 10 and status["error"] is None
+    assert scheduler.status()["state"] == "stopped"
+
+def test_scan_indexes_new_files_in_paused_batches(tmp_path, monkeypatch, db_path, settings):
+    folder = tmp_path / "corpus"
+    folder.mkdir()
+    for i in range(25):
+        (folder / f"note{i}.txt").write_text(f"Notiz {i}", encoding="utf-8")
+    (tmp_path / "watchdog.txt").write_text(str(folder), encoding="utf-8")
+    settings({**SETTINGS, "watchdog_pause": 0.5})
+    monkeypatch.setattr(watchdog, "WATCHDOG_PATH", str(tmp_path / "watchdog.txt"))
+    batches, pauses = [], []
+
+    def index_files(file_paths, is_replace_full):
+        batches.append(len(file_paths))
+        return original(file_paths, is_replace_full)
+
+    original = watchdog.index_files
+    monkeypatch.setattr(watchdog, "index_files", index_files)
+    monkeypatch.setattr(watchdog.time, "sleep", pauses.append)
+
+    assert watchdog._check_watchdog_list() == 25
+    assert batches == [10, 10, 5]
+    assert pauses == [0.5, 0.5]
@@ -0,0 +1,83 @@
+import os
+import time
+import random
+import pytest
+from backend.connection import read_connection, write_connection
+from backend.database import fetch_doc_postings_for_token_id, fetch_doc_postings_for_token_ids
+from backend.terms import TERM_DICTIONARY
+from backend.tokenizer import tokenize_query
+
+BENCH_TERMS = int(os.getenv("HIRMES_BENCH_FILES", "300")) * 100
+
+def test_query_tokens():
+    assert tokenize_query("Polymer* AND polym?r OR * OR (x*)") == [
+        "polymer*", "AND", "polym?r", "OR", "OR", "(", "x*", ")"]
+
+def test_question_mark_at_word_boundary_is_punctuation():
+    assert tokenize_query("Chemie? AND ?Polymer AND polym?r? AND poly*?") == [
+        "chemie", "AND", "polymer", "AND", "polym?r", "AND", "poly*"]
+
+def test_prefix_and_wildcard_search(tmp_path, db_path, settings, index_texts, result_names):
+    settings({"index_workers": 1})
+    index_texts(tmp_path / "first", {"a": "Polymer und Polymere", "b": "Polyester Chemie",
+                                     "c": "Pollen Chemie"})
+
+    assert result_names("polymer*") == ["a"]
+    assert result_names("poly*") == ["a", "b"]
+    assert result_names("pol* AND NOT chemie") == ["a"]
+    assert result_names("polym?r") == ["a"]
+    assert result_names("*ester") == ["b"]
+    assert result_names("Chemie?") == ["b", "c"]
+    assert result_names("quant*") == []
+
+    index_texts(tmp_path / "second", {"d": "Polymerchemie"})
+    assert result_names("polymer*") == ["a", "d"]
+    assert [term for term, _token_id in TERM_DICTIONARY.expand(read_connection(), "pol*")] == [
+        "pollen", "polyester", "polymer", "polymerchemie", "polymere"]
+
+def test_expansion_limit_and_union(tmp_path, db_path, settings, index_texts):
+    settings({"index_workers": 1, "wildcard_limit": 2})
+    index_texts(tmp_path / "corpus", {"a": "Polymer Polymer Polyester", "b": "Polymer Polyamid",
+                                      "c": "Polyurethan"})
+    conn = read_connection()
+
+    expansions = TERM_DICTIONARY.expand(conn, "poly*")
+    assert [term for term, _token_id in expansions] == ["polyamid", "polyester"]
+    assert TERM_DICTIONARY.stats()["truncated"] >= 1
+
+    expansions = TERM_DICTIONARY.expand(conn, "poly*", limit=10)
+    separate = {}
+    for _term, token_id in expansions:
+        for doc_id, page, tf in fetch_doc_postings_for_token_id(conn, token_id):
+            separate[doc_id, page] = separate.get((doc_id, page), 0) + tf
+    united = fetch_doc_postings_for_token_ids(conn, [token_id for _term, token_id in expansions])
+    assert united == [(doc_id, page, tf) for (doc_id, page), tf in sorted(separate.items())]
+
+@pytest.mark.bench
+def test_benchmark_prefix_against_like_scan(tmp_path, db_path, settings, benchmark):
+    rng = random.Random(5)
+    syllables = ["po", "ly", "mer", "che", "mie", "ka", "ta", "ly", "se", "ter"]
+    tokens = {"".join(rng.choice(syllables) for _ in range(rng.randint(2, 5)))
+              for _ in range(BENCH_TERMS)}
+    with write_connection() as conn:
+        conn.executemany("INSERT INTO Token(token_text) VALUES (?)", ((token,) for token in tokens))
+        conn.executemany("INSERT INTO Posting(token_id, doc_id, pages, tf) VALUES (?, ?, ?, ?)",
+                         ((token_id, token_id % 97 + 1, b"\x01\x01", 1)
+                          for token_id in range(1, len(tokens) + 1)))
+        conn.commit()
+    conn = read_connection()
+    TERM_DICTIONARY.expand(conn, "a*")
+
+    start = time.perf_counter()
+    like_rows = []
+    for (token_id,) in conn.execute("SELECT token_id FROM Token WHERE token_text LIKE 'polyme%'"):
+        like_rows += fetch_doc_postings_for_token_id(conn, token_id)
+    benchmark.extra_info["terms"] = len(tokens)
+    benchmark.extra_info["like_scan_ms"] = (time.perf_counter() - start) * 1000
+
+    def expand():
+        token_ids = [token_id for _term, token_id in TERM_DICTIONARY.expand(conn, "polyme*", 10**6)]
+        return fetch_doc_postings_for_token_ids(conn, token_ids)
+
+    rows = benchmark.pedantic(expand, rounds=1, iterations=1)
+    assert sum(tf for _doc_id, _page, tf in rows) == len(like_rows)
@@ -0,0 +1,114 @@
+import time
+import random
+import pytest
+from backend.database import bulk_upsert_postings, create_posting_stage, merge_posting_stage
+from backend.packing import unpack_pages
+from backend.writer import PostingWriter
+from backend.token_cache import TokenCache
+
+def _pages(doc_count=200, page_count=3, vocabulary=5000, seed=7):
+    rng = random.Random(seed)
+    words = [f"wort{i}" for i in range(vocabulary)]
+    for doc_id in range(1, doc_count + 1):
+        for page in range(1, page_count + 1):
+            yield doc_id, page, [(word, rng.randint(1, 9)) for word in rng.sample(words, 300)]
+
+def _dump(conn):
+    rows = conn.execute("""
+        SELECT t.token_text, p.doc_id, p.pages
+        FROM Posting p JOIN Token t ON t.token_id = p.token_id
+    """)
+    return sorted((token, doc_id, page, tf)
+                  for token, doc_id, pages in rows
+                  for page, tf in unpack_pages(pages))
+
+def test_writer_matches_per_page_upserts(fresh_db):
+    expected, actual = fresh_db(), fresh_db()
+    writer = PostingWriter(actual, batch_size=5000, token_cache=TokenCache())
+    for doc_id, page, pairs in _pages(doc_count=20):
+        bulk_upsert_postings(expected, pairs, doc_id, page)
+        writer.add(doc_id, page, pairs)
+    writer.flush()
+
+    assert _dump(actual) == _dump(expected)
+    assert writer.stats()["flushes"] > 1
+
+def test_writer_merges_pages_and_upserts_existing_docs(fresh_db):
+    conn = fresh_db()
+    writer = PostingWriter(conn, token_cache=TokenCache())
+    writer.add(1, 1, [("chemie", 2)])
+    writer.add(1, 1, [("chemie", 1), ("physik", 1)])
+    writer.flush()
+    writer.add(1, 1, [("chemie", 4)], is_fresh=False)
+    writer.flush()
+
+    assert _dump(conn) == [("chemie", 1, 1, 7), ("physik", 1, 1, 1)]
+
+def test_delete_doc_drops_buffered_and_stored_postings(fresh_db):
+    conn = fresh_db()
+    writer = PostingWriter(conn, token_cache=TokenCache())
+    writer.add(1, 1, [("chemie", 2)])
+    writer.flush()
+    writer.add(1, 2, [("physik", 1)])
+    writer.delete_doc(1)
+    writer.add(1, 1, [("wasser", 3)])
+    writer.flush()
+
+    assert _dump(conn) == [("wasser", 1, 1, 3)]
+
+def test_delete_doc_drops_staged_postings(fresh_db):
+    conn = fresh_db()
+    create_posting_stage(conn)
+    writer = PostingWriter(conn, token_cache=TokenCache(), is_staging=True)
+    writer.add(1, 1, [("chemie", 2, [0, 5])])
+    writer.add(2, 1, [("physik", 1, [3])])
+    writer.flush()
+    writer.delete_doc(1)
+    writer.add(1, 1, [("wasser", 3, [1, 2, 4])])
+    writer.flush()
+    merge_posting_stage(conn)
+
+    assert _dump(conn) == [("physik", 2, 1, 1), ("wasser", 1, 1, 3)]
+    assert conn.execute("SELECT doc_id, COUNT(*) FROM Position GROUP BY doc_id").fetchall() == [
+        (1, 1), (2, 1)]
+
+@pytest.mark.bench
+def test_benchmark_writer_against_per_page_upserts(benchmark, fresh_db):
+    pages = list(_pages())
+    postings = sum(len(pairs) for _doc_id, _page, pairs in pages)
+
+    conn = fresh_db()
+    start = time.perf_counter()
+    token_cache = {}
+    for doc_id, page, pairs in pages:
+        bulk_upsert_postings(conn, pairs, doc_id, page, _token_cache=token_cache)
+    conn.commit()
+    benchmark.extra_info["upserts_per_second"] = postings / (time.perf_counter() - start)
+
+    conn = fresh_db()
+    writer = PostingWriter(conn, token_cache=TokenCache())
+
+    def write():
+        for doc_id, page, pairs in pages:
+            writer.add(doc_id, page, pairs)
+        writer.flush()
+        conn.commit()
+
+    benchmark.pedantic(write, rounds=1, iterations=1)
+    benchmark.extra_info["writer_postings_per_second"] = writer.stats()["postings_per_second"]
+    assert writer.stats()["postings"] == postings
+    assert conn.execute("SELECT SUM(tf) FROM Posting").fetchone()[0] == sum(
+        tf for _doc_id, _page, pairs in pages for _token, tf in pairs)
+
+def test_fresh_document_split_by_a_flush(fresh_db):
+    conn = fresh_db()
+    writer = PostingWriter(conn, batch_size=2, token_cache=TokenCache())
+    writer.add(1, 1, [("chemie", 2), ("physik", 1)])
+    writer.add(1, 2, [("chemie", 1), ("physik", 3)])
+    writer.add(2, 1, [("chemie", 5)])
+    writer.flush()
+
+    assert _dump(conn) == [
+        ("chemie", 1, 1, 2), ("chemie", 1, 2, 1), ("chemie", 2, 1, 5),
+        ("physik", 1, 1, 1), ("physik", 1, 2, 3),
+    ]